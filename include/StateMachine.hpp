@@ -25,10 +25,12 @@
 #ifndef STATE_MACHINE_HPP
 #  define STATE_MACHINE_HPP
 
-#  include <map>
-#  include <queue>
+#  if !defined(FSM_EMBEDDED)
+#    include <map>
+#    include <stdlib.h>
+#  endif
+#  include <iterator>
 #  include <cassert>
-#  include <stdlib.h>
 
 //-----------------------------------------------------------------------------
 //! \brief Verbosity activated in debug mode.
@@ -39,7 +41,24 @@
 #  else
 #    define LOGD(...)
 #  endif
-#  define LOGE printf
+#  if defined(FSM_EMBEDDED)
+#    define LOGE(...)
+#  else
+#    define LOGE printf
+#  endif
+
+//-----------------------------------------------------------------------------
+//! \brief Called on the faults of the state machine (forbidden event, unknown
+//! state, infinite loop). The process exits, except with the embedded profile
+//! (FSM_EMBEDDED) calling the function fsm_fault() implemented by the user
+//! (safe mode, reset of the board ...): the faulty event is then dropped.
+//-----------------------------------------------------------------------------
+#  if defined(FSM_EMBEDDED)
+void fsm_fault(const char* reason);
+#    define FSM_FAULT(reason) fsm_fault(reason)
+#  else
+#    define FSM_FAULT(reason) ::exit(EXIT_FAILURE)
+#  endif
 
 //-----------------------------------------------------------------------------
 //! \brief Return the given state as raw string (they shall not be free).
@@ -125,10 +144,28 @@ const char* stringify(STATES_ID const state);
 //!
 //! Transition, like states, can do reaction and have guards as pointer
 //! functions.
+//!
+//! The guards are called once, when the event method selects the transition to
+//! follow. For an event called by an action, the guard is therefore called
+//! before the entering action of the destination state of the current
+//! transition, not when the queued transition is fired.
+//!
+//! Transitions triggered while reacting to an event (transitions without event
+//! and events called by actions) are queued in a ring buffer of NESTING
+//! entries: no dynamic memory is used. The translator sets NESTING to 1 (the
+//! transition being fired) plus the largest number of transitions without event
+//! queued by the internal method of a state plus the number of events called by
+//! actions. Overflowing it is considered as an infinite loop and aborts. Loops
+//! of transitions without event are reported by the translator: at runtime, a
+//! loop queuing one transition by state spins forever, while a loop through a
+//! state queuing several transitions (non determinist) fills the queue and
+//! aborts.
 // *****************************************************************************
-template<typename FSM, class STATES_ID>
+template<typename FSM, class STATES_ID, size_t NESTING = 16u>
 class StateMachine
 {
+    static_assert(NESTING >= 1u, "The queue of transitions needs one entry");
+
 public:
 
     //! \brief Pointer method with no argument and returning a boolean.
@@ -176,9 +213,17 @@ public:
     //! \brief Define the type of container holding all stated of the state
     //! machine.
     using States = State[int(STATES_ID::MAX_STATES)];
+#if !defined(FSM_EMBEDDED)
     //! \brief Define the type of container holding states transitions. Since
     //! a state machine is generally a sparse matrix we use red-back tree.
-    using Transitions = std::map<STATES_ID, Transition>;
+    //! Several transitions can leave the same state on the same event: their
+    //! guards select the one to follow.
+    using Transitions = std::multimap<STATES_ID, Transition>;
+#endif
+    //! \brief Define the type of table holding a transition for each state. It
+    //! is faster than the red-black tree (no lookup) when most of the states
+    //! react to the event. States not reacting to it hold IGNORING_EVENT.
+    using DenseTransitions = Transition[int(STATES_ID::MAX_STATES)];
 
     //--------------------------------------------------------------------------
     //! \brief Default constructor. Pass the number of states the FSM will use,
@@ -199,8 +244,7 @@ public:
     {
         LOGD("[STATE MACHINE] Restart the state machine\n");
         m_current_state = m_initial_state;
-        std::queue<Transition const*> empty;
-        std::swap(m_nesting, empty);
+        m_nesting_head = m_nesting_size = 0u;
         m_enabled = true;
     }
 
@@ -237,6 +281,7 @@ public:
         return m_enabled ? stringify(m_current_state) : "--";
     }
 
+#if !defined(FSM_EMBEDDED)
     //--------------------------------------------------------------------------
     //! \brief Internal transition: jump to the desired state from internal
     //! event. This will call the guard, leaving actions, entering actions ...
@@ -247,17 +292,62 @@ public:
         if (!m_enabled)
             return ;
 
-        auto const& it = transitions.find(m_current_state);
-        if (it != transitions.end())
-        {
-            transition(&it->second);
-        }
-        else
+        auto const range = transitions.equal_range(m_current_state);
+        auto it = range.first;
+        if (it == range.second)
         {
             LOGD("[STATE MACHINE] Ignoring external event\n");
             //LOGE("[STATE MACHINE] Unknow transition. Aborting!\n");
             //::exit(EXIT_FAILURE);
+            return ;
+        }
+
+        // Follow the first transition allowed by its guard. Its guard is not
+        // called again when firing it.
+        while ((it != range.second) && !allowed(&it->second))
+        {
+            ++it;
+        }
+        if (it == range.second)
+        {
+            LOGD("[STATE MACHINE] Transitions refused by their guards\n");
+            return ;
+        }
+        fire(&it->second);
+    }
+#endif
+
+    //--------------------------------------------------------------------------
+    //! \brief Internal transition: jump to the desired state from internal
+    //! event. Used by the dense tables and the switch on the current state.
+    //! \param[in] transitions the transitions leaving the current state.
+    //! \param[in] count the number of transitions (0 for ignoring the event).
+    //--------------------------------------------------------------------------
+    inline void transition(Transition const* transitions, size_t const count)
+    {
+        if (!m_enabled)
+            return ;
+
+        if ((count == 0u) || (transitions->destination == STATES_ID::IGNORING_EVENT))
+        {
+            LOGD("[STATE MACHINE] Ignoring external event\n");
+            return ;
+        }
+
+        // Follow the first transition allowed by its guard. Its guard is not
+        // called again when firing it.
+        Transition const* it = transitions;
+        Transition const* last = transitions + count;
+        while ((it != last) && !allowed(it))
+        {
+            ++it;
         }
+        if (it == last)
+        {
+            LOGD("[STATE MACHINE] Transitions refused by their guards\n");
+            return ;
+        }
+        fire(it);
     }
 
 protected:
@@ -265,14 +355,65 @@ protected:
     //--------------------------------------------------------------------------
     //! \brief Internal transition: jump to the desired state from internal
     //! event. This will call the guard, leaving actions, entering actions ...
-    //! \param[in] transitions the table of transitions.
+    //! \param[in] transition the transition to follow if its guard allows it.
+    //--------------------------------------------------------------------------
+    inline void transition(Transition const* transition)
+    {
+        if (allowed(transition))
+        {
+            fire(transition);
+        }
+    }
+
+    //--------------------------------------------------------------------------
+    //! \brief Call the guard of the transition leaving the current state.
+    //! \return true if the transition has no guard or if its guard allows it.
+    //--------------------------------------------------------------------------
+    inline bool allowed(Transition const* transition)
+    {
+        if (transition->guard == nullptr)
+            return true;
+
+        LOGD("[STATE MACHINE] Call the guard %s -> %s\n",
+             stringify(m_current_state), stringify(transition->destination));
+        if ((static_cast<FSM*>(this)->*transition->guard)())
+            return true;
+
+        LOGD("[STATE MACHINE] Transition refused by the %s guard. Stay"
+             " in state %s\n", stringify(transition->destination),
+             stringify(m_current_state));
+        return false;
+    }
+
     //--------------------------------------------------------------------------
-    void transition(Transition const* transition);
+    //! \brief Follow a transition already allowed by its guard: call the
+    //! leaving actions, the action of the transition, the entering actions ...
+    //! \param[in] transition the transition to follow.
+    //--------------------------------------------------------------------------
+    void fire(Transition const* transition);
+
+protected:
+
+    //--------------------------------------------------------------------------
+    //! \brief Return the table of states: filled by the constructor of the
+    //! derived class, or in read-only memory with the embedded profile (static
+    //! method table_of_states() of the derived class).
+    //--------------------------------------------------------------------------
+    inline State const* states() const
+    {
+#if defined(FSM_EMBEDDED)
+        return FSM::table_of_states();
+#else
+        return m_states;
+#endif
+    }
 
 protected:
 
+#if !defined(FSM_EMBEDDED)
     //! \brief Container of states.
     States m_states;
+#endif
 
     //! \brief Current active state.
     STATES_ID m_current_state;
@@ -281,17 +422,21 @@ private:
 
     //! \brief Save the initial state need for restoring initial state.
     STATES_ID m_initial_state;
-    //! \brief Temporary variable saving the nesting state (needed for internal
+    //! \brief Ring buffer saving the nesting state (needed for internal
     //! event).
-    std::queue<Transition const*> m_nesting;
+    Transition const* m_nesting[NESTING];
+    //! \brief Index of the oldest transition of the ring buffer.
+    size_t m_nesting_head = 0u;
+    //! \brief Number of transitions in the ring buffer.
+    size_t m_nesting_size = 0u;
     //! \brief Enable / disable state machine (TBD: usable for nesting state
     //! machine (that is not generated as flat state machine)).
     bool m_enabled = false;
 };
 
 //------------------------------------------------------------------------------
-template<class FSM, class STATES_ID>
-void StateMachine<FSM, STATES_ID>::transition(Transition const* tr)
+template<class FSM, class STATES_ID, size_t NESTING>
+void StateMachine<FSM, STATES_ID, NESTING>::fire(Transition const* tr)
 {
 #if defined(THREAD_SAFETY)
     // If try_lock failed it is not important: it just means that we have called
@@ -303,72 +448,60 @@ void StateMachine<FSM, STATES_ID>::transition(Transition const* tr)
     // Reaction from internal event (therefore coming from this method called by
     // one of the action functions: memorize and leave the function: it will
     // continue thank to the while loop. This avoids recursion.
-    if (m_nesting.size())
+    if (m_nesting_size)
     {
         LOGD("[STATE MACHINE] Internal event. Memorize state %s\n",
              stringify(tr->destination));
-        m_nesting.push(tr);
-        if (m_nesting.size() >= 16u)
+        if (m_nesting_size >= NESTING)
         {
             LOGE("[STATE MACHINE] Infinite loop detected. Abort!\n");
-            ::exit(EXIT_FAILURE);
+            FSM_FAULT("Infinite loop detected");
+            return ;
         }
+        m_nesting[(m_nesting_head + m_nesting_size) % NESTING] = tr;
+        ++m_nesting_size;
         return ;
     }
 
-    m_nesting.push(tr);
+    m_nesting[m_nesting_head] = tr;
+    m_nesting_size = 1u;
     Transition const* transition;
     do
     {
         // Consum the current state
-        transition = m_nesting.front();
+        transition = m_nesting[m_nesting_head];
 
         LOGD("[STATE MACHINE] React to event from state %s\n",
              stringify(m_current_state));
 
-        // Forbidden event: kill the system
+        // Forbidden event: kill the system and drop the queued transitions
         if (transition->destination == STATES_ID::CANNOT_HAPPEN)
         {
             LOGE("[STATE MACHINE] Forbidden event. Aborting!\n");
-            ::exit(EXIT_FAILURE);
+            FSM_FAULT("Forbidden event");
+            break;
         }
 
         // Do not react to this event
         else if (transition->destination == STATES_ID::IGNORING_EVENT)
         {
             LOGD("[STATE MACHINE] Ignoring external event\n");
-            return ;
         }
 
-        // Unknown state: kill the system
+        // Unknown state: kill the system and drop the queued transitions
         else if (transition->destination >= STATES_ID::MAX_STATES)
         {
             LOGE("[STATE MACHINE] Unknown state. Aborting!\n");
-            ::exit(EXIT_FAILURE);
+            FSM_FAULT("Unknown state");
+            break;
         }
 
-        // Reaction: call the member function associated to the current state
-        StateMachine<FSM, STATES_ID>::State const& cst = m_states[int(m_current_state)];
-        StateMachine<FSM, STATES_ID>::State const& nst = m_states[int(transition->destination)];
-
-        // Call the guard
-        bool guard_res = (transition->guard == nullptr);
-        if (!guard_res)
-        {
-            LOGD("[STATE MACHINE] Call the guard %s -> %s\n",
-                 stringify(m_current_state), stringify(transition->destination));
-            guard_res = (static_cast<FSM*>(this)->*transition->guard)();
-        }
-
-        if (!guard_res)
-        {
-            LOGD("[STATE MACHINE] Transition refused by the %s guard. Stay"
-                 " in state %s\n", stringify(transition->destination),
-                 stringify(m_current_state));
-        }
         else
         {
-            // The guard allowed the transition to the next state
+            // Reaction: call the member function associated to the current state
+            StateMachine<FSM, STATES_ID, NESTING>::State const& cst = states()[int(m_current_state)];
+            StateMachine<FSM, STATES_ID, NESTING>::State const& nst = states()[int(transition->destination)];
+
             LOGD("[STATE MACHINE] Transitioning to new state %s\n",
                  stringify(transition->destination));
 
@@ -422,9 +555,14 @@ void StateMachine<FSM, STATES_ID>::transition(Transition const* tr)
             }
         }
 
-        m_nesting.pop();
-    } while (!m_nesting.empty());
+        m_nesting_head = (m_nesting_head + 1u) % NESTING;
+        --m_nesting_size;
+    } while (m_nesting_size != 0u);
 
+    // Single exit of the reaction: empty the queue (also when a fault dropped
+    // the queued transitions) and release the mutex.
+    m_nesting_head = 0u;
+    m_nesting_size = 0u;
 #if defined(THREAD_SAFETY)
     m_mutex.unlock();
 #endif
@@ -22,14 +22,97 @@
 ## equivalent.
 ###############################################################################
 
-from pathlib import Path
 from collections import defaultdict
-from collections import deque
-from datetime import date
-from lark import Lark, Transformer
+from array import array
+from types import MappingProxyType
 
-import sys, os, re, itertools
-import networkx as nx
+import sys, os, io, re, glob, json, shutil, hashlib, tempfile, itertools, operator, importlib.util, argparse, contextlib
+import concurrent.futures
+from statecharts_client import default_socket
+
+###############################################################################
+### Name of the standalone parser module generated from the grammar file.
+###############################################################################
+STANDALONE_PARSER = 'statecharts_parser.py'
+
+###############################################################################
+### Default maximal number of cycles enumerated by state machine.
+###############################################################################
+MAX_CYCLES = 1000
+
+###############################################################################
+### Maximal number of combinations of values evaluated by the guard solver
+### before trying z3 (when installed).
+###############################################################################
+MAX_GUARD_CASES = 1 << 16
+
+###############################################################################
+### Declaration of an integer member variable in the '[code] lines (for
+### example "int m_speed = 0;" or "uint8_t count;"), used by the guard solver.
+###############################################################################
+INTEGER_DECLARATION = re.compile(r'\b(?:(?:unsigned|signed|short|long)\s+)*'
+                                 r'(?:int|long|short|char|unsigned|size_t|u?int(?:8|16|32|64)_t)'
+                                 r'\s+([A-Za-z_]\w*)\s*(?=[=;{,\[])')
+
+###############################################################################
+### Number of bits of the tables of configurations visited by the model checker
+### (128 MB). Larger spaces of configurations are hash-compacted.
+###############################################################################
+MAX_VISITED_BITS = 1 << 30
+
+###############################################################################
+### Orthogonal regions whose product of numbers of states is greater than this
+### value are generated as state machines dispatched in sequence instead of a
+### product state machine (see Parser.compose_regions()).
+###############################################################################
+MAX_PRODUCT_STATES = 64
+
+###############################################################################
+### Event methods whose states reacting to the event are at least this ratio
+### of the states (each one having a single transition) look up their
+### transition in a dense table indexed by the current state. Sparser events
+### switch on the current state (see Parser.dispatch_strategy()).
+###############################################################################
+DENSE_TABLE_DENSITY = 0.5
+
+###############################################################################
+### Seconds the daemon waits for the request of a client before answering an
+### error: a client which does not send its request does not block the others.
+###############################################################################
+DAEMON_TIMEOUT = 5.0
+
+###############################################################################
+### Options of the command line refused by the daemon: a request would start
+### another daemon on the socket, never be answered (watch mode) and block the
+### other clients, or write the standalone parser in the folder of the client.
+###############################################################################
+DAEMON_REFUSED_OPTIONS = ['--daemon', '--watch', '--period', '--standalone']
+
+###############################################################################
+### Write a generated file if and only if its content has changed. Keeping the
+### modification time of unchanged files avoids build systems recompiling what
+### depends on them. The file is written in a temporary file then renamed to
+### never leave a partially written file.
+### param[in] path the path of the generated file.
+### param[in] content the content of the file.
+### return True if the file has been written.
+###############################################################################
+def write_if_changed(path, content):
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    tmp = path + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return True
 
 ###############################################################################
 ### Console color for print.
@@ -58,6 +141,8 @@ class bcolors:
 ###    foo bar(x, y)
 ###############################################################################
 class Event(object):
+    __slots__ = ('name', 'params')
+
     def __init__(self):
         # Name of the event (C++ function name without its parameters).
         self.name = ''
@@ -142,6 +227,9 @@ class Event(object):
 ###    source -> destination : event [ guard ] / action
 ###############################################################################
 class Transition(object):
+    __slots__ = ('origin', 'destination', 'event', 'guard', 'action',
+                 'count_guard', 'count_action', 'arrow')
+
     def __init__(self):
         # Source state (upper case).
         self.origin = ''
@@ -193,6 +281,9 @@ class Transition(object):
 ### Note that 'on event' will be converted to an edge instead of a graph node.
 ###############################################################################
 class State(object):
+    __slots__ = ('name', 'comment', 'entering', 'leaving', 'activity', 'internal',
+                 'count_entering', 'count_leaving')
+
     def __init__(self, name):
         # PlantUML name (raw name + upper case, i.e. '[*]' or 'STATE1').
         # The C++ name for [*] shall be converted.
@@ -252,6 +343,1159 @@ class ExtraCode(object):
         self.code = ''
         # Code to be placed inside the mock class for unit tests.
         self.unit_tests = ''
+        # Bounded variables explored by the model checker (see ModelChecker)
+        # as tuples (type, name, minimum, maximum, initial value).
+        self.variables = []
+
+###############################################################################
+### Directed multigraph holding the states (nodes) and the transitions (edges)
+### of a state machine: several transitions can link the same two states (for
+### example several events, or several "on event" lines on the same state).
+### State names are interned into integer ids (in their order of insertion) and
+### transitions are stored in arrays of state ids. Adjacency is stored in the
+### Compressed Sparse Row format (CSR): the transitions leaving the state i are
+### the ones at indexes out_edges[out_offsets[i]:out_offsets[i+1]] (same for
+### entering transitions with in_offsets and in_edges). CSR arrays are built on
+### demand after the graph has been modified.
+### States and transitions are iterated in their insertion order (transitions
+### are grouped by origin state).
+###############################################################################
+class Graph(object):
+    def __init__(self):
+        # Dictionary "state name => state id".
+        self.ids = dict()
+        # State names and State instances indexed by state ids.
+        self.names = []
+        self.states = []
+        # Transitions in their insertion order and the ids of their states.
+        self.transitions = []
+        self.origins = array('i')
+        self.destinations = array('i')
+        # Dictionary "(origin id, destination id) => transitions".
+        self.pairs = defaultdict(list)
+        # Dictionary "(origin id, event name) => transitions".
+        self.events = defaultdict(list)
+        # CSR adjacency (None when the graph has been modified).
+        self.out_offsets = None
+        self.out_edges = None
+        self.in_offsets = None
+        self.in_edges = None
+
+    ###########################################################################
+    ### Add a state if it does not belong to the graph.
+    ### param[in] name the name of the state.
+    ### return the id of the state.
+    ###########################################################################
+    def add_state(self, name):
+        id = self.ids.get(name)
+        if id == None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.states.append(State(name))
+            self.out_offsets = None
+        return id
+
+    ###########################################################################
+    ### Add a transition between its origin and destination states (parallel
+    ### transitions are kept). Missing states are added.
+    ###########################################################################
+    def add_transition(self, tr):
+        origin, destination = self.add_state(tr.origin), self.add_state(tr.destination)
+        self.pairs[(origin, destination)].append(tr)
+        self.events[(origin, tr.event.name)].append(tr)
+        self.transitions.append(tr)
+        self.origins.append(origin)
+        self.destinations.append(destination)
+        self.out_offsets = None
+
+    def has_state(self, name):
+        return name in self.ids
+
+    def has_transition(self, origin, destination):
+        return len(self.transitions_between(origin, destination)) != 0
+
+    def state(self, name):
+        return self.states[self.ids[name]]
+
+    ###########################################################################
+    ### Return the list of transitions from the origin to the destination state.
+    ###########################################################################
+    def transitions_between(self, origin, destination):
+        return self.pairs.get((self.ids.get(origin), self.ids.get(destination)), [])
+
+    ###########################################################################
+    ### Return the first transition from the origin to the destination state
+    ### (used for paths of states given by graph theory algorithms).
+    ###########################################################################
+    def transition(self, origin, destination):
+        return self.pairs[(self.ids[origin], self.ids[destination])][0]
+
+    ###########################################################################
+    ### Return the list of transitions leaving the origin state on the given
+    ### event ('' for transitions without event).
+    ###########################################################################
+    def transitions_on(self, origin, event):
+        return self.events.get((self.ids[origin], event), [])
+
+    ###########################################################################
+    ### Build the CSR arrays with a counting sort of transitions by origin
+    ### (and by destination) which preserves their insertion order.
+    ###########################################################################
+    def compile(self):
+        if self.out_offsets != None:
+            return
+        self.out_offsets, self.out_edges = self.csr(self.origins)
+        self.in_offsets, self.in_edges = self.csr(self.destinations)
+
+    def csr(self, keys):
+        offsets = array('i', bytes(4 * (len(self.names) + 1)))
+        for k in keys:
+            offsets[k + 1] += 1
+        for i in range(len(self.names)):
+            offsets[i + 1] += offsets[i]
+        edges = array('i', bytes(4 * len(keys)))
+        position = offsets[:-1]
+        for e, k in enumerate(keys):
+            edges[position[k]] = e
+            position[k] += 1
+        return offsets, edges
+
+    ###########################################################################
+    ### Return the list of transitions leaving (or entering) the given state.
+    ###########################################################################
+    def out_transitions(self, name):
+        self.compile()
+        id = self.ids[name]
+        return [self.transitions[e] for e in self.out_edges[self.out_offsets[id]:self.out_offsets[id + 1]]]
+
+    def in_transitions(self, name):
+        self.compile()
+        id = self.ids[name]
+        return [self.transitions[e] for e in self.in_edges[self.in_offsets[id]:self.in_offsets[id + 1]]]
+
+    ###########################################################################
+    ### Return the names of the destination states of transitions leaving the
+    ### given state (successors) or the names of origin states of transitions
+    ### entering the given state (predecessors).
+    ###########################################################################
+    def successors(self, name):
+        self.compile()
+        id = self.ids[name]
+        return [self.names[self.destinations[e]] for e in self.out_edges[self.out_offsets[id]:self.out_offsets[id + 1]]]
+
+    def predecessors(self, name):
+        self.compile()
+        id = self.ids[name]
+        return [self.names[self.origins[e]] for e in self.in_edges[self.in_offsets[id]:self.in_offsets[id + 1]]]
+
+    def out_degree(self, name):
+        self.compile()
+        id = self.ids[name]
+        return self.out_offsets[id + 1] - self.out_offsets[id]
+
+    def in_degree(self, name):
+        self.compile()
+        id = self.ids[name]
+        return self.in_offsets[id + 1] - self.in_offsets[id]
+
+    ###########################################################################
+    ### Return the list of transitions grouped by origin state.
+    ###########################################################################
+    def sorted_transitions(self):
+        self.compile()
+        return [self.transitions[e] for e in self.out_edges]
+
+    ###########################################################################
+    ### Return the list of edges as tuples (origin, destination) grouped by
+    ### origin state.
+    ###########################################################################
+    @property
+    def edges(self):
+        self.compile()
+        return [(self.names[self.origins[e]], self.names[self.destinations[e]]) for e in self.out_edges]
+
+###############################################################################
+### Read-only index of the facts about a state machine graph needed by the
+### verification and the generation stages. It is computed once, after the
+### PlantUML file has been parsed (the graph is no longer modified), instead of
+### being recomputed by each stage. Lists are tuples and dictionaries are
+### read-only views.
+###############################################################################
+class GraphIndex(object):
+    def __init__(self, graph):
+        graph.compile()
+        names = graph.names
+        out = [graph.out_transitions(name) for name in names]
+        # Transitions grouped by origin state (order of generated code).
+        self.transitions = tuple(graph.sorted_transitions())
+        # Dictionary "state => transitions leaving the state".
+        self.out = MappingProxyType({ name: tuple(trs) for name, trs in zip(names, out) })
+        # Dictionary "state => destination states" (without duplicates).
+        self.successors = MappingProxyType({ name: tuple(dict.fromkeys(tr.destination for tr in trs))
+                                             for name, trs in zip(names, out) })
+        # Dictionary "state => origin states" (without duplicates).
+        self.predecessors = MappingProxyType({ name: tuple(dict.fromkeys(graph.predecessors(name)))
+                                               for name in names })
+        # Dictionary "state => event name => transitions leaving the state".
+        events = { name: defaultdict(list) for name in names }
+        for tr in self.transitions:
+            events[tr.origin][tr.event.name].append(tr)
+        self.events = MappingProxyType({ name: MappingProxyType({ e: tuple(trs) for e, trs in d.items() })
+                                         for name, d in events.items() })
+        # Dictionary "state => transitions without event leaving the state" for
+        # states having such transitions only.
+        self.noevents = MappingProxyType({ name: d[''] for name, d in self.events.items() if '' in d })
+        # Dictionary "state => guards of the transitions leaving the state".
+        self.guards = MappingProxyType({ name: tuple(tr.guard for tr in trs if tr.guard != '')
+                                         for name, trs in self.out.items() })
+        # States without entering transitions (sources) and without leaving
+        # transitions (sinks).
+        self.sources = tuple(name for name in names if graph.in_degree(name) == 0)
+        self.sinks = tuple(name for name in names if graph.out_degree(name) == 0)
+        # Strongly connected components (tuples of states) and dictionary
+        # "state => id of its component".
+        successors = [[graph.destinations[e] for e in graph.out_edges[graph.out_offsets[i]:graph.out_offsets[i + 1]]]
+                      for i in range(len(names))]
+        self.components = tuple(tuple(names[i] for i in c) for c in self.tarjan(successors))
+        self.scc = MappingProxyType({ name: i for i, c in enumerate(self.components) for name in c })
+        # Infinite loops: one cycle (first state repeated at the end) by
+        # strongly connected component of the transitions without event.
+        successors = [[graph.destinations[e] for e in graph.out_edges[graph.out_offsets[i]:graph.out_offsets[i + 1]]
+                       if graph.transitions[e].event.name == ''] for i in range(len(names))]
+        components = self.tarjan(successors)
+        self.infinite_loops = tuple(tuple(names[i] for i in self.cycle_in(sorted(c), successors))
+                                    for c in components
+                                    if len(c) > 1 or c[0] in successors[c[0]])
+
+    ###########################################################################
+    ### Return the strongly connected components (lists of state ids) with the
+    ### Tarjan algorithm in O(V+E). The recursion is replaced by a stack to
+    ### support large state machines.
+    ### param[in] successors: the list of the successor ids of each state id.
+    ###########################################################################
+    def tarjan(self, successors):
+        count = len(successors)
+        order, low = [-1] * count, [0] * count
+        on_stack, stack, components, counter = [False] * count, [], [], 0
+        for root in range(count):
+            if order[root] != -1:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            calls = [(root, iter(successors[root]))]
+            while calls:
+                node, neighbors = calls[-1]
+                for n in neighbors:
+                    if order[n] == -1:
+                        order[n] = low[n] = counter
+                        counter += 1
+                        stack.append(n)
+                        on_stack[n] = True
+                        calls.append((n, iter(successors[n])))
+                        break
+                    elif on_stack[n]:
+                        low[node] = min(low[node], order[n])
+                else:
+                    calls.pop()
+                    if calls:
+                        parent = calls[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == order[node]:
+                        component = []
+                        while True:
+                            n = stack.pop()
+                            on_stack[n] = False
+                            component.append(n)
+                            if n == node:
+                                break
+                        components.append(component)
+        return components
+
+    ###########################################################################
+    ### Return the shortest cycle (list of state ids ending by the first one)
+    ### from the first state of a cyclic strongly connected component (BFS on
+    ### the component).
+    ### param[in] component: the state ids of the component.
+    ### param[in] successors: the list of the successor ids of each state id.
+    ###########################################################################
+    def cycle_in(self, component, successors):
+        first, members = component[0], set(component)
+        parents, queue = { first: None }, [first]
+        for id in queue:
+            for n in successors[id]:
+                if n == first:
+                    cycle = [first]
+                    while id != None:
+                        cycle.append(id)
+                        id = parents[id]
+                    return cycle[::-1]
+                if n in members and n not in parents:
+                    parents[n] = id
+                    queue.append(n)
+
+    ###########################################################################
+    ### Return True if the graph has cycles (a component of several states or a
+    ### transition looping on its state).
+    ###########################################################################
+    def has_cycles(self):
+        return any(len(c) > 1 or c[0] in self.successors[c[0]] for c in self.components)
+
+    ###########################################################################
+    ### Return the states reachable from the given state (BFS in O(V+E)), or
+    ### the states from which the given state is reachable when backward.
+    ### return the dictionary "reached state => None" (in BFS order).
+    ###########################################################################
+    def reachable(self, name, backward=False):
+        neighbors = self.predecessors if backward else self.successors
+        reached, queue = { name: None }, [name]
+        for name in queue:
+            for n in neighbors[name]:
+                if n not in reached:
+                    reached[n] = None
+                    queue.append(n)
+        return reached
+
+    ###########################################################################
+    ### Return True if the strongly connected component holds cycles.
+    ###########################################################################
+    def is_cyclic(self, component):
+        return len(component) > 1 or component[0] in self.successors[component[0]]
+
+    ###########################################################################
+    ### Generate the elementary cycles (lists of states, without repeating the
+    ### first state) of the given strongly connected component. A cycle is
+    ### generated once, starting from its first state in the component order:
+    ### the cycles starting from a state only visit the states placed after it
+    ### in the component and that can go back to the first state within the
+    ### maximal length. Dead ends are not explored again thanks to the locks
+    ### of the bounded cycle search of Gupta and Suzumura (a state is locked to
+    ### the length of the path which visited it without finding a cycle). This
+    ### is the length bounded variant of the Johnson algorithm: the time spent
+    ### between two cycles is linear in the size of the component.
+    ### param[in] component: a strongly connected component (see components).
+    ### param[in] max_length: the maximal number of states of the cycles (0 for
+    ### no limit).
+    ###########################################################################
+    def simple_cycles(self, component, max_length=0):
+        if not self.is_cyclic(component):
+            return
+        order = { name: i for i, name in enumerate(component) }
+        bound = len(component) if max_length <= 0 else min(max_length, len(component))
+        for first in component:
+            # Distances to the first state through the allowed states: other
+            # states cannot be part of a cycle.
+            rank, distances, queue = order[first], { first: 0 }, [first]
+            for name in queue:
+                for n in self.predecessors[name]:
+                    if n not in distances and order.get(n, -1) > rank:
+                        distances[n] = distances[name] + 1
+                        queue.append(n)
+            successors = { name: [n for n in self.successors[name] if n in distances]
+                           for name in distances }
+            path, lock, blocked = [first], { first: 0 }, defaultdict(set)
+            stack, lengths = [iter(successors[first])], [bound]
+            while stack:
+                for n in stack[-1]:
+                    if n == first:
+                        yield list(path)
+                        lengths[-1] = 1
+                    elif len(path) < lock.get(n, bound) and len(path) + distances[n] <= bound:
+                        stack.append(iter(successors[n]))
+                        lengths.append(bound)
+                        lock[n] = len(path)
+                        path.append(n)
+                        break
+                else:
+                    stack.pop()
+                    name, length = path.pop(), lengths.pop()
+                    if lengths:
+                        lengths[-1] = min(lengths[-1], length)
+                    if length < bound:
+                        # A cycle has been found from this state: unlock it and
+                        # the states blocked by it.
+                        relax = [(length, name)]
+                        while relax:
+                            length, name = relax.pop()
+                            if lock.get(name, bound) < bound - length + 1:
+                                lock[name] = bound - length + 1
+                                relax.extend((length + 1, n) for n in blocked[name].difference(path))
+                    else:
+                        for n in successors[name]:
+                            blocked[n].add(name)
+
+###############################################################################
+### Parse a guard when it is a simple C++ boolean expression: comparisons of a
+### variable (or of a function call) with a number or with a scoped constant
+### (like an enum value Foo::Bar) and boolean variables, combined by the !,
+### &&, || operators and parentheses. Expressions are
+### stored as tuples:
+###   ('or', [expr...]), ('and', [expr...]), ('not', expr), ('bool', value),
+###   ('atom', name) and ('cmp', operator, variable, constant)
+### where the constant is a number (int or float) or a scoped name (str).
+### Any other C++ expression (arithmetic, comparison of two variables, boolean
+### functions ...) raises ValueError: the guard is not analyzed.
+###############################################################################
+class GuardParser(object):
+    TOKEN = re.compile(r'\s*(\d+\.\d*|\.\d+|\d+)[uUlLfF]*|\s*(&&|\|\||==|!=|<=|>=|<|>|!|\(|\)|-)'
+                       r'|\s*([A-Za-z_]\w*(?:\s*(?:::|\.|->)\s*[A-Za-z_]\w*)*)')
+    FLIP = { '==': '==', '!=': '!=', '<': '>', '>': '<', '<=': '>=', '>=': '<=' }
+
+    def __init__(self, code):
+        self.code = code
+        self.position = 0
+
+    ###########################################################################
+    ### Return the expression of the guard.
+    ###########################################################################
+    def parse(self):
+        expr = self.parse_or()
+        if self.code[self.position:].strip() != '':
+            raise ValueError('unexpected ' + self.code[self.position:])
+        return expr
+
+    ###########################################################################
+    ### Return the next token as the tuple (kind, text) where kind is 'number',
+    ### 'operator', 'name' or None at the end of the guard. The token is
+    ### consumed if and only if consume is True. Function calls are names
+    ### holding their arguments.
+    ###########################################################################
+    def token(self, consume=True):
+        match = self.TOKEN.match(self.code, self.position)
+        if match == None:
+            if self.code[self.position:].strip() != '':
+                raise ValueError('unexpected ' + self.code[self.position:])
+            return (None, '')
+        kind = ['number', 'operator', 'name'][match.lastindex - 1]
+        text, end = match.group(match.lastindex), match.end()
+        if kind == 'name':
+            # Function call: keep the arguments
+            call = re.match(r'\s*\(', self.code[end:])
+            if call != None:
+                depth, end = 0, end + call.end() - 1
+                for end in range(end, len(self.code)):
+                    depth += { '(': 1, ')': -1 }.get(self.code[end], 0)
+                    if depth == 0:
+                        break
+                if depth != 0:
+                    raise ValueError('missing )')
+                end += 1
+                text = re.sub(r'\s+', '', self.code[match.start(3):end])
+            else:
+                text = re.sub(r'\s+', '', text)
+        if consume:
+            self.position = end
+        return (kind, text)
+
+    def accept(self, operator):
+        if self.token(False) == ('operator', operator):
+            self.token()
+            return True
+        return False
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.accept('||'):
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else ('or', terms)
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.accept('&&'):
+            terms.append(self.parse_not())
+        return terms[0] if len(terms) == 1 else ('and', terms)
+
+    def parse_not(self):
+        if self.accept('!'):
+            return ('not', self.parse_not())
+        if self.accept('('):
+            expr = self.parse_or()
+            if not self.accept(')'):
+                raise ValueError('missing )')
+            return expr
+        lhs = self.parse_value()
+        kind, op = self.token(False)
+        if kind == 'operator' and op in self.FLIP:
+            self.token()
+            rhs = self.parse_value()
+            if lhs[0] == 'variable' and rhs[0] == 'constant':
+                return self.comparison(op, lhs[1], rhs[1])
+            if lhs[0] == 'constant' and rhs[0] == 'variable':
+                return self.comparison(self.FLIP[op], rhs[1], lhs[1])
+            raise ValueError('unsupported comparison')
+        if lhs[0] == 'variable':
+            # The result of a boolean function is unknown (it may depend on
+            # other guards, have side effects ...)
+            if '(' in lhs[1]:
+                raise ValueError('unsupported boolean function ' + lhs[1])
+            return ('atom', lhs[1])
+        if lhs[1] in ['true', 'false']:
+            return ('bool', lhs[1] == 'true')
+        raise ValueError('unsupported operand ' + str(lhs[1]))
+
+    def comparison(self, op, variable, constant):
+        if isinstance(constant, str) and op not in ['==', '!=']:
+            raise ValueError('unsupported comparison of ' + constant)
+        return ('cmp', op, variable, constant)
+
+    ###########################################################################
+    ### Return ('constant', value) for numbers, booleans and scoped names, else
+    ### ('variable', name).
+    ###########################################################################
+    def parse_value(self):
+        negative = self.accept('-')
+        kind, text = self.token()
+        if kind == 'number':
+            value = float(text) if any(c in text for c in '.') else int(text)
+            return ('constant', -value if negative else value)
+        if kind != 'name' or negative:
+            raise ValueError('unexpected ' + text)
+        if text in ['true', 'false'] or ('::' in text and '(' not in text):
+            return ('constant', text)
+        return ('variable', text)
+
+###############################################################################
+### Prove the mutual exclusion and the exhaustiveness of a set of guards (the
+### ones of transitions leaving the same state on the same event).
+### The local solver evaluates the guards on all combinations of values which
+### change their results: for each variable, its constants, the values around
+### them (the integers before and after them for the variables known to be
+### integers, else the middle of two constants) and a value different from all
+### scoped names; true and false for boolean atoms. This is exact for
+### comparisons with constants. When there are too many combinations, z3 is
+### used if installed.
+###############################################################################
+class GuardSolver(object):
+    COMPARE = { '==': operator.eq, '!=': operator.ne, '<': operator.lt,
+                '>': operator.gt, '<=': operator.le, '>=': operator.ge }
+
+    def __init__(self, guards, integers=()):
+        # Guard expressions (see GuardParser), True for empty guards.
+        self.exprs = [GuardParser(g).parse() if g.strip() != '' else ('bool', True) for g in guards]
+        # Names of the variables whose type is an integer (see
+        # StateMachine.integer_variables()). The type of other variables is
+        # unknown: they may be floating point values.
+        self.integers = set(integers)
+        # Dictionary "variable => constants compared to it".
+        self.variables = defaultdict(set)
+        # Boolean variables and functions.
+        self.atoms = dict()
+        for expr in self.exprs:
+            self.collect(expr)
+        for name, constants in self.variables.items():
+            if len(set(isinstance(c, str) for c in constants)) > 1:
+                raise ValueError('variable ' + name + ' compared to numbers and names')
+
+    def collect(self, expr):
+        if expr[0] in ['or', 'and']:
+            for e in expr[1]:
+                self.collect(e)
+        elif expr[0] == 'not':
+            self.collect(expr[1])
+        elif expr[0] == 'atom':
+            self.atoms[expr[1]] = None
+        elif expr[0] == 'cmp':
+            self.variables[expr[2]].add(expr[3])
+
+    def evaluate(self, expr, values):
+        if expr[0] == 'or':
+            return any(self.evaluate(e, values) for e in expr[1])
+        if expr[0] == 'and':
+            return all(self.evaluate(e, values) for e in expr[1])
+        if expr[0] == 'not':
+            return not self.evaluate(expr[1], values)
+        if expr[0] == 'bool':
+            return expr[1]
+        if expr[0] == 'atom':
+            return values[expr[1]]
+        return self.COMPARE[expr[1]](values[expr[2]], expr[3])
+
+    ###########################################################################
+    ### Return the values of a variable changing the results of comparisons.
+    ###########################################################################
+    def domain(self, name, constants):
+        constants = sorted(constants)
+        if isinstance(constants[0], str):
+            return constants + [None]
+        if name in self.integers and all(isinstance(c, int) for c in constants):
+            return sorted(set(c + d for c in constants for d in [-1, 0, 1]))
+        middles = [(a + b) / 2 for a, b in zip(constants, constants[1:])]
+        return [constants[0] - 1] + constants + middles + [constants[-1] + 1]
+
+    ###########################################################################
+    ### return the tuple (list of pairs of indexes of guards which can be true
+    ### at the same time, True if at least a guard is always true), or None if
+    ### the guards cannot be analyzed.
+    ###########################################################################
+    def solve(self):
+        names = list(self.variables) + list(self.atoms)
+        domains = [self.domain(n, self.variables[n]) for n in self.variables] + [[False, True]] * len(self.atoms)
+        cases = 1
+        for d in domains:
+            cases *= len(d)
+        if cases > MAX_GUARD_CASES:
+            return self.solve_with_z3()
+        overlaps, exhaustive = set(), True
+        for combination in itertools.product(*domains):
+            values = dict(zip(names, combination))
+            holding = [i for i, e in enumerate(self.exprs) if self.evaluate(e, values)]
+            overlaps.update(itertools.combinations(holding, 2))
+            exhaustive = exhaustive and len(holding) != 0
+        return sorted(overlaps), exhaustive
+
+    ###########################################################################
+    ### Same than solve() with the z3 theorem prover (optional dependency).
+    ###########################################################################
+    def solve_with_z3(self):
+        try:
+            import z3
+        except ImportError:
+            return None
+        symbols, values = dict(), dict()
+        for name, constants in self.variables.items():
+            if isinstance(next(iter(constants)), str):
+                values[name] = z3.Int(name)
+                for c in sorted(constants):
+                    symbols.setdefault(c, len(symbols))
+            elif name in self.integers and all(isinstance(c, int) for c in constants):
+                values[name] = z3.Int(name)
+            else:
+                values[name] = z3.Real(name)
+        for name in self.atoms:
+            values[name] = z3.Bool(name)
+        def convert(expr):
+            if expr[0] == 'or':
+                return z3.Or(*[convert(e) for e in expr[1]])
+            if expr[0] == 'and':
+                return z3.And(*[convert(e) for e in expr[1]])
+            if expr[0] == 'not':
+                return z3.Not(convert(expr[1]))
+            if expr[0] == 'bool':
+                return z3.BoolVal(expr[1])
+            if expr[0] == 'atom':
+                return values[expr[1]]
+            return self.COMPARE[expr[1]](values[expr[2]], symbols.get(expr[3], expr[3]))
+        exprs = [convert(e) for e in self.exprs]
+        def satisfiable(expr):
+            solver = z3.Solver()
+            solver.add(expr)
+            return solver.check() == z3.sat
+        overlaps = [(i, j) for i, j in itertools.combinations(range(len(exprs)), 2)
+                    if satisfiable(z3.And(exprs[i], exprs[j]))]
+        return overlaps, not satisfiable(z3.Not(z3.Or(*exprs)))
+
+###############################################################################
+### Results of the guard solver indexed by the SHA256 of the guards (and of
+### their integer variables). They are kept in memory (watch and daemon modes)
+### and in the cache folder with the SHA256 of the translator, so unchanged
+### guards are never solved again. The results of other translators are
+### dropped.
+###############################################################################
+guard_results = None
+guard_results_modified = False
+translator_digest = None
+
+###############################################################################
+### Return the folder caching the analyzed grammar and the results of the
+### guard solver, or None if it cannot be created.
+###############################################################################
+def cache_folder():
+    folder = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    folder = os.path.join(folder, 'statecharts')
+    try:
+        os.makedirs(folder, exist_ok=True)
+    except OSError:
+        return None
+    return folder
+
+###############################################################################
+### Solve a set of guards (see GuardSolver.solve()) or return the cached
+### result.
+### param[in] guards: the list of guards (C++ code).
+### param[in] integers: the names of the variables known to be integers.
+###############################################################################
+def solve_guards(guards, integers=()):
+    global guard_results, guard_results_modified, translator_digest
+    if translator_digest == None:
+        with open(os.path.abspath(__file__), 'rb') as f:
+            translator_digest = hashlib.sha256(f.read()).hexdigest()
+    if guard_results == None:
+        guard_results = dict()
+        folder = cache_folder()
+        if folder != None:
+            try:
+                with open(os.path.join(folder, 'guards.json')) as f:
+                    guard_results = stored_guard_results(json.load(f))
+            except (OSError, ValueError):
+                pass
+    integers = sorted(set(integers))
+    key = hashlib.sha256(repr((guards, integers)).encode('utf-8')).hexdigest()
+    if key not in guard_results:
+        try:
+            guard_results[key] = GuardSolver(guards, integers).solve()
+        except (ValueError, RecursionError):
+            guard_results[key] = None
+        guard_results_modified = True
+    if guard_results[key] == None:
+        return None
+    # JSON stores tuples as lists
+    overlaps, exhaustive = guard_results[key]
+    return [tuple(overlap) for overlap in overlaps], exhaustive
+
+###############################################################################
+### Return the results of the guard solver stored in the cache file by this
+### translator, or an empty dictionary if they come from another translator.
+###############################################################################
+def stored_guard_results(stored):
+    if not isinstance(stored, dict) or stored.get('translator') != translator_digest:
+        return dict()
+    return stored.get('guards', dict())
+
+###############################################################################
+### Store the results of the guard solver in the cache folder (merged with
+### the ones stored by other processes running the same translator).
+###############################################################################
+def save_guard_results():
+    global guard_results_modified
+    folder = cache_folder()
+    if not guard_results_modified or folder == None:
+        return
+    path = os.path.join(folder, 'guards.json')
+    results = dict()
+    try:
+        with open(path) as f:
+            results = stored_guard_results(json.load(f))
+    except (OSError, ValueError):
+        pass
+    results.update(guard_results)
+    write_if_changed(path, json.dumps({ 'translator': translator_digest, 'guards': results }))
+    guard_results_modified = False
+
+###############################################################################
+### Explicit-state model checker of a state machine: explore the product of
+### its states and the values of its bounded variables (declared by '[var]
+### lines, see Parser.parse_extra_code()) from the initial state and report
+### deadlocks (states whose guards are all false), reachable transitions to the
+### forbidden state CANNOT_HAPPEN, infinite loops of transitions without event,
+### variables leaving their range and divisions by zero.
+### Guards and actions are compiled from a subset of C: integers, booleans,
+### declared variables, arithmetic, comparison, logical and ternary operators,
+### assignments (=, +=, -=, *=, /=, %=) and increments (++, --). A guard using
+### something else may be true or false. A statement using something else may
+### modify the declared variables it uses: they can take any value of their
+### range. Event parameters named as a declared variable take any value. When
+### several transitions without event can be taken, each of them is explored.
+### A configuration (state and values) is encoded as an integer. Visited
+### configurations are stored as bits: one bit per configuration when they fit
+### in MAX_VISITED_BITS, else configurations are hash-compacted in the bits of
+### the table (two configurations may share a bit, so a few configurations may
+### not be explored: their estimated number is reported).
+###############################################################################
+class ModelChecker(object):
+    TOKEN = re.compile(r'\s*(?:(\d+)[uUlL]*|(\+\+|--|&&|\|\||[=!<>]=|[-+*/%]=|[-+*/%<>=!?:()])'
+                       r'|((?:this\s*->\s*)?[A-Za-z_]\w*))')
+    BINARY = { '||': 1, '&&': 2, '==': 3, '!=': 3, '<': 4, '<=': 4, '>': 4, '>=': 4,
+               '+': 5, '-': 5, '*': 6, '/': 6, '%': 6 }
+    # C integer division and modulo (truncated toward zero).
+    BUILTINS = { '__builtins__': {}, 'bool': bool, 'int': int, 'list': list,
+                 'div': lambda a, b: abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1),
+                 'mod': lambda a, b: a - b * (abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1)) }
+
+    def __init__(self, sm):
+        self.sm = sm
+        # Tuples (type, name, minimum, maximum, initial value).
+        self.variables = sm.extra_code.variables
+        # Dictionary "variable name => index in the tuple of values".
+        self.positions = { v[1]: i for i, v in enumerate(self.variables) }
+        # States and their index in configurations.
+        self.states = list(sm.graph.names)
+        self.ids = { name: i for i, name in enumerate(self.states) }
+        # Number of configurations (mixed radix encoding).
+        self.sizes = [v[3] - v[2] + 1 for v in self.variables]
+        self.space = len(self.states)
+        for size in self.sizes:
+            self.space *= size
+        # Dictionary "state => (transitions without event, transitions with
+        # event)" of compiled transitions (see compile_transition()). States
+        # without transition (final states) are not deadlocks.
+        self.transitions = dict()
+        for state, out in sm.index.out.items():
+            if len(out) == 0:
+                continue
+            compiled = [self.compile_transition(tr) for tr in out]
+            self.transitions[self.ids[state]] = (
+                [c for c, tr in zip(compiled, out) if tr.event.name == ''],
+                [c for c, tr in zip(compiled, out) if tr.event.name != ''])
+        # Reported errors: dictionary "(kind, key) => message".
+        self.errors = dict()
+
+    ###########################################################################
+    ### Return the list of tokens (kind, text) of C code, kind being 'number',
+    ### 'operator' or 'name'. Raise ValueError on other C code.
+    ###########################################################################
+    def tokenize(self, code):
+        tokens, position = [], 0
+        while code[position:].strip() != '':
+            match = self.TOKEN.match(code, position)
+            if match == None:
+                raise ValueError('unsupported ' + code[position:])
+            kind = ['number', 'operator', 'name'][match.lastindex - 1]
+            tokens.append((kind, re.sub(r'^this\s*->\s*', '', match.group(match.lastindex))))
+            position = match.end()
+        return tokens
+
+    def token(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, '')
+
+    def accept(self, operator):
+        if self.token() == ('operator', operator):
+            self.position += 1
+            return True
+        return False
+
+    ###########################################################################
+    ### Return the Python code of a C expression given as tokens.
+    ###########################################################################
+    def expression(self, tokens):
+        self.tokens, self.position = tokens, 0
+        code = self.parse_ternary()
+        if self.position != len(self.tokens):
+            raise ValueError('unexpected ' + self.token()[1])
+        return code
+
+    def parse_ternary(self):
+        condition = self.parse_binary(1)
+        if not self.accept('?'):
+            return condition
+        a = self.parse_ternary()
+        if not self.accept(':'):
+            raise ValueError('missing :')
+        return '(' + a + ' if ' + condition + ' else ' + self.parse_ternary() + ')'
+
+    def parse_binary(self, precedence):
+        lhs = self.parse_unary()
+        while True:
+            kind, op = self.token()
+            if kind != 'operator' or self.BINARY.get(op, 0) < precedence:
+                return lhs
+            self.position += 1
+            rhs = self.parse_binary(self.BINARY[op] + 1)
+            if op in ['&&', '||']:
+                lhs = '(bool(' + lhs + ') ' + ('and' if op == '&&' else 'or') + ' bool(' + rhs + '))'
+            elif op in ['/', '%']:
+                lhs = ('div(' if op == '/' else 'mod(') + lhs + ', ' + rhs + ')'
+            else:
+                lhs = '(' + lhs + ' ' + op + ' ' + rhs + ')'
+
+    def parse_unary(self):
+        if self.accept('!'):
+            return '(not ' + self.parse_unary() + ')'
+        if self.accept('-'):
+            return '(-' + self.parse_unary() + ')'
+        if self.accept('+'):
+            return self.parse_unary()
+        if self.accept('('):
+            code = self.parse_ternary()
+            if not self.accept(')'):
+                raise ValueError('missing )')
+            return code
+        kind, text = self.token()
+        self.position += 1
+        if kind == 'number':
+            return text
+        if text in ['true', 'false']:
+            return '1' if text == 'true' else '0'
+        if kind == 'name' and text in self.positions and self.token() != ('operator', '('):
+            return 'v[' + str(self.positions[text]) + ']'
+        raise ValueError('unsupported ' + text)
+
+    ###########################################################################
+    ### Return the guard as a Python function of the values, None for empty
+    ### guards or False when the guard is not supported.
+    ###########################################################################
+    def compile_guard(self, guard):
+        if guard.strip() == '':
+            return None
+        try:
+            return eval('lambda v: bool(' + self.expression(self.tokenize(guard)) + ')', self.BUILTINS)
+        except (ValueError, SyntaxError, RecursionError):
+            return False
+
+    ###########################################################################
+    ### Return the Python code of a C statement (assignment or increment of a
+    ### declared variable). Raise ValueError on other C code.
+    ###########################################################################
+    def statement(self, code):
+        tokens = self.tokenize(code)
+        # Increments: x++, ++x, x--, --x
+        for op in ['++', '--']:
+            if len(tokens) == 2 and ('operator', op) in tokens:
+                tokens.remove(('operator', op))
+                tokens += [('operator', op[0] + '='), ('number', '1')]
+        if len(tokens) < 3 or tokens[0][1] not in self.positions or \
+           tokens[1][1] not in ['=', '+=', '-=', '*=', '/=', '%=']:
+            raise ValueError('unsupported ' + code)
+        name, op = tokens[0][1], tokens[1][1]
+        value = tokens[2:]
+        if op != '=':
+            value = [tokens[0], ('operator', op[0]), ('operator', '(')] + value + [('operator', ')')]
+        value = self.expression(value)
+        if self.variables[self.positions[name]][0] == 'bool':
+            value = 'int(bool(' + value + '))'
+        return 'v[' + str(self.positions[name]) + '] = ' + value
+
+    ###########################################################################
+    ### Return the C code as a list of steps: lists of Python statements
+    ### modifying the values (list v), or tuples of indexes of variables taking
+    ### any value.
+    ###########################################################################
+    def compile_code(self, code):
+        # Remove comments and preprocessor lines
+        code = re.sub(r'//.*|/\*.*?\*/|^\s*#.*$', '', code, flags=re.MULTILINE | re.DOTALL)
+        steps, lines = [], []
+        for statement in re.split(r'[;\n]', code):
+            if statement.strip() == '':
+                continue
+            try:
+                lines.append(self.statement(statement))
+                continue
+            except (ValueError, RecursionError):
+                pass
+            havoc = tuple(self.positions[name] for name in re.findall(r'[A-Za-z_]\w*', statement)
+                          if name in self.positions)
+            if len(havoc) == 0:
+                continue
+            if len(lines) != 0:
+                steps.append(lines)
+                lines = []
+            steps.append(tuple(sorted(set(havoc))))
+        if len(lines) != 0:
+            steps.append(lines)
+        return steps
+
+    def function(self, code):
+        scope = dict(self.BUILTINS)
+        exec(code, scope)
+        return scope['step']
+
+    ###########################################################################
+    ### Return the transition as the tuple (transition, steps before the
+    ### guard, guard, steps after the guard, destination, fast path) where
+    ### steps are the ones of compile_code() (lists of statements compiled as
+    ### functions): the event parameters take any value, then the guard is
+    ### evaluated, then the leaving action of the origin state, the action of
+    ### the transition and the entering action of the destination state are
+    ### done (the state actions only when the state changes).
+    ### The fast path is None or, when no variable can take any value, a single
+    ### function of the values returning None if the guard is false, -1 if a
+    ### variable leaves its range, else the reached configuration.
+    ###########################################################################
+    def compile_transition(self, tr):
+        params = tuple(self.positions[p.strip()] for p in tr.event.params if p.strip() in self.positions)
+        code = tr.action
+        if tr.origin != tr.destination:
+            code = self.sm.graph.state(tr.origin).leaving + '\n' + code + '\n' + \
+                   self.sm.graph.state(tr.destination).entering
+        destination = self.ids[tr.destination] if tr.destination != 'CANNOT_HAPPEN' else None
+        guard, steps = self.compile_guard(tr.guard), self.compile_code(code)
+        after = [s if isinstance(s, tuple) else
+                 self.function('def step(v):\n    ' + '\n    '.join(s) + '\n') for s in steps]
+        fast = None
+        if len(params) == 0 and guard != False and destination != None and \
+           all(isinstance(s, list) for s in steps):
+            encode = str(destination)
+            for i, (v, size) in enumerate(zip(self.variables, self.sizes)):
+                encode = '(' + encode + ') * ' + str(size) + ' + v[' + str(i) + '] - ' + str(v[2])
+            ranges = ' and '.join(str(v[2]) + ' <= v[' + str(i) + '] <= ' + str(v[3])
+                                  for i, v in enumerate(self.variables)) or 'True'
+            lines = ['v = list(v)'] + [line for s in steps for line in s]
+            if guard != None:
+                lines.insert(0, 'if not (' + self.expression(self.tokenize(tr.guard)) + '): return None')
+            fast = self.function('def step(v):\n    ' + '\n    '.join(lines) +
+                                 '\n    if not (' + ranges + '): return -1\n    return ' + encode + '\n')
+        return (tr, [params] if len(params) != 0 else [], guard, after, destination, fast)
+
+    ###########################################################################
+    ### Return the list of values after doing the steps (list of tuples).
+    ###########################################################################
+    def run(self, steps, values):
+        results = [values]
+        for step in steps:
+            if isinstance(step, tuple):
+                for i in step:
+                    low = self.variables[i][2]
+                    results = [r[:i] + (x,) + r[i+1:] for r in results
+                               for x in range(low, low + self.sizes[i])]
+            else:
+                modified = []
+                for r in results:
+                    r = list(r)
+                    step(r)
+                    modified.append(tuple(r))
+                results = modified
+        return results
+
+    ###########################################################################
+    ### Encode a configuration (state id, tuple of values) as an integer.
+    ###########################################################################
+    def encode(self, state, values):
+        code = state
+        for value, variable, size in zip(values, self.variables, self.sizes):
+            code = code * size + value - variable[2]
+        return code
+
+    def decode(self, code):
+        values = []
+        for variable, size in zip(reversed(self.variables), reversed(self.sizes)):
+            code, value = divmod(code, size)
+            values.append(value + variable[2])
+        return code, tuple(reversed(values))
+
+    ###########################################################################
+    ### Return the text "when x = 1, y = true" describing the values.
+    ###########################################################################
+    def describe(self, values):
+        if len(values) == 0:
+            return ''
+        text = [v[1] + ' = ' + (str(x) if v[0] != 'bool' else ['false', 'true'][x])
+                for v, x in zip(self.variables, values)]
+        return ' when ' + ', '.join(text)
+
+    ###########################################################################
+    ### Return the text "transition from the state A to B on event e".
+    ###########################################################################
+    def describe_transition(self, tr):
+        return 'transition from the state ' + tr.origin + ' to ' + tr.destination + \
+               (' on event ' + tr.event.name if tr.event.name != '' else '')
+
+    ###########################################################################
+    ### Memorize an error (only the first one of each kind and key).
+    ###########################################################################
+    def error(self, kind, key, msg):
+        self.errors.setdefault((kind, key), msg)
+
+    ###########################################################################
+    ### Return the configurations reached by the transitions and True if one
+    ### of them can be taken (its guard is not always false).
+    ### param[in] transitions: the compiled transitions (compile_transition())
+    ### param[in] values: the values of the variables.
+    ###########################################################################
+    def fire(self, transitions, values):
+        reached, taken, certain = [], False, False
+        for tr, before, guard, after, destination, fast in transitions:
+            if fast != None:
+                try:
+                    code = fast(values)
+                except ZeroDivisionError:
+                    code = -1
+                if code == None:
+                    continue
+                taken = certain = True
+                if code >= 0:
+                    reached.append(code)
+                    continue
+                # Error: the slow path reports it
+            for current in self.run(before, values):
+                try:
+                    # Unsupported guards (False) may be true
+                    if guard != None and guard != False and not guard(current):
+                        continue
+                    taken = True
+                    certain = certain or guard != False
+                    if destination == None:
+                        self.error('forbidden', tr, 'The ' + self.describe_transition(tr) + ' can happen' +
+                                   self.describe(current))
+                        continue
+                    results = self.run(after, current)
+                except ZeroDivisionError:
+                    self.error('division', tr, 'Division by zero on the ' + self.describe_transition(tr) +
+                               self.describe(current))
+                    continue
+                for result in results:
+                    for i, v in enumerate(self.variables):
+                        if not v[2] <= result[i] <= v[3]:
+                            self.error('range', (tr, v[1]), 'The variable ' + v[1] + ' leaves its range ' +
+                                       str(v[2]) + '..' + str(v[3]) + ' on the ' + self.describe_transition(tr) +
+                                       self.describe(current))
+                            break
+                    else:
+                        reached.append(self.encode(destination, result))
+        return reached, taken, certain
+
+    ###########################################################################
+    ### Explore the configurations reachable from the initial state.
+    ### return the tuple (number of explored configurations, estimated number
+    ### of configurations missed by the hash compaction).
+    ###########################################################################
+    def check(self):
+        import time
+        if self.sm.initial_state not in self.ids:
+            return 0, 0
+        # Tables of bits: configurations explored and configurations queued
+        bits = min(self.space, MAX_VISITED_BITS // 2)
+        exact = bits == self.space
+        explored, queued = bytearray((bits + 7) // 8), bytearray((bits + 7) // 8)
+        slot = (lambda code: code) if exact else \
+               (lambda code: ((code % 0x1FFFFFFFFFFFFFFF) * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF) % bits)
+        initial = self.encode(self.ids[self.sm.initial_state], tuple(v[4] for v in self.variables))
+        worklist, count, report = [initial], 0, time.time() + 1
+        while len(worklist) != 0:
+            root = worklist.pop()
+            i = slot(root)
+            if explored[i >> 3] & (1 << (i & 7)):
+                continue
+            # Depth-first search on transitions without event: a configuration
+            # on the stack reached again is an infinite loop.
+            explored[i >> 3] |= 1 << (i & 7)
+            count += 1
+            stack, path = [(root, iter(self.expand(root, worklist, queued, slot)))], { root: 0 }
+            while len(stack) != 0:
+                for successor in stack[-1][1]:
+                    if successor in path:
+                        loop = [self.states[self.decode(c)[0]] for c, _ in stack[path[successor]:]]
+                        self.error('loop', frozenset(loop), 'The state machine has an infinite loop: ' +
+                                   ' '.join(loop + loop[:1]) + self.describe(self.decode(successor)[1]))
+                        continue
+                    i = slot(successor)
+                    if explored[i >> 3] & (1 << (i & 7)):
+                        continue
+                    explored[i >> 3] |= 1 << (i & 7)
+                    count += 1
+                    path[successor] = len(stack)
+                    stack.append((successor, iter(self.expand(successor, worklist, queued, slot))))
+                    break
+                else:
+                    del path[stack.pop()[0]]
+            if time.time() > report:
+                report = time.time() + 1
+                print('   State machine ' + self.sm.name + ': ' + str(count) + ' configurations checked')
+        return count, 0 if exact else count * count // bits
+
+    ###########################################################################
+    ### Explore a configuration: report a deadlock, queue the configurations
+    ### reached by events (when no transition without event is always taken).
+    ### return the configurations reached by transitions without event.
+    ###########################################################################
+    def expand(self, code, worklist, queued, slot):
+        state, values = self.decode(code)
+        if state not in self.transitions:
+            return []
+        noevents, events = self.transitions[state]
+        reached, taken, certain = self.fire(noevents, values)
+        if not certain:
+            successors, waiting, _ = self.fire(events, values)
+            taken = taken or waiting
+            for successor in successors:
+                i = slot(successor)
+                if not queued[i >> 3] & (1 << (i & 7)):
+                    queued[i >> 3] |= 1 << (i & 7)
+                    worklist.append(successor)
+        if not taken:
+            name = self.states[state]
+            self.error('deadlock', name, 'The state machine is stuck in the state ' + name +
+                       self.describe(values) + ': no transition can be taken')
+        return reached
 
 ###############################################################################
 ### Structure holding context of a state machine after having parsed a PlantUML
@@ -261,20 +1505,26 @@ class ExtraCode(object):
 class StateMachine(object):
     def __init__(self):
         # The state machine representation as graph structure.
-        # FIXME shall be nx.MultiDiGraph() since we cannot create several events
-        # leaving and entering to the same state or two events from a source
-        # state going to the same destination state.
-        self.graph = nx.DiGraph()
+        self.graph = Graph()
+        # Read-only index of the graph (GraphIndex) built after parsing.
+        self.index = None
+        # Cycles of the graph (see graph_cycles()) shared by the verification
+        # and the unit tests.
+        self.cycles = []
         # Know the parent state machine (needed for composite state).
         self.parent = None
         # Know the nested state machines (needed for composite state).
         self.children = []
+        # Name of the composite state of the parent state machine (upper case)
+        # holding this nested state machine. Orthogonal regions of a composite
+        # state are nested state machines of the same composite state.
+        self.composite = ''
         # Memorize the initial state of the state machine.
         self.initial_state = ''
         # Memorize the final state of the state machine.
         self.final_state = ''
-        # Dictionnary of "event => (source state, destination state)" needed for
-        # computing tables of state transitions for each events.
+        # Dictionnary of "event => transitions" needed for computing tables of
+        # state transitions for each events.
         self.lookup_events = defaultdict(list)
         # Broadcast external event to nested state machines (for composite
         # state only).
@@ -297,6 +1547,23 @@ class StateMachine(object):
     def __repr__(self):
         return self.name + ', I: ' + self.initial_state
 
+    ###########################################################################
+    ### Return a fingerprint of the parsed state machine: the SHA256 of what its
+    ### generated files depend on. Shall be called before manage_noevents().
+    ### param[in] files the names of the classes of the state machines generated
+    ### before this one (listed by the generated unit tests).
+    ###########################################################################
+    def signature(self, files):
+        sign = [self.class_name, self.initial_state, self.final_state, files,
+                vars(self.extra_code), [sm.name for sm in self.children],
+                [(name, e.name, e.params) for name, e in self.broadcasts]]
+        for state in self.graph.states:
+            sign.append([getattr(state, a) for a in State.__slots__])
+        for tr in self.index.transitions:
+            sign.append((tr.origin, tr.destination, tr.event.name, tr.event.params,
+                         tr.guard, tr.action))
+        return hashlib.sha256(repr(sign).encode('utf-8')).hexdigest()
+
     ###########################################################################
     ### TODO transition if composite() sinon transition dans la meme FSM
     ###########################################################################
@@ -304,68 +1571,180 @@ class StateMachine(object):
         return False
 
     ###########################################################################
-    ### Add a graph node with a dummy attribute named 'data' of type State.
-    ### The node is created if and only if it does not belong to the graph.
-    ### We have to call this function to be sure to create a 'data' attribute
-    ### to avoid checking its presence.
+    ### Add a graph node holding a State. The node is created if and only if it
+    ### does not belong to the graph.
     ### param[in] name the name of the state.
     ###########################################################################
     def add_state(self, name):
-        if not self.graph.has_node(name):
-            self.graph.add_node(name, data = State(name))
+        self.graph.add_state(name)
 
     ###########################################################################
-    ### Add a graph edge with the given attribute named 'data' of type Transition
+    ### Add a graph edge holding the given Transition.
     ### Note: the graph source node and the graph source destination shall have
     ### been inserted first.
     ### param[in] tr the state machine transition to add.
     ###########################################################################
     def add_transition(self, tr):
-        self.graph.add_edge(tr.origin, tr.destination, data=tr)
+        self.graph.add_transition(tr)
+
+    ###########################################################################
+    ### Build the read-only index of the graph once the state machine has been
+    ### parsed.
+    ###########################################################################
+    def build_index(self):
+        self.index = GraphIndex(self.graph)
 
     ###########################################################################
-    ### Return all cycles in the graph (list of list of nodes).
-    ### Cycles may not start from initial state, therefore do some permutation
-    ### are made to be sure to give a list starting with the initial state.
+    ### Return the cycles of the graph passing by a destination state of the
+    ### initial state (list of list of nodes). Cycles are enumerated within the
+    ### strongly connected components of these destination states only (no
+    ### cycle goes out of its component). Cycles start by the destination state
+    ### of the initial state and end by it again.
+    ### param[in] max_cycles: stop after this number of cycles (0 for no limit).
+    ### The enumeration is exponential on densely connected state machines.
+    ### param[in] max_length: ignore cycles having more states (0 for no limit).
     ### return list of list of nodes.
     ###########################################################################
-    def graph_cycles(self):
-        # Cycles may not start from initial state, therefore do some permutation
-        # to be sure to start by the initial state.
-        cycles = []
-        for cycle in list(nx.simple_cycles(self.graph)):
-            index = -1
-            # Initial state may have several transitions so search the first
-            for n in self.graph.neighbors(self.initial_state):
-                try:
-                    index = cycle.index(n)
-                    break
-                except Exception as ValueError:
-                    continue
-            if index != -1:
-                cycles.append(cycle[index:] + cycle[:index])
-                cycles[-1].append(cycles[-1][0])
+    def graph_cycles(self, max_cycles=0, max_length=0):
+        import time
+        starts = self.index.successors.get(self.initial_state, ())
+        components = [self.index.components[i] for i in
+                      dict.fromkeys(self.index.scc[n] for n in starts)]
+        cycles, count, report = [], 0, time.time() + 1
+        for i, component in enumerate(components):
+            for cycle in self.index.simple_cycles(component, max_length):
+                # Cycles may not start from initial state, therefore do some
+                # permutation to be sure to start by the initial state (which
+                # may have several transitions so search the first).
+                positions = { name: k for k, name in enumerate(cycle) }
+                index = next((positions[n] for n in starts if n in positions), -1)
+                if index != -1:
+                    cycles.append(cycle[index:] + cycle[:index])
+                    cycles[-1].append(cycles[-1][0])
+                count += 1
+                if time.time() > report:
+                    report = time.time() + 1
+                    print('   State machine ' + self.name + ': ' + str(count) + ' cycles found'
+                          + ' (component ' + str(i + 1) + '/' + str(len(components)) + ')')
+                if count == max_cycles:
+                    print(f"{bcolors.WARNING}   The enumeration of the cycles of the state machine "
+                          + self.name + ' stopped after ' + str(count) + ' cycles (see --max-cycles)'
+                          + f"{bcolors.ENDC}")
+                    return cycles
         return cycles
 
     ###########################################################################
-    ### Return the list of graph edges in a depth-first-search (DFS).
+    ### Return the transitions (the first ones in case of parallel transitions)
+    ### of a path given as a list of states.
+    ###########################################################################
+    def path_transitions(self, states):
+        return [self.graph.transition(states[i], states[i+1]) for i in range(len(states) - 1)]
+
     ###########################################################################
-    def graph_dfs(self):
-         return list(nx.dfs_edges(self.graph, source=self.initial_state))
+    ### Return test paths (lists of transitions) covering all the transitions
+    ### reachable from the initial state (from the sources for a state machine
+    ### without initial state) and, optionally, all the pairs of consecutive
+    ### transitions. Each path is a simple path of states possibly ended by a
+    ### transition going back to one of its states: a state is left once, so
+    ### the guards of the mocked state machine are not contradictory.
+    ### Greedy covering: a path goes to the nearest uncovered item (a
+    ### transition or a pair), found by a BFS from its last state through the
+    ### states it does not visit yet, until no uncovered item can be reached.
+    ### Transitions without event and guard are followed as soon as their state
+    ### is entered (like the state machine does). Each path covers at least an
+    ### item, items which cannot be covered by a path are dropped: the number
+    ### of paths is at most the number of transitions (or of pairs).
+    ### param[in] pairs: if True, also cover the pairs of consecutive
+    ### transitions.
+    ###########################################################################
+    def graph_test_paths(self, pairs=False):
+        starts = [self.initial_state] if self.initial_state in self.index.out else list(self.index.sources)
+        # Dictionary "origin state => uncovered items" where items are tuples
+        # of consecutive transitions.
+        uncovered = defaultdict(dict)
+        for tr in self.index.transitions:
+            uncovered[tr.origin][(tr,)] = None
+            if pairs:
+                for following in self.index.out[tr.destination]:
+                    uncovered[tr.origin][(tr, following)] = None
+        paths = []
+        for start in starts:
+            while True:
+                path, visited, state = [], { start }, start
+                while True:
+                    steps = self.nearest_uncovered(state, visited, uncovered)
+                    if steps == None:
+                        break
+                    # Transitions without event and guard are immediately followed
+                    while self.forced_transition(steps[-1].destination) != None and \
+                          steps[-1].destination not in visited and \
+                          steps[-1].destination not in [tr.destination for tr in steps[:-1]]:
+                        steps.append(self.forced_transition(steps[-1].destination))
+                    for tr in steps:
+                        if path != []:
+                            uncovered[path[-1].origin].pop((path[-1], tr), None)
+                        uncovered[tr.origin].pop((tr,), None)
+                        path.append(tr)
+                    if steps[-1].destination in visited or \
+                       steps[-1].destination in [tr.destination for tr in steps[:-1]]:
+                        break
+                    visited.update(tr.destination for tr in steps)
+                    state = steps[-1].destination
+                if path == []:
+                    break
+                paths.append(path)
+        return paths
 
     ###########################################################################
-    ### Return all paths from all sources to sinks (list of list of nodes).
-    ### This is a general algorithm even if a state machine starts from a single
-    ### entry node.
+    ### Return the first transition without event and without guard leaving
+    ### the given state (the state machine follows it as soon as it enters the
+    ### state) or None.
+    ###########################################################################
+    def forced_transition(self, name):
+        return next((tr for tr in self.index.noevents.get(name, ()) if tr.guard == ''), None)
+
     ###########################################################################
-    def graph_all_paths_to_sinks(self):
-         all_paths = []
-         sink_nodes = [node for node, outdegree in self.graph.out_degree(self.graph.nodes()) if outdegree == 0]
-         source_nodes = [node for node, indegree in self.graph.in_degree(self.graph.nodes()) if indegree == 0]
-         for (source, sink) in [(source, sink) for sink in sink_nodes for source in source_nodes]:
-             for path in nx.all_simple_paths(self.graph, source=source, target=sink):
-                all_paths.append(path)
-         return all_paths
+    ### Search, from the given state through non visited states, the nearest
+    ### uncovered item whose states (but the last one) are not visited. Items
+    ### going back to a visited state are only chosen when no other item can be
+    ### reached since they end the path.
+    ### return the list of transitions reaching and making the item, or None.
+    ###########################################################################
+    def nearest_uncovered(self, state, visited, uncovered):
+        parents, queue, ending = { state: None }, [state], None
+        for name in queue:
+            if len(uncovered[name]) != 0:
+                # States visited by the path to this state
+                prefix, tr = { name }, parents[name]
+                while tr != None:
+                    prefix.add(tr.origin)
+                    tr = parents[tr.origin]
+                for item in uncovered[name]:
+                    states = [tr.destination for tr in item]
+                    if any(n in visited or n in prefix for n in states[:-1]) or \
+                       len(set(states[:-1])) < len(states) - 1 or \
+                       any(self.forced_transition(tr.origin) not in [None, tr] for tr in item):
+                        continue
+                    if not any(states[-1] in s for s in [visited, prefix, states[:-1]]):
+                        return self.path_to(parents, name) + list(item)
+                    if ending == None:
+                        ending = self.path_to(parents, name) + list(item)
+            forced = self.forced_transition(name)
+            for tr in self.index.out[name] if forced == None else [forced]:
+                if tr.destination not in visited and tr.destination not in parents:
+                    parents[tr.destination] = tr
+                    queue.append(tr.destination)
+        return ending
+
+    ###########################################################################
+    ### Return the transitions of the BFS tree from its root to the given state.
+    ###########################################################################
+    def path_to(self, parents, name):
+        path = []
+        while parents[name] != None:
+            path.insert(0, parents[name])
+            name = parents[name].origin
+        return path
 
     ###########################################################################
     ### The main state machine shall have an initial state [*].
@@ -380,8 +1759,7 @@ class StateMachine(object):
             return
         # FIXME
         # Nested state machine. FIXME missing degree >= 1 mais dont la source != self
-        #source_nodes = [node for node, indegree in self.graph.in_degree(self.graph.nodes()) if indegree == 0]
-        #if source_nodes == []:
+        #if self.index.sources == ():
         #    self.warning('Missing initial state in the nested state machine')
 
     ###########################################################################
@@ -397,31 +1775,44 @@ class StateMachine(object):
     ### All states must have at least one incoming transition.
     ###########################################################################
     def verify_incoming_transitions(self):
-        for state in list(self.graph.nodes()):
-            if state != '[*]' and len(list(self.graph.predecessors(state))) == 0:
+        for state in self.index.sources:
+            if state != '[*]':
                 self.warning('The state ' + state + ' shall have at least one incoming transition')
 
+    ###########################################################################
+    ### Reachability from the initial state (one forward and one backward BFS):
+    ### report unreachable states (the ones without incoming transitions are
+    ### already reported), events never reacted since no reachable state has a
+    ### transition on them and, when the state machine has a final state,
+    ### reachable states from which the final state cannot be reached.
+    ###########################################################################
+    def verify_reachability(self):
+        if self.initial_state not in self.index.out:
+            return
+        reachable = self.index.reachable(self.initial_state)
+        for state in self.graph.names:
+            if state not in reachable and state not in self.index.sources:
+                self.warning('The state ' + state + ' is not reachable from the initial state')
+        reacted = set(tr.event.name for state in reachable for tr in self.index.out[state])
+        for event in self.lookup_events:
+            if event.name != '' and event.name not in reacted:
+                self.warning('The event ' + event.name + ' is never reacted: no reachable state has a transition on it')
+        if self.final_state not in self.index.out:
+            return
+        ending = self.index.reachable(self.final_state, True)
+        for state in reachable:
+            if state not in ending:
+                self.warning('The state ' + state + ' has no path to the final state')
+
     ###########################################################################
     ### Check if the state machine does not have infinite loops (meaning a
-    ### cycle in the graph where all transitions do not have events).
+    ### cycle in the graph where all transitions do not have events). One loop
+    ### is reported for each strongly connected component of the subgraph of
+    ### transitions without event (see GraphIndex.infinite_loops).
     ###########################################################################
     def verify_infinite_loops(self):
-        for cycle in self.graph_cycles():
-            find = True
-            # A cyle of size 1 means internal transition by an event.
-            if len(cycle) == 1:
-                find = False
-                continue
-            # Check if there is at least one event along the cycle path.
-            for i in range(len(cycle) - 1):
-                if self.graph[cycle[i]][cycle[i+1]]['data'].event.name != '':
-                    find = False
-                    break
-            # Add the warning in the generated code.
-            if find == True:
-                str = ' '.join(cycle) + ' '
-                self.warning('The state machine has an infinite loop: ' + str + '. Add an event!')
-                return
+        for loop in self.index.infinite_loops:
+            self.warning('The state machine has an infinite loop: ' + ' '.join(loop) + ' . Add an event!')
 
     ###########################################################################
     ### Verify for each state if transitions are determinist.
@@ -429,39 +1820,414 @@ class StateMachine(object):
     ###         does not have event and guard.
     ### Case 2: several transitions and guards does not check all cases (for
     ###         example the Richman case with init quarters < 0.
+    ###         For each state and event, the guards of its transitions shall
+    ###         be mutually exclusive and, for transitions without event, they
+    ###         shall cover all cases else the state machine is stuck (see
+    ###         GuardSolver). Guards which are not simple C++ expressions are
+    ###         not checked.
     ###########################################################################
     def verify_transitions(self):
         # Case 1
-        for state in list(self.graph.nodes()):
-            out = list(self.graph.neighbors(state))
+        for state, out in self.index.out.items():
             if len(out) <= 1:
                 continue
-            for d in out:
-                tr = self.graph[state][d]['data']
+            for tr in out:
                 if (tr.event.name == '') and (tr.guard == ''):
                     self.warning('The state ' + state + ' has an issue with its transitions: it has' +
-                                 ' several possible ways while the way to state ' + d +
+                                 ' several possible ways while the way to state ' + tr.destination +
                                  ' is always true and therefore will be always a candidate and transition' +
                                  ' to other states is non determinist.')
-        # Case 2: TODO
+        # Case 2
+        for state, events in self.index.events.items():
+            for event, out in events.items():
+                if len(out) <= 1 or (event == '' and any(tr.guard == '' for tr in out)):
+                    continue
+                result = solve_guards([tr.guard for tr in out], self.integer_variables())
+                if result == None:
+                    continue
+                overlaps, exhaustive = result
+                on = ' on event ' + event if event != '' else ' without event'
+                guard = lambda tr: '[' + tr.guard + ']' if tr.guard != '' else 'no guard'
+                for i, j in overlaps:
+                    self.warning('The guards ' + guard(out[i]) + ' and ' + guard(out[j]) + ' of' +
+                                 ' the transitions leaving the state ' + state + on +
+                                 ' can be true at the same time: the transition is non determinist.')
+                if event == '' and not exhaustive:
+                    self.warning('The guards of the transitions leaving the state ' + state + on +
+                                 ' do not cover all cases: the state machine can be stuck in this state.')
+
+    ###########################################################################
+    ### Return the names of the variables known to be integers: the bounded
+    ### variables ('[var] lines) and the integer member variables declared by
+    ### '[code] lines.
+    ###########################################################################
+    def integer_variables(self):
+        names = [v[1] for v in self.extra_code.variables if v[0] != 'bool']
+        names += INTEGER_DECLARATION.findall(self.extra_code.code)
+        return names
 
     ###########################################################################
     ### Entry point to check if the state machine is well formed (determinist).
     ### Do not exit the program or throw exception, just display warning on the
     ### console.
-    ### TODO for each node: are transitions to output neighbors mutually exclusive ?
-    ### TODO Are all states reachable ?
-    ### TODO how to parse guards to do formal prooves ? Can formal proove be
-    ### used in a networkx graph ?
     ###########################################################################
     def is_determinist(self):
         self.verify_initial_state()
         self.verify_number_of_events()
         self.verify_incoming_transitions()
+        self.verify_reachability()
         self.verify_transitions()
         self.verify_infinite_loops()
         pass
 
+    ###########################################################################
+    ### Explore the configurations (states and values of the variables declared
+    ### by '[var] lines) reachable from the initial state (see ModelChecker)
+    ### and report the errors found.
+    ###########################################################################
+    def verify_model(self):
+        import time
+        start = time.time()
+        checker = ModelChecker(self)
+        count, missed = checker.check()
+        duration = max(time.time() - start, 1e-6)
+        print('   Model checking of the state machine ' + self.name + ': ' + str(count) +
+              ' configurations in %.3f s (%d configurations/s)' % (duration, count / duration))
+        if missed != 0:
+            print('   Configurations are hash-compacted: about ' + str(missed) +
+                  ' configurations may not have been explored')
+        for msg in checker.errors.values():
+            self.warning(msg)
+
+    ###########################################################################
+    ### Minimize the state machine by merging its equivalent states: states
+    ### having the same entering, leaving and activity code and the same
+    ### transitions (event, guard, action) to equivalent states. Equivalent
+    ### states are found by partition refinement: states are first partitioned
+    ### by their code, then each block is split by the transitions of its states
+    ### until no block can be split. As in the Hopcroft algorithm, only the
+    ### blocks of the predecessors of split states are refined again, and the
+    ### largest part of a split block keeps its number (its predecessors do not
+    ### have to be refined). Pseudo states ([*], *, CANNOT_HAPPEN) and composite
+    ### states are never merged. States having entering or leaving code are not
+    ### merged when a transition links two of them (it would become a self
+    ### transition, which does not call this code). The first state of each
+    ### block is kept and the graph index is built again.
+    ### return the list of merged states (lists of names, the first one being
+    ### the kept state).
+    ###########################################################################
+    def minimize(self):
+        names, states, ids = self.graph.names, self.graph.states, self.graph.ids
+        pseudo = ['[*]', '*', 'CANNOT_HAPPEN', self.initial_state, self.final_state] + \
+                 [sm.name for sm in self.children]
+        keys, block = dict(), []
+        for state in states:
+            key = state.name if state.name in pseudo else (state.entering, state.leaving, state.activity)
+            block.append(keys.setdefault(key, len(keys)))
+        members = [set() for _ in keys]
+        for i, b in enumerate(block):
+            members[b].add(i)
+        out = [[(tr.event.name, tuple(tr.event.params), tr.guard, tr.action, ids[tr.destination])
+                for tr in self.index.out[name]] for name in names]
+        predecessors = [[ids[p] for p in self.index.predecessors.get(name, ())] for name in names]
+        sign = lambda i: frozenset((e, p, g, a, 'self' if d == i else block[d]) for e, p, g, a, d in out[i])
+        # Refinement: the states of a block have the same transitions, except
+        # the dirty ones (the blocks of their destination states were split).
+        dirty = set(range(len(names)))
+        while len(dirty) != 0:
+            touched = defaultdict(list)
+            for i in dirty:
+                touched[block[i]].append(i)
+            dirty = set()
+            for b, changed in touched.items():
+                parts = defaultdict(list)
+                for i in changed:
+                    parts[sign(i)].append(i)
+                # The other states still have the same transitions
+                others, unchanged = len(members[b]) - len(changed), None
+                if others != 0:
+                    changed = set(changed)
+                    unchanged = sign(next(i for i in members[b] if i not in changed))
+                    parts.setdefault(unchanged, [])
+                if len(parts) == 1:
+                    continue
+                size = lambda k: len(parts[k]) + (others if k == unchanged else 0)
+                largest = max(parts, key=size)
+                for k in parts:
+                    if k == largest:
+                        continue
+                    part = parts[k]
+                    if k == unchanged:
+                        part = part + [i for i in members[b] if i not in changed]
+                    members.append(set(part))
+                    for i in part:
+                        members[b].discard(i)
+                        block[i] = len(members) - 1
+                        dirty.update(predecessors[i])
+        # Merge the blocks
+        merged, kept = [], dict()
+        for part in members:
+            part = sorted(part)
+            code = states[part[0]].entering + states[part[0]].leaving
+            if len(part) > 1 and code != '' and \
+               any(block[d] == block[i] and d != i for i in part for *_, d in out[i]):
+                continue
+            if len(part) > 1:
+                merged.append([names[i] for i in part])
+            for i in part:
+                kept[names[i]] = names[part[0]]
+        if len(merged) == 0:
+            return merged
+        graph, transitions = Graph(), set()
+        for name, state in zip(names, states):
+            if kept.get(name, name) == name:
+                graph.states[graph.add_state(name)] = state
+        for tr in self.graph.transitions:
+            if kept.get(tr.origin, tr.origin) != tr.origin:
+                continue
+            tr.destination = kept.get(tr.destination, tr.destination)
+            key = (tr.origin, tr.destination, tr.event.name, tuple(tr.event.params), tr.guard, tr.action)
+            if key not in transitions:
+                transitions.add(key)
+                graph.add_transition(tr)
+        lookup_events, transitions = defaultdict(list), set(id(tr) for tr in graph.transitions)
+        for event, arcs in self.lookup_events.items():
+            lookup_events[event] = [tr for tr in arcs if id(tr) in transitions]
+        self.graph, self.lookup_events = graph, lookup_events
+        self.build_index()
+        for part in merged:
+            print('   State machine ' + self.name + ': the state' + ('s ' if len(part) > 2 else ' ') +
+                  ', '.join(part[1:]) + (' are' if len(part) > 2 else ' is') + ' merged into the state ' + part[0])
+        return merged
+
+    ###########################################################################
+    ### Compile the composite states into this state machine (hierarchical to
+    ### flat): the states of the nested state machines (any depth) become states
+    ### of this one, so an event is dispatched by a single table of transitions
+    ### instead of being broadcast to the nested state machines. Like PlantUML,
+    ### states of the same name are the same state (a state belongs to the
+    ### deepest composite state using it). For the composite state S:
+    ###   - S becomes the entry state of the composite state: its entering code
+    ###     is called then the initial transitions of its nested state machine
+    ###     are done as internal transitions.
+    ###   - The final state of its nested state machine becomes the state
+    ###     S_FINAL from which the transitions of S without event (completion)
+    ###     leave.
+    ###   - Transitions of S with an event leave S and all its substates. The
+    ###     transitions of a substate are looked up first: a substate having a
+    ###     transition without guard on the same event, or a transient substate
+    ###     (transition without event nor guard), does not get the one of S.
+    ###     "on event" of S is an "on event" of each substate.
+    ### Actions of transitions call the leaving code of the composite states
+    ### they leave (innermost first), then their action, then the entering code
+    ### of the composite states they enter (outermost first) like UML.
+    ### The trade-off (size of the tables, calls dispatching an event) is
+    ### displayed.
+    ### return the names of the flattened state machines.
+    ###########################################################################
+    def flatten(self):
+        machines = [self]
+        for sm in machines:
+            machines.extend(sm.children)
+        if len(machines) == 1:
+            return []
+        # Calls dispatching an event: broadcast methods and tables of transitions
+        broadcasts = set((sm.name, name, e.name) for sm in machines for name, e in sm.broadcasts)
+        calls = defaultdict(int)
+        for _, _, event in broadcasts:
+            calls[event] += 1
+        for sm in machines:
+            for event in sm.lookup_events:
+                calls[event.name] += (event.name != '')
+        before = (sum(len(sm.graph.names) for sm in machines), sum(len(sm.graph.transitions) for sm in machines),
+                  len(broadcasts), max(calls.values(), default=0))
+        # Merge states and rename the initial and final states of nested state machines
+        graph, parents, finals, initials = Graph(), dict(), dict(), set()
+        for sm in machines:
+            composite, rename = '', dict()
+            if sm is not self:
+                composite = sm.composite
+                rename = { '[*]': composite, '*': composite + '_FINAL' }
+                while rename['*'] in graph.ids or rename['*'] in sm.graph.ids:
+                    rename['*'] = composite + '_' + rename['*']
+            for name, state in zip(sm.graph.names, sm.graph.states):
+                if name == '[*]' and sm is not self:
+                    continue
+                name = state.name = rename.get(name, name)
+                if composite not in ['', name]:
+                    parents[name] = composite
+                if not graph.has_state(name):
+                    graph.states[graph.add_state(name)] = state
+                    continue
+                merged = graph.state(name)
+                for a in ['comment', 'entering', 'leaving', 'activity']:
+                    if getattr(state, a) not in getattr(merged, a):
+                        setattr(merged, a, getattr(merged, a) + getattr(state, a))
+            for tr in sm.graph.transitions:
+                if tr.origin == '[*]' and sm is not self:
+                    initials.add(id(tr))
+                tr.origin, tr.destination = rename.get(tr.origin, tr.origin), rename.get(tr.destination, tr.destination)
+            if '*' in sm.graph.ids:
+                finals[composite] = rename['*']
+            if sm is not self:
+                for a in ['header', 'footer', 'init', 'code', 'unit_tests', 'variables']:
+                    setattr(self.extra_code, a, getattr(self.extra_code, a) + getattr(sm.extra_code, a))
+                self.warnings.extend(sm.warnings)
+        composites = [sm.composite for sm in machines[1:]]
+        for sm in machines[1:]:
+            if sm.parent is not self:
+                parents[sm.composite] = sm.parent.composite
+        ancestors = lambda name: [name] + ancestors(parents[name]) if name in parents else [name]
+        leaving = dict()
+        for composite in composites:
+            graph.add_state(composite)
+            state = graph.state(composite)
+            leaving[composite] = '; '.join(line.strip().rstrip(';') for line in state.leaving.splitlines()
+                                           if line.strip() != '')
+            state.leaving = ''
+        # Completion transitions leave the final states. Transitions of composite
+        # states leave their substates (deepest composite states first).
+        transitions = [tr for sm in machines for tr in sm.graph.transitions]
+        unguarded = set((tr.origin, tr.event.name) for tr in transitions if tr.guard == '')
+        for tr in [tr for tr in transitions if tr.origin in leaving and tr.event.name == '']:
+            if id(tr) in initials:
+                continue
+            if tr.origin not in finals:
+                self.warning('The composite state ' + tr.origin + ' has no final state: its transition to ' +
+                             tr.destination + ' without event is removed')
+                transitions.remove(tr)
+                continue
+            tr.origin = finals[tr.origin]
+            if tr.guard == '':
+                unguarded.add((tr.origin, ''))
+        expanded = dict()
+        for composite in reversed(composites):
+            substates = [name for name in graph.names if composite in ancestors(name)[1:]]
+            for tr in [tr for tr in transitions if tr.origin == composite and tr.event.name != '']:
+                expanded[id(tr)] = []
+                for origin in [composite] + substates:
+                    if (origin, tr.event.name) in unguarded and origin != composite or (origin, '') in unguarded:
+                        continue # Inner transition or transient state
+                    copy = tr
+                    if origin != composite:
+                        copy = Transition()
+                        for a in Transition.__slots__:
+                            setattr(copy, a, getattr(tr, a))
+                        copy.origin = origin
+                        copy.destination = origin if tr.destination == composite else tr.destination
+                        if tr.guard == '':
+                            unguarded.add((origin, tr.event.name))
+                    expanded[id(tr)].append(copy)
+        # Leaving and entering code of the composite states
+        for tr in [copy for tr in transitions for copy in expanded.get(id(tr), [tr])]:
+            if tr.origin != tr.destination:
+                left, entered = ancestors(tr.origin), ancestors(tr.destination)
+                code = [leaving[a] for a in left if a in leaving and a not in entered] + [tr.action]
+                code += [graph.state(a).entering for a in reversed(entered[1:]) if a not in left]
+                tr.action = '; '.join(line.strip().rstrip(';') for c in code for line in c.splitlines()
+                                      if line.strip() != '')
+            graph.add_transition(tr)
+        lookup_events = defaultdict(list)
+        for sm in reversed(machines):
+            for event, arcs in sm.lookup_events.items():
+                lookup_events[event].extend(copy for tr in arcs for copy in expanded.get(id(tr), [tr]))
+        names = [sm.name for sm in machines[1:]]
+        self.graph, self.lookup_events, self.children, self.broadcasts = graph, lookup_events, [], []
+        self.build_index()
+        print('   State machine ' + self.name + ': flattened ' + str(len(names)) + ' composite state(s): ' +
+              '%d -> %d states, %d -> %d transitions, %d -> %d classes, %d -> %d broadcast methods, '
+              'up to %d -> %d calls dispatching an event' % (before[0], len(self.graph.names),
+              before[1], len(self.graph.transitions), len(machines), 1, before[2], len(self.broadcasts),
+              before[3], min(before[3], 1)))
+        return names
+
+    ###########################################################################
+    ### Compile the orthogonal regions of a composite state into a product
+    ### state machine: its states are the tuples of the states of the regions
+    ### reachable from their initial states (named by joining the names of the
+    ### states, the initial and final states being [*] and * when all regions
+    ### are in them). On an event (or without event), the regions reacting to it
+    ### transition together while the other ones stay in their state. When the
+    ### transitions of a region are guarded, the region can also stay in its
+    ### state if all their guards are false. The guard of a product transition
+    ### is the conjunction of the guards of the regions. Its action calls, for
+    ### each region changing of state, the leaving code of its state, its action
+    ### and the entering code of its new state (the states of the product state
+    ### machine do not have entering and leaving code).
+    ### param[in] regions the nested state machines of the orthogonal regions.
+    ### return the product state machine (its name is not set).
+    ###########################################################################
+    def product(self, regions):
+        sm = StateMachine()
+        sm.parent, sm.composite = self, regions[0].composite
+        for region in regions:
+            for a in ['header', 'footer', 'init', 'code', 'unit_tests', 'variables']:
+                setattr(sm.extra_code, a, getattr(sm.extra_code, a) + getattr(region.extra_code, a))
+            sm.warnings.extend(region.warnings)
+        out = [defaultdict(lambda: defaultdict(list)) for _ in regions]
+        for i, region in enumerate(regions):
+            for tr in region.graph.transitions:
+                out[i][tr.origin][tr.event.name].append(tr)
+        line = lambda code: '; '.join(l.strip().rstrip(';') for l in code.splitlines() if l.strip() != '')
+        def name(states):
+            if all(state == states[0] for state in states) and states[0] in ['[*]', '*']:
+                return states[0]
+            return '_'.join({ '[*]': 'INITIAL', '*': 'FINAL' }.get(state, state) for state in states)
+        start = tuple('[*]' for _ in regions)
+        sm.initial_state, visited, queue = '[*]', { start }, [start]
+        sm.add_state('[*]')
+        for states in queue:
+            events = []
+            for i, state in enumerate(states):
+                events.extend(e for e in out[i][state] if e not in events)
+            for e in events:
+                # Transitions of each region (None for staying in its state)
+                choices = []
+                for i, state in enumerate(states):
+                    arcs = out[i][state].get(e, [])
+                    if len(arcs) == 0 or all(tr.guard != '' for tr in arcs):
+                        arcs = arcs + [None]
+                    choices.append(arcs)
+                for combination in itertools.product(*choices):
+                    if all(tr == None for tr in combination):
+                        continue
+                    tr = Transition()
+                    tr.origin, tr.arrow = name(states), '->'
+                    tr.event = next(t.event for t in combination if t != None)
+                    guards, actions, destinations = [], [], []
+                    for i, t in enumerate(combination):
+                        if t == None:
+                            destinations.append(states[i])
+                            guards.extend('!(' + a.guard + ')' for a in out[i][states[i]].get(e, []))
+                            continue
+                        destinations.append(t.destination)
+                        if t.guard != '':
+                            guards.append(t.guard)
+                        changed = (t.destination != t.origin)
+                        if changed and t.origin != '[*]':
+                            actions.append(line(regions[i].graph.state(t.origin).leaving))
+                        actions.append(line(t.action))
+                        if changed and t.destination != '*':
+                            actions.append(line(regions[i].graph.state(t.destination).entering))
+                    destinations = tuple(destinations)
+                    tr.destination = name(destinations)
+                    tr.guard = guards[0] if len(guards) == 1 else ' && '.join('(' + g + ')' for g in guards)
+                    tr.action = '; '.join(a for a in actions if a != '')
+                    if tr.destination == '*':
+                        sm.final_state = '*'
+                    sm.add_state(tr.destination)
+                    sm.add_transition(tr)
+                    if e != '':
+                        sm.lookup_events[tr.event].append(tr)
+                    if destinations not in visited:
+                        visited.add(destinations)
+                        queue.append(destinations)
+        for region in regions:
+            for child in region.children:
+                child.parent = sm
+                sm.children.append(child)
+        return sm
+
     ###########################################################################
     ### Print a warning message on the console.
     ### param[in] msg the message to print.
@@ -471,6 +2237,175 @@ class StateMachine(object):
         print(f"{bcolors.WARNING}   WARNING in the state machine " + self.name \
               + ": "  + msg + f"{bcolors.ENDC}")
 
+###############################################################################
+### Build the state machines while the PlantUML file is parsed: the LALR parser
+### calls the method named as the grammar rule each time the rule is reduced
+### (Lark inline transformer) with the list of its children. No Abstract Syntax
+### Tree is kept. The class does not derive from lark.Transformer to work with
+### the standalone parser too, without importing Lark.
+### Note: LALR reduces rules in the order of the PlantUML file. The content of
+### a composite state is reduced after its "state Name {" line (rule
+### state_begin) and before its "}" line (rule state_block).
+###############################################################################
+class ModelBuilder(object):
+    def __init__(self, parser):
+        # The parser holding the state machines.
+        self.parser = parser
+
+    ###########################################################################
+    ### Event, guard and actions of transitions. Guards and actions are
+    ### returned as tuples (kind, code) for the rule using them.
+    ###########################################################################
+    def event(self, children):
+        event = Event()
+        event.parse(children)
+        return event
+
+    def guard(self, children):
+        return ('guard', children[0][1:-1].strip()) # Remove [ and ]
+
+    def uml_action(self, children):
+        return ('action', children[0][1:].strip()) # Remove /
+
+    def std_action(self, children):
+        return ('action', children[0][6:].strip()) # Remove \n--\n
+
+    ###########################################################################
+    ### Set the optional event, guard and action of the transition.
+    ###########################################################################
+    def set_transition(self, tr, children):
+        for child in children:
+            if isinstance(child, Event):
+                tr.event = child
+            elif child[0] == 'guard':
+                tr.guard = child[1]
+            else:
+                tr.action = child[1]
+
+    ###########################################################################
+    ### origin state -> destination state : event [ guard ] / action
+    ### destination state <- origin state : event [ guard ] / action
+    ###########################################################################
+    def transition(self, children):
+        tr = Transition()
+        tr.arrow = str(children[1])
+        if tr.arrow[-1] == '>':
+            tr.origin, tr.destination = children[0].upper(), children[2].upper()
+        else:
+            tr.origin, tr.destination = children[2].upper(), children[0].upper()
+        self.set_transition(tr, children[3:])
+        self.parser.parse_transition(tr)
+
+    ###########################################################################
+    ### 'on event' is not sugar syntax to a real transition: since it disables
+    ### 'entry' and 'exit' actions but we want create a real graph edege to
+    ### help us on graph theory traversal algorithm (like finding cycles) for
+    ### unit tests.
+    ###########################################################################
+    def state_event(self, children):
+        tr = Transition()
+        tr.arrow = '->'
+        tr.origin = tr.destination = children[0].upper()
+        self.set_transition(tr, children[1:])
+        self.parser.parse_transition(tr, True)
+
+    ###########################################################################
+    ### State : entry|exit|do|comment / action
+    ###########################################################################
+    def state_action(self, what, children):
+        code = children[1][1] if len(children) > 1 else ''
+        self.parser.parse_state(children[0].upper(), what, code)
+
+    def state_entry(self, children):
+        self.state_action('entry', children)
+
+    def state_exit(self, children):
+        self.state_action('exit', children)
+
+    def state_activity(self, children):
+        self.state_action('activity', children)
+
+    def state_comment(self, children):
+        self.state_action('comment', children)
+
+    ###########################################################################
+    ### '[command] C++ code
+    ###########################################################################
+    def cpp(self, children):
+        self.parser.parse_extra_code(str(children[0]), children[1].strip())
+
+    ###########################################################################
+    ### Composite states.
+    ###########################################################################
+    def state_begin(self, children):
+        self.parser.begin_composite_state(str(children[0]))
+
+    def state_block(self, children):
+        self.parser.end_composite_state()
+
+    def ortho_separator(self, children):
+        self.parser.begin_region()
+
+    ###########################################################################
+    ### Skip undesired PlantUML syntax.
+    ###########################################################################
+    def start(self, children):
+        pass
+
+    def comment(self, children):
+        pass
+
+    def skin(self, children):
+        pass
+
+    def note(self, children):
+        pass
+
+###############################################################################
+### Options of a translation, given by the command line (see main()) or by the
+### keyword arguments of the constructor. The cache key of a translation is
+### made of all of them (see Parser.translation_key()).
+###############################################################################
+class Options(object):
+    def __init__(self, **options):
+        # Verify state machines and generate unit tests from graph analysis
+        # (cycles, test paths).
+        self.analysis = True
+        # Budget of the enumeration of cycles (see StateMachine.graph_cycles()).
+        self.max_cycles = MAX_CYCLES
+        self.max_cycle_length = 0
+        # Unit tests also cover the pairs of consecutive transitions (see
+        # StateMachine.graph_test_paths()).
+        self.pair_coverage = False
+        # Run the model checker (see StateMachine.verify_model()).
+        self.check = False
+        # Merge equivalent states (see StateMachine.minimize()).
+        self.minimize = False
+        # Compile the composite states into the main state machine (see
+        # StateMachine.flatten()).
+        self.flatten = False
+        # Generation of orthogonal regions: 'product', 'parallel' or 'auto'
+        # (see Parser.compose_regions()).
+        self.regions = 'auto'
+        # Dispatch of the events: 'dense', 'switch', 'map' or 'auto' (see
+        # Parser.dispatch_strategy()).
+        self.dispatch = 'auto'
+        # Runtime profile of the generated code: 'default' or 'embedded' (no
+        # dynamic memory, tables in read-only memory and fault hook, see
+        # StateMachine.hpp).
+        self.profile = 'default'
+        for name, value in options.items():
+            if name not in vars(self):
+                raise TypeError('unknown translation option ' + name)
+            setattr(self, name, value)
+
+    ###########################################################################
+    ### Return the options of the parsed command line (argparse namespace).
+    ###########################################################################
+    @staticmethod
+    def from_args(args):
+        return Options(**{ name: getattr(args, name) for name in vars(Options()) })
+
 ###############################################################################
 ### Context of the parser translating a PlantUML file depicting a state machine
 ### into a C++ file state machine holding some unit tests.
@@ -480,10 +2415,6 @@ class Parser(object):
     def __init__(self):
         # Context-free language parser (Lark lib)
         self.parser = None
-        # Abstract Syntax Tree (Lark lib)
-        self.ast = None
-        # List of tokens split from the AST (ugly hack !!!).
-        self.tokens = []
         # File descriptor of the opened file (plantUML, generated files).
         self.fd = None
         # Name of the plantUML file (input of the tool).
@@ -496,6 +2427,15 @@ class Parser(object):
         self.master = StateMachine()
         # Dictionnary of all state machines (master and nested).
         self.machines = dict() # type: StateMachine()
+        # Options of the current translation (see Options).
+        self.options = Options()
+        # List of files generated by the translation.
+        self.outputs = []
+        # Warnings of the translation as tuples (state machine name, message).
+        self.warnings = []
+        # Tuples (transition, origin state, destination state) whose mock
+        # counters have been incremented for the current unit test.
+        self.counted = []
 
     ###########################################################################
     ### Is the generated file should be a C++ source file or header file ?
@@ -515,6 +2455,22 @@ class Parser(object):
               ": " + msg + f"{bcolors.ENDC}")
         sys.exit(-1)
 
+    ###########################################################################
+    ### Open a file to be generated and memorize it as an output of the
+    ### translation. The code is generated in memory until close_output().
+    ### param[in] path the path of the generated file.
+    ###########################################################################
+    def open_output(self, path):
+        self.fd = io.StringIO()
+        self.outputs.append(path)
+
+    ###########################################################################
+    ### Write the code generated in memory since open_output() in its file.
+    ###########################################################################
+    def close_output(self):
+        write_if_changed(self.outputs[-1], self.fd.getvalue())
+        self.fd.close()
+
     ###########################################################################
     ### Generate a separator line for function.
     ### param[in] spaces the number of spaces char to print.
@@ -579,9 +2535,9 @@ class Parser(object):
     ### You can add here your copyright, license ...
     ###########################################################################
     def generate_common_header(self):
-        self.fd.write('// This file as been generated the ')
-        self.fd.write(date.today().strftime("%B %d, %Y"))
-        self.fd.write(' from the PlantUML statechart ' + self.uml_file)
+        # No date: the file shall not change while its statechart is unchanged
+        # (see write_if_changed()).
+        self.fd.write('// This file as been generated from the PlantUML statechart ' + self.uml_file)
         self.fd.write('\n// This code generation is still experimental. Some '
                       'border cases may not be correctly managed!\n\n')
 
@@ -599,6 +2555,12 @@ class Parser(object):
             self.generate_include(indent, '"', sm.class_name + '.hpp', '"')
         if len(self.current.children) == 0:
             self.generate_include(indent, '"', 'StateMachine.hpp', '"')
+        # The runtime shall be compiled with the profile of the generated code
+        if self.options.profile == 'embedded':
+            self.fd.write('#' + (' ' * 2 * indent) + 'if !defined(FSM_EMBEDDED)\n')
+            self.fd.write('#' + (' ' * 2 * (indent + 1)) + 'error "Generated for the embedded '
+                          'profile: compile with -DFSM_EMBEDDED"\n')
+            self.fd.write('#' + (' ' * 2 * indent) + 'endif\n')
         for w in self.current.warnings:
             self.fd.write('\n#warning "' + w + '"\n')
         self.fd.write(self.current.extra_code.header)
@@ -620,9 +2582,12 @@ class Parser(object):
         self.generate_function_comment('States of the state machine.')
         self.fd.write('enum class ' + self.current.enum_name + '\n{\n')
         self.indent(1), self.fd.write('// Client states:\n')
-        for state in list(self.current.graph.nodes):
+        for state in self.current.graph.names:
+            # Transitions to the CANNOT_HAPPEN state trap the whole system
+            if state == 'CANNOT_HAPPEN':
+                continue
             self.indent(1), self.fd.write(self.state_name(state) + ',')
-            comment = self.current.graph.nodes[state]['data'].comment
+            comment = self.current.graph.state(state).comment
             if comment != '':
                 self.fd.write(' //!< ' + comment)
             self.fd.write('\n')
@@ -637,9 +2602,11 @@ class Parser(object):
         self.generate_function_comment('Convert enum states to human readable string.')
         self.fd.write('static inline const char* stringify(' + self.current.enum_name + \
                       ' const state)\n{\n')
-        self.indent(1), self.fd.write('static const char* s_states[] =\n')
+        self.indent(1), self.fd.write('static const char* const s_states[] =\n')
         self.indent(1), self.fd.write('{\n')
-        for state in list(self.current.graph.nodes):
+        for state in self.current.graph.names:
+            if state == 'CANNOT_HAPPEN':
+                continue
             self.indent(2), self.fd.write('[int(' + self.state_enum(state) + ')] = "' + state + '",\n')
         self.indent(1), self.fd.write('};\n\n')
         self.indent(1), self.fd.write('return s_states[int(state)];\n};\n\n')
@@ -663,25 +2630,41 @@ class Parser(object):
     def state_enum(self, state):
         return self.current.enum_name + '::' + self.state_name(state)
 
+    ###########################################################################
+    ### Return the suffix of C++ methods of a transition. Transitions are named
+    ### after their states, and when several transitions link the same states,
+    ### after their event (and their rank when their event is not unique).
+    ### param[in] tr the transition.
+    ###########################################################################
+    def transition_name(self, tr):
+        name = self.state_name(tr.origin) + '_' + self.state_name(tr.destination)
+        parallels = self.current.graph.transitions_between(tr.origin, tr.destination)
+        if len(parallels) <= 1:
+            return name
+        if tr.event.name != '':
+            name += '_' + tr.event.name
+        same = [t for t in parallels if t.event.name == tr.event.name]
+        if len(same) > 1:
+            name += '_' + str(same.index(tr))
+        return name
+
     ###########################################################################
     ### Return the C++ method for transition guards.
-    ### param[in] source the origin state (PlantUML name).
-    ### param[in] destination the destination state (PlantUML name).
+    ### param[in] tr the transition.
     ### param[in] class_name if True prepend the class name.
     ###########################################################################
-    def guard_function(self, source, destination, class_name=False):
+    def guard_function(self, tr, class_name=False):
         s = self.current.class_name + '::' if class_name else ''
-        return s + 'onGuarding_' + self.state_name(source) + '_' + self.state_name(destination)
+        return s + 'onGuarding_' + self.transition_name(tr)
 
     ###########################################################################
     ### Return the C++ method for transition actions.
-    ### param[in] source the origin state (PlantUML name).
-    ### param[in] destination the destination state (PlantUML name).
+    ### param[in] tr the transition.
     ### param[in] class_name if True prepend the class name.
     ###########################################################################
-    def transition_function(self, source, destination, class_name=False):
+    def transition_function(self, tr, class_name=False):
         s = self.current.class_name + '::' if class_name else ''
-        return s + 'onTransitioning_' + self.state_name(source) + '_' + self.state_name(destination)
+        return s + 'onTransitioning_' + self.transition_name(tr)
 
     ###########################################################################
     ### Return the C++ method for entering state actions.
@@ -733,29 +2716,26 @@ class Parser(object):
     ###########################################################################
     def generate_plantuml_code(self, comm=''):
         code = ''
-        for node in list(self.current.graph.nodes()):
-            if node in ['[*]', '*']:
+        for state in self.current.graph.states:
+            if state.name in ['[*]', '*']:
                 continue
-            state = self.current.graph.nodes[node]['data']
             if state.entering == '' and state.leaving == '' and state.activity == '':
                 continue
             code += comm + str(state).replace('\n', '\n' + comm) + '\n'
-        for src in list(self.current.graph.nodes()):
-            for dest in list(self.current.graph.neighbors(src)):
-                tr = self.current.graph[src][dest]['data']
-                code += comm + str(tr) + '\n'
+        for tr in self.current.index.transitions:
+            code += comm + str(tr) + '\n'
         return code
 
     ###########################################################################
     ### Generate the PlantUML file from the graph structure.
     ###########################################################################
-    def generate_plantuml_file(self):
-        for self.current in self.machines.values():
-            self.fd = open(self.current.name + '-interpreted.plantuml', 'w')
+    def generate_plantuml_file(self, machines):
+        for self.current in machines.values():
+            self.open_output(self.current.name + '-interpreted.plantuml')
             self.fd.write('@startuml\n')
             self.fd.write(self.generate_plantuml_code())
             self.fd.write('@enduml\n')
-            self.fd.close()
+            self.close_output()
 
     ###########################################################################
     ### Generate the comment for the state machine class.
@@ -776,8 +2756,8 @@ class Parser(object):
     ### the table is not generated.
     ###########################################################################
     def generate_table_of_states(self):
-        for state in list(self.current.graph.nodes):
-            s = self.current.graph.nodes[state]['data']
+        for state in self.current.graph.names:
+            s = self.current.graph.state(state)
             # Nothing to do with initial state
             if (s.name == '[*]'):
                 continue
@@ -804,6 +2784,37 @@ class Parser(object):
                 self.fd.write(',\n')
             self.indent(2), self.fd.write('};\n')
 
+    ###########################################################################
+    ### Embedded profile: generate the static method returning the table of
+    ### states placed in read-only memory (see StateMachine::states()).
+    ###########################################################################
+    def generate_table_of_states_method(self):
+        self.generate_method_comment('Actions on states (read-only memory).')
+        self.indent(1), self.fd.write('static State const* table_of_states()\n')
+        self.indent(1), self.fd.write('{\n')
+        self.indent(2), self.fd.write('static constexpr States s_states =\n')
+        self.indent(2), self.fd.write('{\n')
+        for state in self.current.graph.names:
+            if state == 'CANNOT_HAPPEN':
+                continue
+            s = self.current.graph.state(state)
+            if s.name == '[*]' or (s.entering == '' and s.leaving == '' and s.internal == ''):
+                self.indent(3), self.fd.write('{ }, // ' + self.state_name(state) + '\n')
+                continue
+            self.indent(3), self.fd.write('{ // ' + self.state_name(state) + '\n')
+            if s.leaving != '':
+                self.indent(4), self.fd.write('.leaving = &' + self.state_leaving_function(state, True) + ',\n')
+            if s.entering != '':
+                self.indent(4), self.fd.write('.entering = &' + self.state_entering_function(state, True) + ',\n')
+            if s.internal != '':
+                self.indent(4), self.fd.write('.internal = &' + self.state_internal_function(state, True) + ',\n')
+            if s.activity != '':
+                self.indent(4), self.fd.write('.activity = &' + self.state_activity_function(state, True) + ',\n')
+            self.indent(3), self.fd.write('},\n')
+        self.indent(2), self.fd.write('};\n\n')
+        self.indent(2), self.fd.write('return s_states;\n')
+        self.indent(1), self.fd.write('}\n\n')
+
     ###########################################################################
     ### Generate the code of the state machine constructor method.
     ### TODO missing generating ": m_foo(foo),\n" ...
@@ -816,9 +2827,12 @@ class Parser(object):
         self.indent(2), self.fd.write(': StateMachine(' + self.state_enum(self.current.initial_state) + ')')
         self.fd.write(self.current.extra_code.cons), self.fd.write('\n')
         self.indent(1), self.fd.write('{\n')
-        self.indent(2), self.fd.write('// Init actions on states\n')
-        self.generate_table_of_states()
-        self.fd.write('\n'), self.indent(2), self.fd.write('// Init user code\n')
+        # The embedded profile holds the actions on states in read-only memory
+        if self.options.profile != 'embedded':
+            self.indent(2), self.fd.write('// Init actions on states\n')
+            self.generate_table_of_states()
+            self.fd.write('\n')
+        self.indent(2), self.fd.write('// Init user code\n')
         self.fd.write(self.current.extra_code.init)
         self.indent(1), self.fd.write('}\n\n')
 
@@ -849,9 +2863,9 @@ class Parser(object):
             self.fd.write('\n'), self.indent(2), self.fd.write('// Init user code\n')
             self.fd.write(self.current.extra_code.init)
         # Initial internal transition
-        if self.current.graph.nodes['[*]']['data'].internal != '':
+        if self.current.graph.state('[*]').internal != '':
             self.fd.write('\n'), self.indent(2), self.fd.write('// Internal transition\n')
-            self.fd.write(self.current.graph.nodes['[*]']['data'].internal)
+            self.fd.write(self.current.graph.state('[*]').internal)
         self.indent(1), self.fd.write('}\n\n')
 
     ###########################################################################
@@ -881,11 +2895,21 @@ class Parser(object):
 #            # Generate the table of transitions
     ###########################################################################
     def generate_event_methods(self):
-        # Broadcasr external events to nested state machine
+        # Broadcast external events to nested state machines (orthogonal regions
+        # receive them in sequence). Events the state machine also reacts to
+        # are broadcast by its method.
+        broadcasts = defaultdict(list)
         for (sm, e) in self.current.broadcasts:
+            broadcasts[e].append(sm)
+        for e, machines in broadcasts.items():
+            if e in self.current.lookup_events:
+                continue
             self.generate_method_comment('Broadcast external event.')
             self.indent(1), self.fd.write('inline '), self.fd.write(e.header())
-            self.fd.write(' { ' + self.child_machine_instance(sm) + '.' + e.caller() + '; }\n\n')
+            self.fd.write(' {')
+            for sm in machines:
+                self.fd.write(' ' + self.child_machine_instance(sm) + '.' + e.caller() + ';')
+            self.fd.write(' }\n\n')
         # React to external events
         for event, arcs in self.current.lookup_events.items():
             if event.name == '':
@@ -901,36 +2925,136 @@ class Parser(object):
             # Copy data event
             for arg in event.params:
                 self.indent(2), self.fd.write(arg + ' = ' + arg + '_;\n\n')
+            # Broadcast the event to nested state machines
+            for sm in broadcasts.get(event, []):
+                self.indent(2), self.fd.write(self.child_machine_instance(sm) + '.' + event.caller() + ';\n')
+            if event in broadcasts:
+                self.fd.write('\n')
             # Table of transitions
             self.indent(2), self.fd.write('// State transition and actions\n')
-            self.indent(2), self.fd.write('static const Transitions s_transitions =\n')
+            strategy = self.dispatch_strategy(arcs)
+            if strategy == 'dense':
+                self.generate_dense_dispatch(arcs)
+            elif strategy == 'switch':
+                self.generate_switch_dispatch(arcs)
+            else:
+                self.generate_map_dispatch(arcs)
+            self.indent(1), self.fd.write('}\n\n')
+
+    ###########################################################################
+    ### Choose how the method of an event looks up the transition leaving the
+    ### current state: 'dense' table indexed by the states (O(1) but one entry
+    ### per state), 'switch' on the current state (the compiler makes a jump
+    ### table or a binary search) or 'map' (std::multimap, former generation).
+    ### In auto mode, the table is dense when at least DENSE_TABLE_DENSITY of
+    ### the states react to the event, each one with a single transition
+    ### (guarded alternatives need a range of transitions). States having
+    ### several transitions on the event always switch, except in map mode.
+    ### param[in] arcs the transitions of the event (see lookup_events).
+    ### return 'dense', 'switch' or 'map'.
+    ###########################################################################
+    def dispatch_strategy(self, arcs):
+        origins = set(tr.origin for tr in arcs)
+        if self.options.dispatch == 'map':
+            return 'map'
+        if len(origins) != len(arcs):
+            return 'switch'
+        if self.options.dispatch == 'dense':
+            return 'dense'
+        if self.options.dispatch == 'switch':
+            return 'switch'
+        states = len([s for s in self.current.graph.names if s != 'CANNOT_HAPPEN'])
+        return 'dense' if len(origins) >= DENSE_TABLE_DENSITY * states else 'switch'
+
+    ###########################################################################
+    ### Generate the fields of the initializer of a StateMachine::Transition.
+    ### param[in] tr the transition.
+    ### param[in] count the number of indentations.
+    ###########################################################################
+    def generate_transition_fields(self, tr, count):
+        self.indent(count), self.fd.write('.destination = ' + self.state_enum(tr.destination) + ',\n')
+        if tr.guard != '':
+            self.indent(count), self.fd.write('.guard = &' + self.guard_function(tr, True) + ',\n')
+        if tr.action != '':
+            self.indent(count), self.fd.write('.action = &' + self.transition_function(tr, True) + ',\n')
+
+    ###########################################################################
+    ### Event method: look up the transition in a table indexed by the states.
+    ### States not reacting to the event ignore it.
+    ### param[in] arcs the transitions of the event (one by origin state).
+    ###########################################################################
+    def generate_dense_dispatch(self, arcs):
+        transitions = dict((tr.origin, tr) for tr in arcs)
+        self.indent(2), self.fd.write('static constexpr DenseTransitions s_transitions =\n')
+        self.indent(2), self.fd.write('{\n')
+        for state in self.current.graph.names:
+            if state == 'CANNOT_HAPPEN':
+                continue
+            tr = transitions.get(state)
+            if tr == None:
+                self.indent(3), self.fd.write('{ }, // ' + self.state_name(state) + '\n')
+                continue
+            self.indent(3), self.fd.write('{ // ' + self.state_name(state) + '\n')
+            self.generate_transition_fields(tr, 4)
+            self.indent(3), self.fd.write('},\n')
+        self.indent(2), self.fd.write('};\n\n')
+        self.indent(2), self.fd.write('transition(&s_transitions[int(state())], 1u);\n')
+
+    ###########################################################################
+    ### Event method: switch on the current state. Each case holds the
+    ### transitions leaving its state, in the order of their guards.
+    ### param[in] arcs the transitions of the event.
+    ###########################################################################
+    def generate_switch_dispatch(self, arcs):
+        transitions = defaultdict(list)
+        for tr in arcs:
+            transitions[tr.origin].append(tr)
+        self.indent(2), self.fd.write('switch (state())\n')
+        self.indent(2), self.fd.write('{\n')
+        for origin, trs in transitions.items():
+            self.indent(2), self.fd.write('case ' + self.state_enum(origin) + ':\n')
             self.indent(2), self.fd.write('{\n')
-            for origin, destination in arcs:
-                tr = self.current.graph[origin][destination]['data']
-                self.indent(3), self.fd.write('{\n')
-                self.indent(4), self.fd.write(self.state_enum(origin) + ',\n')
+            self.indent(3), self.fd.write('static constexpr Transition s_transitions[] =\n')
+            self.indent(3), self.fd.write('{\n')
+            for tr in trs:
                 self.indent(4), self.fd.write('{\n')
-                self.indent(5), self.fd.write('.destination = ' + self.state_enum(destination) + ',\n')
-                if tr.guard != '':
-                    self.indent(5), self.fd.write('.guard = &' + self.guard_function(origin, destination, True) + ',\n')
-                if tr.action != '':
-                    self.indent(5), self.fd.write('.action = &' + self.transition_function(origin, destination, True) + ',\n')
+                self.generate_transition_fields(tr, 5)
                 self.indent(4), self.fd.write('},\n')
-                self.indent(3), self.fd.write('},\n')
-            self.indent(2), self.fd.write('};\n\n')
-            self.indent(2), self.fd.write('transition(s_transitions);\n')
-            self.indent(1), self.fd.write('}\n\n')
+            self.indent(3), self.fd.write('};\n\n')
+            self.indent(3), self.fd.write('transition(s_transitions, ' + str(len(trs)) + 'u);\n')
+            self.indent(3), self.fd.write('break;\n')
+            self.indent(2), self.fd.write('}\n')
+        self.indent(2), self.fd.write('default:\n')
+        self.indent(3), self.fd.write('transition(nullptr, 0u);\n')
+        self.indent(3), self.fd.write('break;\n')
+        self.indent(2), self.fd.write('}\n')
+
+    ###########################################################################
+    ### Event method: look up the transitions in a std::multimap.
+    ### param[in] arcs the transitions of the event.
+    ###########################################################################
+    def generate_map_dispatch(self, arcs):
+        self.indent(2), self.fd.write('static const Transitions s_transitions =\n')
+        self.indent(2), self.fd.write('{\n')
+        for tr in arcs:
+            self.indent(3), self.fd.write('{\n')
+            self.indent(4), self.fd.write(self.state_enum(tr.origin) + ',\n')
+            self.indent(4), self.fd.write('{\n')
+            self.generate_transition_fields(tr, 5)
+            self.indent(4), self.fd.write('},\n')
+            self.indent(3), self.fd.write('},\n')
+        self.indent(2), self.fd.write('};\n\n')
+        self.indent(2), self.fd.write('transition(s_transitions);\n')
 
     ###########################################################################
     ### Generate guards and actions on transitions.
     ###########################################################################
     def generate_transition_methods(self):
-        transitions = list(self.current.graph.edges)
-        for origin, destination in transitions:
-            tr = self.current.graph[origin][destination]['data']
+        for tr in self.current.index.transitions:
+            origin, destination = tr.origin, tr.destination
             if tr.guard != '':
                 self.generate_method_comment('Guard the transition from state ' + origin  + ' to state ' + destination + '.')
-                self.indent(1), self.fd.write('MOCKABLE bool ' + self.guard_function(origin, destination) + '()\n')
+                self.indent(1), self.fd.write('MOCKABLE bool ' + self.guard_function(tr) + '()\n')
                 self.indent(1), self.fd.write('{\n')
                 self.indent(2), self.fd.write('const bool guard = (' + tr.guard + ');\n')
                 self.indent(2), self.fd.write('LOGD("[' + self.current.class_name.upper() + '][GUARD ' + origin + ' --> ' + destination + ': ' + tr.guard + '] result: %s\\n",\n')
@@ -939,11 +3063,11 @@ class Parser(object):
                 self.indent(1), self.fd.write('}\n\n')
             if tr.action != '':
                 self.generate_method_comment('Do the action when transitioning from state ' + origin + ' to state ' + destination + '.')
-                self.indent(1), self.fd.write('MOCKABLE void ' + self.transition_function(origin, destination) + '()\n')
+                self.indent(1), self.fd.write('MOCKABLE void ' + self.transition_function(tr) + '()\n')
                 self.indent(1), self.fd.write('{\n')
                 self.indent(2), self.fd.write('LOGD("[' + self.current.class_name.upper() + '][TRANSITION ' + origin + ' --> ' + destination)
                 if tr.action[0:2] != '//':
-                    self.fd.write(': ' + tr.action + ']\\n");\n')
+                    self.fd.write(': ' + self.cleaning_code(tr.action) + ']\\n");\n')
                 else: # Cannot display action since contains comment + warnings
                     self.fd.write(']\\n");\n')
                 self.indent(2), self.fd.write(tr.action + ';\n')
@@ -953,9 +3077,8 @@ class Parser(object):
     ### Generate leaving and entering actions associated to states.
     ###########################################################################
     def generate_state_methods(self):
-        nodes = list(self.current.graph.nodes)
-        for node in nodes:
-            state = self.current.graph.nodes[node]['data']
+        for state in self.current.graph.states:
+            node = state.name
             if state.entering != '':
                 self.generate_method_comment('Do the action when entering the state ' + state.name + '.')
                 self.indent(1), self.fd.write('MOCKABLE void ' + self.state_entering_function(node, False) + '()\n')
@@ -981,19 +3104,42 @@ class Parser(object):
                 self.fd.write(state.internal)
                 self.indent(1), self.fd.write('}\n\n')
 
+    ###########################################################################
+    ### Return the capacity of the ring buffer queuing the transitions
+    ### triggered while reacting to an event (template parameter NESTING of
+    ### StateMachine): the transition being fired, the transitions without
+    ### event queued by the internal method of the state entered (see
+    ### manage_noevents(): the guarded ones are alternatives queuing one
+    ### transition, each unguarded one is queued) and the calls of event methods
+    ### of this state machine made by the actions (calls of methods of other
+    ### objects are not counted).
+    ###########################################################################
+    def nesting_capacity(self):
+        queued = max((sum(1 for tr in trs if tr.guard == '') + any(tr.guard != '' for tr in trs)
+                      for trs in self.current.index.noevents.values()), default=0)
+        calls = re.compile('|'.join(r'(?:(?<![\w.>:])|(?<=this->))' + re.escape(e.name) + r'\s*\('
+                                    for e in self.current.lookup_events if e.name != ''))
+        codes = [tr.action for tr in self.current.index.transitions]
+        codes += [s.entering + s.leaving for s in self.current.graph.states]
+        raised = sum(len(calls.findall(code)) for code in codes) if calls.pattern != '' else 0
+        return 1 + queued + raised
+
     ###########################################################################
     ### Entry point to generate the whole state machine class and all its methods.
     ###########################################################################
     def generate_state_machine_class(self):
         self.generate_class_comment()
         self.fd.write('class ' + self.current.class_name + ' : public StateMachine<')
-        self.fd.write(self.current.class_name + ', ' + self.current.enum_name + '>\n')
+        self.fd.write(self.current.class_name + ', ' + self.current.enum_name + ', ')
+        self.fd.write(str(self.nesting_capacity()) + 'u>\n')
         self.fd.write('{\n')
         self.fd.write('public: // Constructor and destructor\n\n')
         self.generate_constructor_method()
         self.generate_destructor_method()
         self.generate_enter_method()
         self.generate_exit_method()
+        if self.options.profile == 'embedded':
+            self.generate_table_of_states_method()
         self.fd.write('public: // External events\n\n')
         self.generate_event_methods()
         self.fd.write('private: // Guards and actions on transitions\n\n')
@@ -1018,6 +3164,8 @@ class Parser(object):
     ###########################################################################
     def generate_unit_tests_header(self):
         self.generate_common_header()
+        if self.options.profile == 'embedded':
+            self.fd.write('#define FSM_EMBEDDED\n')
         self.fd.write('#define MOCKABLE virtual\n')
         self.fd.write('#include "' + self.current.class_name + '.hpp"\n')
         self.fd.write('#include <gmock/gmock.h>\n')
@@ -1038,21 +3186,20 @@ class Parser(object):
         self.generate_function_comment('Mocked state machine')
         self.fd.write('class Mock' + self.current.class_name + ' : public ' + self.current.class_name)
         self.fd.write('\n{\npublic:\n')
-        transitions = list(self.current.graph.edges)
-        for origin, destination in transitions:
-            tr = self.current.graph[origin][destination]['data']
+        for tr in self.current.index.transitions:
+            origin, destination = tr.origin, tr.destination
             if tr.guard != '':
                 self.indent(1)
                 self.fd.write('MOCK_METHOD(bool, ')
-                self.fd.write(self.guard_function(origin, destination))
+                self.fd.write(self.guard_function(tr))
                 self.fd.write(', (), (override));\n')
             if tr.action != '':
                 self.indent(1)
                 self.fd.write('MOCK_METHOD(void, ')
-                self.fd.write(self.transition_function(origin, destination))
+                self.fd.write(self.transition_function(tr))
                 self.fd.write(', (), (override));\n')
-        for node in list(self.current.graph.nodes):
-            state = self.current.graph.nodes[node]['data']
+        for state in self.current.graph.states:
+            node = state.name
             if state.entering != '':
                 self.indent(1)
                 self.fd.write('MOCK_METHOD(void, ')
@@ -1073,31 +3220,29 @@ class Parser(object):
         self.fd.write('};\n\n')
 
     ###########################################################################
-    ### Reset mock counters.
+    ### Reset mock counters of the transitions and the states counted by the
+    ### previous call of count_mocked_guards() (other counters are still 0).
     ###########################################################################
     def reset_mock_counters(self):
-        for origin, destination in list(self.current.graph.edges):
-            tr = self.current.graph[origin][destination]['data']
-            tr.count_guard = 0
-            tr.count_action = 0
-        for node in list(self.current.graph.nodes):
-            state = self.current.graph.nodes[node]['data']
-            state.count_entering = 0
-            state.count_leaving = 0
+        for tr, source, destination in self.counted:
+            tr.count_guard = tr.count_action = 0
+            source.count_leaving = source.count_entering = 0
+            destination.count_leaving = destination.count_entering = 0
+        self.counted = []
 
     ###########################################################################
     ### Count the number of times the entering and leaving actions are called.
     ###########################################################################
-    def count_mocked_guards(self, cycle):
+    def count_mocked_guards(self, path):
         self.reset_mock_counters()
-        for i in range(len(cycle) - 1):
-            tr = self.current.graph[cycle[i]][cycle[i+1]]['data'];
+        for tr in path:
+            source = self.current.graph.state(tr.origin)
+            destination = self.current.graph.state(tr.destination)
+            self.counted.append((tr, source, destination))
             if tr.guard != '':
                 tr.count_guard += 1
             if tr.action != '':
                 tr.count_action += 1
-            source = self.current.graph.nodes[cycle[i]]['data']
-            destination = self.current.graph.nodes[cycle[i+1]]['data']
             if source.leaving != '' and source.name != destination.name:
                 source.count_leaving += 1
             if destination.entering != '' and source.name != destination.name:
@@ -1112,15 +3257,14 @@ class Parser(object):
     ###########################################################################
     ### Generate mock guards.
     ###########################################################################
-    def generate_mocked_guards(self, cycle):
-        self.count_mocked_guards(cycle)
-        transitions = list(self.current.graph.edges)
-        for origin, destination in transitions:
-            tr = self.current.graph[origin][destination]['data']
+    def generate_mocked_guards(self, path):
+        self.count_mocked_guards(path)
+        for tr in self.current.index.transitions:
+            origin, destination = tr.origin, tr.destination
             if tr.guard != '':
                 self.indent(1)
                 self.fd.write('EXPECT_CALL(fsm, ')
-                self.fd.write(self.guard_function(origin, destination))
+                self.fd.write(self.guard_function(tr))
                 self.fd.write('())')
                 if tr.count_guard == 0:
                     self.fd.write('.WillRepeatedly(Return(false));\n')
@@ -1130,16 +3274,15 @@ class Parser(object):
                     self.fd.write(' return true; }));\n')
             if tr.action != '':
                 self.indent(1)
-                self.fd.write('EXPECT_CALL(fsm, ' + self.transition_function(origin, destination, False) + '())')
+                self.fd.write('EXPECT_CALL(fsm, ' + self.transition_function(tr, False) + '())')
                 self.fd.write('.Times(' + str(tr.count_action) + ')')
                 if tr.count_action >= 1:
                     self.fd.write('.WillRepeatedly(Invoke([](){')
                     self.fd.write(' LOGD("' + self.cleaning_code(tr.action) + '\\n");')
                     self.fd.write(' }))')
                 self.fd.write(';\n')
-        nodes = list(self.current.graph.nodes)
-        for node in nodes:
-            state = self.current.graph.nodes[node]['data']
+        for state in self.current.graph.states:
+            node = state.name
             if state.entering != '':
                 self.indent(1)
                 self.fd.write('EXPECT_CALL(fsm, ' + self.state_entering_function(node, False) + '())')
@@ -1164,13 +3307,13 @@ class Parser(object):
     ###########################################################################
     def generate_mocked_actions(self, cycle):
         for i in range(len(cycle) - 1):
-            tr = self.current.graph[cycle[i]][cycle[i+1]]['data'];
+            tr = self.current.graph.transition(cycle[i], cycle[i+1]);
             if tr.guard != '':
                 tr.count_guard += 1
             if tr.action != '':
                 tr.count_action += 1
         for node in cycle:
-            state = self.current.graph.nodes[node]['data']
+            state = self.current.graph.state(node)
             if state.entering != '':
                 state.count_entering += 1
             if state.leaving != '':
@@ -1195,7 +3338,7 @@ class Parser(object):
     ###########################################################################
     def generate_unit_tests_check_cycles(self):
         count = 0
-        cycles = self.current.graph_cycles()
+        cycles = self.current.cycles
         for cycle in cycles:
             self.generate_line_separator(0, ' ', 80, '-')
             self.fd.write('TEST(' + self.current.class_name + 'Tests, TestCycle' + str(count) + ')\n{\n')
@@ -1210,19 +3353,22 @@ class Parser(object):
 
             # Reset the state machine and print the guard supposed to reach this state
             self.indent(1), self.fd.write('Mock' + self.current.class_name + ' ' + 'fsm;\n')
-            self.generate_mocked_guards(['[*]'] + cycle)
+            self.generate_mocked_guards(self.current.path_transitions(['[*]'] + cycle))
             self.fd.write('\n'), self.indent(1), self.fd.write('fsm.enter();\n')
-            guard = self.current.graph[self.current.initial_state][cycle[0]]['data'].guard
-            self.indent(1), self.fd.write('LOGD("[UNIT TEST] Current state: %s\\n", fsm.c_str());\n')
-            self.indent(1), self.fd.write('ASSERT_EQ(fsm.state(), ' + self.state_enum(cycle[0]) + ');\n')
-            self.indent(1), self.fd.write('ASSERT_STREQ(fsm.c_str(), "' + cycle[0] + '");\n')
+            guard = self.current.graph.transition(self.current.initial_state, cycle[0]).guard
+            # No explicit event => direct internal transition: skip test for this state
+            first = self.current.graph.transition(cycle[0], cycle[1]) if len(cycle) > 1 else None
+            if first == None or first.event.name != '' or first.guard != '':
+                self.indent(1), self.fd.write('LOGD("[UNIT TEST] Current state: %s\\n", fsm.c_str());\n')
+                self.indent(1), self.fd.write('ASSERT_EQ(fsm.state(), ' + self.state_enum(cycle[0]) + ');\n')
+                self.indent(1), self.fd.write('ASSERT_STREQ(fsm.c_str(), "' + cycle[0] + '");\n')
 
             # Iterate on all nodes of the cycle
             for i in range(len(cycle) - 1):
 # FIXME
 #                # External event not leaving the current state
 #                if self.current.graph.has_edge(cycle[i], cycle[i]) and (cycle[i] != cycle[i+1]):
-#                    tr = self.current.graph[cycle[i]][cycle[i]]['data']
+#                    tr = self.current.graph.transition(cycle[i], cycle[i])
 #                    if tr.event.name != '':
 #                        self.indent(1), self.fd.write('LOGD("[' + self.current.class_name.upper() + ']// Event ' + tr.event.name + ' [' + tr.guard + ']: ' + cycle[i] + ' <--> ' + cycle[i] + '\\n");\n')
 #                        self.indent(1), self.fd.write('fsm.' + tr.event.caller('fsm') + ';')
@@ -1234,7 +3380,7 @@ class Parser(object):
 #                        self.indent(1), self.fd.write('ASSERT_STREQ(fsm.c_str(), "' + cycle[i] + '");\n')
 
                 # External event: print the name of the event + its guard
-                tr = self.current.graph[cycle[i]][cycle[i+1]]['data']
+                tr = self.current.graph.transition(cycle[i], cycle[i+1])
                 if tr.event.name != '':
                     self.fd.write('\n'), self.indent(1)
                     self.fd.write('LOGD("\\n[' + self.current.class_name.upper() + '] Triggering event ' + tr.event.name + ' [' + tr.guard + ']: ' + cycle[i] + ' ==> ' + cycle[i + 1] + '\\n");\n')
@@ -1243,7 +3389,7 @@ class Parser(object):
                 if (i == len(cycle) - 2):
                     # Cycle of non external evants => malformed state machine
                     # I think this case is not good
-                    if self.current.graph[cycle[i+1]][cycle[1]]['data'].event.name == '':
+                    if self.current.graph.transition(cycle[i+1], cycle[1]).event.name == '':
                         self.indent(1), self.fd.write('\n#warning "Malformed state machine: unreachable destination state"\n')
                     else:
                         # No explicit event => direct internal transition to the state if an explicit event can occures.
@@ -1253,57 +3399,61 @@ class Parser(object):
 
                 # No explicit event => direct internal transition to the state if an explicit event can occures.
                 # Else skip test for the destination state since we cannot test its internal state
-                elif self.current.graph[cycle[i+1]][cycle[i+2]]['data'].event.name != '':
+                elif self.current.graph.transition(cycle[i+1], cycle[i+2]).event.name != '':
                     self.indent(1), self.fd.write('LOGD("[UNIT TEST] Current state: %s\\n", fsm.c_str());\n')
                     self.indent(1), self.fd.write('ASSERT_EQ(fsm.state(), ' + self.state_enum(cycle[i+1]) + ');\n')
                     self.indent(1), self.fd.write('ASSERT_STREQ(fsm.c_str(), "' + cycle[i+1] + '");\n')
             self.fd.write('}\n\n')
 
     ###########################################################################
-    ### Generate checks on pathes to all sinks
+    ### Generate checks on test paths covering all transitions (and the pairs of
+    ### consecutive transitions when asked).
     ###########################################################################
-    def generate_unit_tests_pathes_to_sinks(self):
+    def generate_unit_tests_covering_paths(self):
         count = 0
-        pathes = self.current.graph_all_paths_to_sinks()
-        for path in pathes:
+        for path in self.current.graph_test_paths(self.options.pair_coverage):
+            states = [path[0].origin] + [tr.destination for tr in path]
             self.generate_line_separator(0, ' ', 80, '-')
             self.fd.write('TEST(' + self.current.class_name + 'Tests, TestPath' + str(count) + ')\n{\n')
             count += 1
-            # Print the path
+            # Print the path
             self.indent(1), self.fd.write('LOGD("===========================================\\n");\n')
             self.indent(1), self.fd.write('LOGD("Check path:')
-            for c in path:
+            for c in states:
                 self.fd.write(' ' + c)
             self.fd.write('\\n");\n')
             self.indent(1), self.fd.write('LOGD("===========================================\\n");\n')
 
-            # Reset the state machine and print the guard supposed to reach this state
+            # Reset the state machine and print the guard supposed to reach this state
             self.indent(1), self.fd.write('Mock' + self.current.class_name + ' ' + 'fsm;\n')
             self.generate_mocked_guards(path)
             self.fd.write('\n'), self.indent(1), self.fd.write('fsm.enter();\n')
 
-            # Iterate on all nodes of the path
-            for i in range(len(path) - 1):
-                event = self.current.graph[path[i]][path[i+1]]['data'].event
-                if event.name != '':
-                    guard = self.current.graph[path[i]][path[i+1]]['data'].guard
+            # Iterate on all transitions of the path
+            for i, tr in enumerate(path):
+                if tr.event.name != '':
                     self.fd.write('\n'), self.indent(1)
-                    self.fd.write('LOGD("[' + self.current.class_name.upper() + '] Event ' + event.name + ' [' + guard + ']: ' + path[i] + ' ==> ' + path[i + 1] + '\\n");\n')
-                    self.fd.write('\n'), self.indent(1), self.fd.write('fsm.' + event.caller() + ';\n')
-                if (i == len(path) - 2):
-                    self.indent(1), self.fd.write('LOGD("[UNIT TEST] Current state: %s\\n", fsm.c_str());\n')
-                    self.indent(1), self.fd.write('ASSERT_EQ(fsm.state(), ' + self.state_enum(path[i+1]) + ');\n')
-                    self.indent(1), self.fd.write('ASSERT_STREQ(fsm.c_str(), "' + path[i+1] + '");\n')
-                elif self.current.graph[path[i+1]][path[i+2]]['data'].event.name != '':
+                    self.fd.write('LOGD("[' + self.current.class_name.upper() + '] Event ' + tr.event.name + ' [' + tr.guard + ']: ' + tr.origin + ' ==> ' + tr.destination + '\\n");\n')
+                    self.fd.write('\n'), self.indent(1), self.fd.write('fsm.' + tr.event.caller('fsm') + ';\n')
+                # No explicit event after this state => direct internal
+                # transition: skip test for this state.
+                if path[i+1].event.name != '' if i != len(path) - 1 else \
+                   all(t.guard != '' or t.destination == tr.destination
+                       for t in self.current.graph.transitions_on(tr.destination, '')):
                     self.indent(1), self.fd.write('LOGD("[UNIT TEST] Current state: %s\\n", fsm.c_str());\n')
-                    self.indent(1), self.fd.write('ASSERT_EQ(fsm.state(), ' + self.state_enum(path[i+1]) + ');\n')
-                    self.indent(1), self.fd.write('ASSERT_STREQ(fsm.c_str(), "' + path[i+1] + '");\n')
+                    self.indent(1), self.fd.write('ASSERT_EQ(fsm.state(), ' + self.state_enum(tr.destination) + ');\n')
+                    self.indent(1), self.fd.write('ASSERT_STREQ(fsm.c_str(), "' + tr.destination + '");\n')
             self.fd.write('}\n\n')
 
     ###########################################################################
     ### Generate the main function doing unit tests
     ###########################################################################
     def generate_unit_tests_main_function(self, filename, files):
+        if self.options.profile == 'embedded':
+            self.generate_function_comment('Fault hook of the embedded profile: fail the test.')
+            self.fd.write('void fsm_fault(const char* reason)\n{\n')
+            self.indent(1), self.fd.write('ADD_FAILURE() << "State machine fault: " << reason;\n')
+            self.fd.write('}\n\n')
         self.generate_function_comment(
             'Compile with one of the following line:\n'
             '//! g++ --std=c++14 -Wall -Wextra -Wshadow '
@@ -1321,12 +3471,12 @@ class Parser(object):
     ### Generate the main function doing unit tests
     ###########################################################################
     def generate_unit_tests_main_file(self, filename, files):
-        self.fd = open(filename, 'w')
+        self.open_output(filename)
         self.fd.write('#include <gmock/gmock.h>\n')
         self.fd.write('#include <gtest/gtest.h>\n')
         self.fd.write('using namespace ::testing;\n\n')
         self.generate_unit_tests_main_function(filename, files)
-        self.fd.close()
+        self.close_output()
 
     ###########################################################################
     ### Code generator: Add an example of how using this state machine. It
@@ -1338,40 +3488,45 @@ class Parser(object):
     ###########################################################################
     def generate_unit_tests(self, cxxfile, files, separated):
         filename = self.current.class_name + 'Tests.cpp'
-        self.fd = open(os.path.join(os.path.dirname(cxxfile), filename), 'w')
+        self.open_output(os.path.join(os.path.dirname(cxxfile), filename))
         self.generate_unit_tests_header()
         self.generate_unit_tests_mocked_class()
-        self.generate_unit_tests_check_cycles()
-        self.generate_unit_tests_pathes_to_sinks()
+        if self.options.analysis:
+            self.generate_unit_tests_check_cycles()
+            self.generate_unit_tests_covering_paths()
         if not separated:
             self.generate_unit_tests_main_function(filename, files)
         self.generate_unit_tests_footer()
-        self.fd.close()
+        self.close_output()
 
     ###########################################################################
     ### Code generator: generate the code of the state machine
     ###########################################################################
     def generate_state_machine(self, cxxfile):
         hpp = self.is_hpp_file(cxxfile)
-        self.fd = open(cxxfile, 'w')
+        self.open_output(cxxfile)
         self.generate_header(hpp)
         self.generate_state_enums()
         self.generate_stringify_function()
         self.generate_state_machine_class()
         self.generate_footer(hpp)
-        self.fd.close()
+        self.close_output()
 
     ###########################################################################
     ### Code generator: entry point generating C++ files: state machine, tests,
     ### macros ...
     ### param[in] separated if False then the main() function is generated in
     ### the same file else in a separated.
+    ### param[in] machines the state machines to generate (the others are
+    ### up-to-date).
     ###########################################################################
-    def generate_cxx_code(self, cxxfile, separated):
+    def generate_cxx_code(self, cxxfile, separated, machines):
         files = []
         for self.current in self.machines.values():
             f = self.current.class_name + 'Tests.cpp'
             files.append(f)
+            if self.current.name not in machines:
+                continue
             f = self.current.class_name + '.' +  cxxfile
             self.generate_state_machine(f)
             self.generate_unit_tests(f, files, separated)
@@ -1389,29 +3544,19 @@ class Parser(object):
     ### allowed (non determinist switch condition).
     ###########################################################################
     def manage_noevents(self):
-        # Make unique the list of states that does not have event on their
-        # output edges
-        states = []
-        for state in list(self.current.graph.nodes()):
-            for dest in list(self.current.graph.neighbors(state)):
-                tr = self.current.graph[state][dest]['data']
-                if (tr.event.name == '') and (state not in states):
-                    states.append(state)
-
-        # Generate the internal transition in the entry action of the source state
-        for state in states:
+        # Generate the internal transition in the entry action of the source
+        # state of transitions without event
+        for state, transitions in self.current.index.noevents.items():
             count = 0 # count number of ways
             code = ''
-            for dest in list(self.current.graph.neighbors(state)):
-                tr = self.current.graph[state][dest]['data']
-                if tr.event.name != '':
-                   continue
+            for tr in transitions:
+                dest = tr.destination
                 if tr.guard != '':
                     if code == '':
                         code += '        if '
                     else :
                         code += '        else if '
-                    code += '(' + self.guard_function(state, dest) + '())\n'
+                    code += '(' + self.guard_function(tr) + '())\n'
                 elif tr.event.name == '': # Dummy event and dummy guard
                     if count == 1:
                         code += '\n#warning "Missformed state machine: missing guard from state ' + state + ' to state ' + dest + '"\n'
@@ -1425,12 +3570,12 @@ class Parser(object):
                     code += '            {\n'
                     code += '                .destination = ' + self.state_enum(dest) + ',\n'
                     if tr.action != '':
-                        code += '                .action = &' + self.transition_function(state, dest, True) + ',\n'
+                        code += '                .action = &' + self.transition_function(tr, True) + ',\n'
                     code += '            };\n'
                     code += '            transition(&tr);\n'
                     code += '        }\n'
                     count += 1
-            self.current.graph.nodes[state]['data'].internal += code
+            self.current.graph.state(state).internal += code
 
     ###########################################################################
     ### Check if the method name is not conflicting with a class method.
@@ -1438,25 +3583,18 @@ class Parser(object):
     def check_valid_method_name(self, name):
         s = name.split('(')[0]
         if s in ['start', 'stop', 'state', 'c_str', 'transition' ]:
-            self.warning('The C++ method name ' + name + ' is already used by the base class StateMachine')
+            self.current.warning('The C++ method name ' + name + ' is already used by the base class StateMachine')
 
     ###########################################################################
-    ### Parse the following plantUML code and store information of the analyse:
+    ### Store the following parsed plantUML code in the current state machine:
     ###    origin state -> destination state : event [ guard ] / action
     ###    destination state <- origin state : event [ guard ] / action
     ### In which event, guard and action are optional.
+    ### param[in] tr: the transition made by the ModelBuilder.
+    ### param[in] as_state: True if the transition comes from the plantUML code
+    ### "State : on event [ guard ] / action".
     ###########################################################################
-    def parse_transition(self, as_state = False):
-        tr = Transition()
-
-        tr.arrow = self.tokens[1]
-        if tr.arrow[-1] == '>':
-            # Analyse the following plantUML code: "origin state -> destination state ..."
-            tr.origin, tr.destination = self.tokens[0].upper(), self.tokens[2].upper()
-        else:
-            # Analyse the following plantUML code: "destination state <- origin state ..."
-            tr.origin, tr.destination = self.tokens[2].upper(), self.tokens[0].upper()
-
+    def parse_transition(self, tr, as_state = False):
         # Initial/final states
         if tr.origin == '[*]':
             self.current.initial_state = '[*]'
@@ -1469,95 +3607,66 @@ class Parser(object):
         self.current.add_state(tr.destination)
 
         # Analyse the following optional plantUML code: ": event [ guard ] / action"
-        for i in range(3, len(self.tokens)):
-            if self.tokens[i] == '#event':
-                N = int(self.tokens[i+1])
-                tr.event.parse(self.tokens[i+2:i+2+N])
-                self.check_valid_method_name(tr.event.name)
-                # Make the main state machine broadcast external events to nested state machine
-                if self.current.parent != None:
-                    self.master.broadcasts.append((self.current.name, tr.event))
-                # Events are optional. If not given, we use them as anonymous internal event.
-                # Store them in a dictionary: "event => (origin, destination) states" to create
-                # the state transition for each event.
-                self.current.lookup_events[tr.event].append((tr.origin, tr.destination))
-            elif self.tokens[i] == '#guard':
-                tr.guard = self.tokens[i + 1][1:-1].strip() # Remove [ and ]
-                self.check_valid_method_name(tr.guard)
-            elif self.tokens[i] == '#uml_action':
-                tr.action = self.tokens[i + 1][1:].strip() # Remove /
-                self.check_valid_method_name(tr.action)
-            elif self.tokens[i] == '#std_action':
-                tr.action = self.tokens[i + 1][6:].strip() # Remove \n--\n
-                self.check_valid_method_name(tr.action)
-
-            # Distinguish a transition cycling to its own state from the "on event" on the state
-            if as_state and (tr.origin == tr.destination):
-                if tr.action == '':
-                    tr.action = '// Dummy action\n'
-                    tr.action += '#warning "no reaction to event ' + tr.event.name
-                    tr.action += ' for internal transition ' + tr.origin + ' -> '
-                    tr.action += tr.origin + '"\n'
+        if tr.event.name != '':
+            self.check_valid_method_name(tr.event.name)
+            # Events are optional. If not given, we use them as anonymous internal event.
+            # Store them in a dictionary: "event => transitions" to create the state
+            # transition for each event.
+            self.current.lookup_events[tr.event].append(tr)
+        if tr.guard != '':
+            self.check_valid_method_name(tr.guard)
+        if tr.action != '':
+            self.check_valid_method_name(tr.action)
+
+        # Distinguish a transition cycling to its own state from the "on event" on the state
+        if as_state and (tr.origin == tr.destination):
+            if tr.action == '':
+                tr.action = '// Dummy action\n'
+                tr.action += '#warning "no reaction to event ' + tr.event.name
+                tr.action += ' for internal transition ' + tr.origin + ' -> '
+                tr.action += tr.origin + '"\n'
 
         # Store parsed information as edge of the graph
         self.current.add_transition(tr)
-        self.tokens = []
 
     ###########################################################################
-    ### Parse the following plantUML code and store information of the analyse.
-    ### param[in] inst: node of the AST.
+    ### Store the following parsed plantUML code in the current state machine.
+    ### param[in] name: the name of the state.
+    ### param[in] what: the kind of state action ('entry', 'exit', 'comment',
+    ### 'activity').
+    ### param[in] code: the code of the action.
     ### Example:
     ###    State : entry / action
     ###    State : exit / action
-    ###    State : on event [ guard ] / action
     ###    State : do / activity
     ### We also offering some unofficial alternative name:
     ###    State : entering / action
     ###    State : leaving / action
-    ###    State : event event [ guard ] / action
     ###    State : activity / activity
     ###    State : comment / C++ comment
-    ### FIXME: limitation only one "State : on event [ guard ] / action" allowed!
+    ### Note: "State : on event [ guard ] / action" is managed by
+    ### parse_transition().
     ###########################################################################
-    def parse_state(self, inst):
-        # Sparse test for inst.data in ['state_entry', 'state_exit' ...]
-        what = inst.data[6:]
-        # State name
-        name = inst.children[0].upper()
+    def parse_state(self, name, what, code):
         # Create first a node if it does not exist. This is the simplest way
         # preventing smashing previously initialized values.
         self.current.add_state(name)
         # Update state fields
-        state = self.current.graph.nodes[name]['data']
-        if what in ['entry', 'entering']:
+        state = self.current.graph.state(name)
+        if what == 'entry':
             state.entering += '        '
-            state.entering += inst.children[1].children[0][1:].strip()
+            state.entering += code
             state.entering += ';\n'
-        elif what in ['exit', 'leaving']:
+        elif what == 'exit':
             state.leaving += '        '
-            state.leaving += inst.children[1].children[0][1:].strip()
+            state.leaving += code
             state.leaving += ';\n'
         elif what == 'comment':
-            state.comment += inst.children[1].children[0][1:].strip()
-        elif what in ['do', 'activity']:
-            state.activity += inst.children[1].children[0][1:].strip()
-        # 'on event' is not sugar syntax to a real transition: since it disables
-        # 'entry' and 'exit' actions but we want create a real graph edege to
-        # help us on graph theory traversal algorithm (like finding cycles) for
-        # unit tests.
-        elif what in ['on', 'event']:
-            self.tokens = [ name, '->', name ]
-            for i in range(1, len(inst.children)):
-                self.tokens.append('#' + str(inst.children[i].data))
-                if inst.children[i].data != 'event':
-                    self.tokens.append(str(inst.children[i].children[0]))
-                else:
-                    self.tokens.append(str(len(inst.children[i].children)))
-                    for j in inst.children[i].children:
-                        self.tokens.append(str(j))
-            self.parse_transition(True)
+            state.comment += code
+        elif what == 'activity':
+            state.activity += code
         else:
-            self.fatal('Bad syntax describing a state. Unkown token "' + inst.data + '"')
+            self.fatal('Bad syntax describing a state. Unkown token "' + what + '"')
 
     ###########################################################################
     ### Extend the PlantUML single-line comments to add extra commands to help
@@ -1585,6 +3694,11 @@ class Parser(object):
     ###   '[init] bar.x = 42;
     ### Unit tests:
     ###   '[test] MockMotorController() : MotorController(42) {}
+    ### Bounded variables explored by the model checker (--check), with an
+    ### optional initial value (default: the minimum):
+    ###   '[var] int quarters 0..10
+    ###   '[var] int speed -5..5 = 0
+    ###   '[var] bool on = true
     ###########################################################################
     def parse_extra_code(self, token, code):
         if token == '[brief]':
@@ -1616,139 +3730,824 @@ class Parser(object):
         elif token == '[test]':
             self.current.extra_code.unit_tests += code
             self.current.extra_code.unit_tests += '\n'
+        elif token == '[var]':
+            self.parse_variable(code)
         else:
             self.fatal('Token ' + token + ' not yet managed')
 
     ###########################################################################
-    ### Traverse the Abstract Syntax Tree (AST) of the PlantUML file.
-    ### param[in] inst: node of the AST.
-    ###########################################################################
-    def visit_ast(self, inst):
-        # Parse markers for collecting lines of C++ code
-        if inst.data == 'cpp':
-            self.parse_extra_code(str(inst.children[0]), inst.children[1].strip())
-        # Parse a statechart transition
-        elif inst.data == 'transition':
-            # Note: we have to convert into a list of tokens since parse_state()
-            # can call parse_transition() with a generated code and we do not
-            # reuse the parser to create a temporary AST, instead we pass list
-            # of tokens. TODO: ok this is dirty!
-            self.tokens = [str(inst.children[0]), str(inst.children[1]), str(inst.children[2])]
-            for i in range(3, len(inst.children)):
-                self.tokens.append('#' + str(inst.children[i].data))
-                if inst.children[i].data != 'event':
-                    # guard and actions
-                    self.tokens.append(str(inst.children[i].children[0]))
-                else:
-                    # event can comes in severval tokens
-                    self.tokens.append(str(len(inst.children[i].children)))
-                    for j in inst.children[i].children:
-                        self.tokens.append(str(j))
-            self.parse_transition(False)
-        # Composite and orthogonal states. Thanks to the iteration we can create a new
-        # file holding the nesting state.
-        elif inst.data == 'state_block':
-            # Begin of the recursive operation: save the current state machine
-            backup_fsm = self.current
-            # Make the parser knows the list of state machine (one generated file by state machine)
-            self.current = StateMachine()
-            # Set the new name
-            self.current.name = str(inst.children[0])
-            self.current.class_name = 'Nested' + self.current.name
-            self.current.enum_name = self.current.class_name + 'States'
-            self.machines[self.current.name] = self.current
-            # Create links parent and sibling
-            self.current.parent = backup_fsm
-            backup_fsm.children.append(self.current)
-            # Recursive operation: iterate on the AST
-            for c in inst.children[1:]:
-                self.visit_ast(c)
-            # Begin of the recursive operation: restore the current state machine
-            self.current = backup_fsm
-        # Parse a statechart state
-        elif inst.data[0:6] == 'state_':
-            self.parse_state(inst)
-        # Skip undesired PlantUML syntax
-        elif inst.data in ['comment', 'skin', 'hide']:
-            return
-        else:
-            self.fatal('Token ' + inst.data + ' not yet managed. Please open a GitHub ticket to manage it')
+    ### Store a bounded variable of the model checker (see parse_extra_code()).
+    ### param[in] code: the declaration "type name minimum..maximum = initial".
+    ###########################################################################
+    def parse_variable(self, code):
+        match = re.fullmatch(r'(.+?)\s+([A-Za-z_]\w*)(?:\s+(-?\d+)\s*\.\.\s*(-?\d+))?'
+                             r'(?:\s*=\s*(-?\d+|true|false))?\s*', code)
+        if match == None:
+            self.fatal('Bad variable declaration "' + code + '". Expected "type name minimum..maximum"')
+        kind, name, low, high, initial = match.groups()
+        if kind == 'bool':
+            if low != None:
+                self.fatal('The boolean variable ' + name + ' shall not have a range')
+            low, high = 0, 1
+        elif low == None:
+            self.fatal('The variable ' + name + ' shall have a range "minimum..maximum"')
+        low, high = int(low), int(high)
+        initial = low if initial == None else { 'true': 1, 'false': 0 }.get(initial, None)
+        if initial == None:
+            initial = int(match.group(5))
+        if low > high or not low <= initial <= high:
+            self.fatal('Bad range of the variable ' + name)
+        if any(v[1] == name for v in self.current.extra_code.variables):
+            self.fatal('The variable ' + name + ' is declared twice')
+        self.current.extra_code.variables.append((kind, name, low, high, initial))
 
     ###########################################################################
-    ### Entry point for translating a plantUML file into a C++ source file.
+    ### Begin of a composite state "state Name {": its content belongs to a new
+    ### nested state machine which becomes the current one. We create a new
+    ### file holding the nesting state.
+    ### param[in] name: the name of the composite state.
+    ###########################################################################
+    def begin_composite_state(self, name):
+        parent = self.current
+        # Make the parser knows the list of state machine (one generated file by state machine)
+        self.current = StateMachine()
+        # Set the new name
+        self.name_machine(self.current, name)
+        self.current.composite = name.upper()
+        # Create links parent and sibling
+        self.current.parent = parent
+        parent.children.append(self.current)
+
+    ###########################################################################
+    ### Name a nested state machine: set its name, the name of its C++ class and
+    ### of its enumerate, and register it in the dictionary of state machines.
+    ### param[in] sm: the nested state machine.
+    ### param[in] name: its new name.
+    ###########################################################################
+    def name_machine(self, sm, name):
+        self.machines.pop(sm.name, None)
+        sm.name = name
+        sm.class_name = 'Nested' + name
+        sm.enum_name = sm.class_name + 'States'
+        self.machines[name] = sm
+
+    ###########################################################################
+    ### Separator "--" or "||" of the orthogonal regions of a composite state:
+    ### the next region is a new nested state machine of the same composite
+    ### state. Regions are named after the composite state: FooRegion1,
+    ### FooRegion2 ...
+    ###########################################################################
+    def begin_region(self):
+        region = self.current
+        if region.parent == None:
+            self.fatal('Orthogonal regions shall be inside a composite state')
+        regions = [sm for sm in region.parent.children if sm.composite == region.composite]
+        if len(regions) == 1:
+            self.name_machine(region, region.name + 'Region1')
+        self.current = StateMachine()
+        self.name_machine(self.current, region.name[:region.name.rfind('Region')] + 'Region' +
+                          str(len(regions) + 1))
+        self.current.composite, self.current.parent = region.composite, region.parent
+        region.parent.children.append(self.current)
+
+    ###########################################################################
+    ### Generate the orthogonal regions of composite states: either as a product
+    ### state machine (a single table lookup by event, see
+    ### StateMachine.product()) or as nested state machines receiving the
+    ### events in sequence (the number of states is the sum of the numbers of
+    ### states of the regions instead of their product). The size of the product
+    ### is estimated by the product of the numbers of states of the regions.
+    ### Flattened state machines need product state machines.
+    ###########################################################################
+    def compose_regions(self):
+        # Deepest state machines first (regions holding orthogonal regions)
+        for parent in reversed(list(self.machines.values())):
+            composites = defaultdict(list)
+            for sm in parent.children:
+                composites[sm.composite].append(sm)
+            for composite, regions in composites.items():
+                if len(regions) == 1:
+                    continue
+                size = 1
+                for region in regions:
+                    size *= len(region.graph.names) - region.graph.has_state('[*]')
+                mode = self.options.regions
+                if self.options.flatten:
+                    mode = 'product'
+                elif mode == 'auto':
+                    mode = 'product' if size <= MAX_PRODUCT_STATES else 'parallel'
+                print('   State machine ' + parent.name + ': the composite state ' + composite + ' has ' +
+                      str(len(regions)) + ' orthogonal regions, ' + str(size) + ' states in their product: ' +
+                      ('product state machine' if mode == 'product' else 'state machines dispatched in sequence'))
+                if mode != 'product':
+                    continue
+                sm = parent.product(regions)
+                name = regions[0].name[:regions[0].name.rfind('Region')]
+                index = parent.children.index(regions[0])
+                parent.children = [c for c in parent.children if c not in regions]
+                parent.children.insert(index, sm)
+                # Keep the order of the state machines (generated files)
+                machines, self.machines = self.machines, dict()
+                for key, machine in machines.items():
+                    if machine is regions[0]:
+                        self.name_machine(sm, name)
+                    elif machine not in regions:
+                        self.machines[key] = machine
+
+    ###########################################################################
+    ### Make the parent state machines broadcast the external events of their
+    ### nested state machines (any depth): each state machine forwards them to
+    ### its nested state machines.
+    ###########################################################################
+    def set_broadcasts(self):
+        for sm in self.machines.values():
+            for event in sm.lookup_events:
+                child = sm
+                while child.parent != None:
+                    if (child.name, event) not in child.parent.broadcasts:
+                        child.parent.broadcasts.append((child.name, event))
+                    child = child.parent
+
+    ###########################################################################
+    ### End of a composite state "}": restore the parent state machine.
+    ###########################################################################
+    def end_composite_state(self):
+        self.current = self.current.parent
+
+    ###########################################################################
+    ### Read the grammar file for parsing plantUML statecharts. The file is
+    ### searched in the current folder.
+    ### return the tuple (grammar, SHA256 of the grammar).
+    ###########################################################################
+    def read_grammar(self):
+        grammar_file = os.path.join(os.getcwd(), 'statecharts.ebnf')
+        if not os.path.isfile(grammar_file):
+            self.fatal('File path ' + grammar_file + ' does not exist!')
+        try:
+            self.fd = open(grammar_file)
+            grammar = self.fd.read()
+            self.fd.close()
+        except Exception as FileNotFoundError:
+            self.fatal('Failed loading grammar file ' + grammar_file + ' for parsing plantuml statechart')
+        return grammar, hashlib.sha256(grammar.encode('utf-8')).hexdigest()
+
+    ###########################################################################
+    ### Return the path of the file caching the analyzed LALR grammar. The
+    ### file name holds the SHA256 of the grammar: a modified grammar file will
+    ### never reuse an obsolete cache. Lark also checks this hash when loading
+    ### the cache and rebuilds it when it mismatches.
+    ### param[in] digest the SHA256 of the grammar.
+    ### return the path of the cache file.
+    ###########################################################################
+    def grammar_cache_file(self, digest):
+        folder = cache_folder()
+        if folder == None:
+            # Read-only home folder: let Lark fall back on a temporary file.
+            return True
+        return os.path.join(folder, 'grammar-' + digest[:16] + '.lark')
+
+    ###########################################################################
+    ### Load the standalone parser generated by generate_standalone_parser()
+    ### from the current folder. This module does not depend on Lark.
+    ### param[in] digest the SHA256 of the current grammar.
+    ### return the parser or None if the module is missing or has been
+    ### generated from another grammar.
+    ###########################################################################
+    def load_standalone_parser(self, digest):
+        path = os.path.join(os.getcwd(), STANDALONE_PARSER)
+        if not os.path.isfile(path):
+            return None
+        spec = importlib.util.spec_from_file_location('statecharts_parser', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if getattr(module, 'GRAMMAR_SHA256', '') != digest:
+            print(f"{bcolors.WARNING}   WARNING: " + path + " is outdated compared to " \
+                  "the grammar file. Regenerate it with --standalone" + f"{bcolors.ENDC}")
+            return None
+        return module.Lark_StandAlone(transformer=ModelBuilder(self))
+
+    ###########################################################################
+    ### Make the parser understand the plantUML grammar. The standalone parser
+    ### is preferred since it avoids importing the Lark grammar compiler. Else
+    ### the LALR parser is built by Lark (or loaded from its cache). In both
+    ### cases, the ModelBuilder is called while parsing.
+    ###########################################################################
+    def load_parser(self):
+        grammar, digest = self.read_grammar()
+        self.parser = self.load_standalone_parser(digest)
+        if self.parser == None:
+            from lark import Lark
+            self.parser = Lark(grammar, parser='lalr', transformer=ModelBuilder(self),
+                               cache=self.grammar_cache_file(digest))
+
+    ###########################################################################
+    ### Build step: generate the standalone parser module (Python code not
+    ### depending on Lark) from the grammar file of the current folder. The
+    ### SHA256 of the grammar is stored in the module to detect outdated
+    ### modules. The module is also byte-compiled.
+    ### param[in] output: path of the generated Python module.
+    ###########################################################################
+    def generate_standalone_parser(self, output):
+        from lark import Lark
+        from lark.tools.standalone import gen_standalone
+        import py_compile
+        grammar, digest = self.read_grammar()
+        self.fd = open(output, 'w')
+        self.fd.write('# This file as been generated from statecharts.ebnf. Do not edit it!\n')
+        gen_standalone(Lark(grammar, parser='lalr'), out=self.fd)
+        self.fd.write("\nGRAMMAR_SHA256 = '" + digest + "'\n")
+        self.fd.close()
+        # Compile the module now: loading its byte code is faster than parsing
+        # its code (even when Python is not allowed to write byte code).
+        py_compile.compile(output, doraise=True)
+
+    ###########################################################################
+    ### Return the files read by the translation of a plantUML file (for build
+    ### systems): the plantUML file, the grammar, the standalone parser module
+    ### when present and the translator itself. Paths are absolute.
+    ### param[in] uml_file: path to the plantuml file.
+    ###########################################################################
+    def dependencies(self, uml_file):
+        files = [uml_file, 'statecharts.ebnf', STANDALONE_PARSER, __file__]
+        return [os.path.abspath(f) for f in files if os.path.isfile(f)]
+
+    ###########################################################################
+    ### Return the key of a translation in the cache: the SHA256 of everything
+    ### the generated files depend on: the translator code (its version), the
+    ### grammar, the plantUML file (its content and its path which is written
+    ### in generated files) and the options of the translation (all the fields
+    ### of Options).
+    ### param[in] uml_file, cpp_or_hpp, postfix: see translate().
+    ###########################################################################
+    def translation_key(self, uml_file, cpp_or_hpp, postfix):
+        key = hashlib.sha256()
+        with open(os.path.abspath(__file__), 'rb') as f:
+            key.update(f.read())
+        key.update(self.read_grammar()[1].encode('utf-8'))
+        with open(uml_file, 'rb') as f:
+            key.update(hashlib.sha256(f.read()).digest())
+        options = [uml_file, cpp_or_hpp, postfix]
+        options += [name + '=' + str(value) for name, value in sorted(vars(self.options).items())]
+        for option in options:
+            key.update(b'\0' + option.encode('utf-8'))
+        return key.hexdigest()
+
+    ###########################################################################
+    ### Cache hit: copy the files generated by a previous identical translation
+    ### and display its warnings again.
+    ### param[in] entry the folder of the translation in the cache.
+    ### return False if the cache does not hold this translation.
+    ###########################################################################
+    def restore_from_cache(self, entry):
+        manifest = os.path.join(entry, 'manifest.json')
+        if not os.path.isfile(manifest):
+            return False
+        with open(manifest) as f:
+            manifest = json.load(f)
+        for i, path in enumerate(manifest['files']):
+            # Copy instead of hard linking: editing a generated file shall not
+            # modify the cache.
+            with open(os.path.join(entry, str(i)), 'r') as f:
+                write_if_changed(path, f.read())
+            self.outputs.append(path)
+        self.warnings = manifest['warnings']
+        for name, msg in self.warnings:
+            print(f"{bcolors.WARNING}   WARNING in the state machine " + name \
+                  + ": "  + msg + f"{bcolors.ENDC}")
+        return True
+
+    ###########################################################################
+    ### Store the generated files and the warnings of the translation in the
+    ### cache. The entry is created in a temporary folder then renamed to be
+    ### atomic for concurrent translations.
+    ### param[in] entry the folder of the translation in the cache.
+    ###########################################################################
+    def store_in_cache(self, entry):
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(entry))
+        for i, path in enumerate(self.outputs):
+            shutil.copyfile(path, os.path.join(tmp, str(i)))
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump({ 'files': self.outputs, 'warnings': self.warnings }, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError: # Already stored by a concurrent translation
+            shutil.rmtree(tmp)
+
+    ###########################################################################
+    ### Parse a plantUML file and create the graph structure of its state
+    ### machines (main and nested ones).
     ### param[in] uml_file: path to the plantuml file.
-    ### param[in] cpp_or_hpp: generated a C++ source file ('cpp') or a C++ header file ('hpp').
     ### param[in] postfix: postfix name for the state machine name.
     ###########################################################################
-    def translate(self, uml_file, cpp_or_hpp, postfix):
+    def parse_plantuml_file(self, uml_file, postfix):
         # Make the parser understand the plantUML grammar
         if self.parser == None:
-            grammar_file = os.path.join(os.getcwd(), 'statecharts.ebnf')
-            if not os.path.isfile(grammar_file):
-                self.fatal('File path ' + grammar_file + ' does not exist!')
-            try:
-                self.fd = open(grammar_file)
-                self.parser = Lark(self.fd.read())
-                self.fd.close()
-            except Exception as FileNotFoundError:
-                self.fatal('Failed loading grammar file ' + grammar_file + ' for parsing plantuml statechart')
+            self.load_parser()
         # Make the parser read the plantUML file
         if not os.path.isfile(uml_file):
             self.fatal('File path ' + uml_file + ' does not exist!')
         self.uml_file = uml_file
-        self.fd = open(self.uml_file, 'r')
-        self.ast = self.parser.parse(self.fd.read())
-        self.fd.close()
+        self.machines = dict()
         # Create the main state machine
         self.current = StateMachine()
-        self.current.name = Path(uml_file).stem
+        self.current.name = os.path.splitext(os.path.basename(uml_file))[0]
         self.current.class_name = self.current.name + postfix
         self.current.enum_name = self.current.class_name + 'States'
         self.master = self.current
         self.machines[self.current.name] = self.current
-        # Traverse the AST to create the graph structure of the state machine
-        # Uncomment to see AST: print(self.ast.pretty())
-        for inst in self.ast.children:
-            self.visit_ast(inst)
+        # Parse the plantUML file: the ModelBuilder creates the graph structure
+        # of the state machines while parsing.
+        self.fd = open(self.uml_file, 'r')
+        self.parser.parse(self.fd.read())
+        self.fd.close()
+        self.compose_regions()
+        self.set_broadcasts()
+        # The graphs are no longer modified: index them once for all stages.
+        for sm in self.machines.values():
+            sm.build_index()
+
+    ###########################################################################
+    ### Entry point for translating a plantUML file into a C++ source file.
+    ### param[in] uml_file: path to the plantuml file.
+    ### param[in] cpp_or_hpp: generated a C++ source file ('cpp') or a C++ header file ('hpp').
+    ### param[in] postfix: postfix name for the state machine name.
+    ### param[in] options: the options of the translation (see Options), None
+    ### for the default ones.
+    ### param[in] cache_dir: if not None, the folder caching translations.
+    ### An unchanged translation is copied from the cache, skipping parsing,
+    ### analysis and generation.
+    ### param[in] signatures: if not None, the dictionary of signatures of the
+    ### state machines of the previous translation of this file, updated by
+    ### this function. Only the state machines having a different signature are
+    ### analyzed and generated (incremental translation of the watch mode).
+    ###########################################################################
+    def translate(self, uml_file, cpp_or_hpp, postfix, options=None, cache_dir=None,
+                  signatures=None):
+        self.options = options if options != None else Options()
+        self.outputs = []
+        self.warnings = []
+        if self.options.profile == 'embedded' and self.options.dispatch == 'map':
+            self.fatal('The embedded profile does not support std::multimap: choose another dispatch')
+        if cache_dir != None:
+            if not os.path.isfile(uml_file):
+                self.fatal('File path ' + uml_file + ' does not exist!')
+            key = self.translation_key(uml_file, cpp_or_hpp, postfix)
+            entry = os.path.join(cache_dir, key[:2], key)
+            if self.restore_from_cache(entry):
+                return
+        self.parse_plantuml_file(uml_file, postfix)
+        if self.options.flatten and len(self.master.flatten()) != 0:
+            self.machines = { self.master.name: self.master }
+        # Incremental translation: skip unchanged state machines
+        machines, changes = self.machines, dict()
+        if signatures != None:
+            machines, changes = self.changed_machines(signatures)
         # Do some operation on the state machine
-        for self.current in self.machines.values():
-            self.current.is_determinist()
+        for self.current in machines.values():
+            if self.options.analysis:
+                self.current.cycles = self.current.graph_cycles(self.options.max_cycles,
+                                                                self.options.max_cycle_length)
+                self.current.is_determinist()
+            if self.options.check:
+                self.current.verify_model()
+            if self.options.minimize and len(self.current.minimize()) != 0 and self.options.analysis:
+                self.current.cycles = self.current.graph_cycles(self.options.max_cycles,
+                                                                self.options.max_cycle_length)
             self.manage_noevents()
         # Generate the C++ code
-        self.generate_cxx_code(cpp_or_hpp, False)
+        self.generate_cxx_code(cpp_or_hpp, False, machines)
         # Generate the interpreted plantuml code
-        self.generate_plantuml_file()
+        self.generate_plantuml_file(machines)
+        self.warnings = [(sm.name, w) for sm in self.machines.values() for w in sm.warnings]
+        save_guard_results()
+        if signatures != None:
+            signatures.clear()
+            signatures.update(changes)
+        if cache_dir != None:
+            self.store_in_cache(entry)
+
+    ###########################################################################
+    ### Incremental translation: compare the signatures of the parsed state
+    ### machines with the ones of the previous translation.
+    ### param[in] signatures: the signatures of the previous translation.
+    ### return the tuple (dictionary of modified state machines, dictionary of
+    ### the new signatures).
+    ###########################################################################
+    def changed_machines(self, signatures):
+        machines, changes, files = dict(), dict(), []
+        for name, sm in self.machines.items():
+            files.append(sm.class_name)
+            changes[name] = sm.signature(list(files))
+            if signatures.get(name) != changes[name]:
+                machines[name] = sm
+        return machines, changes
 
 ###############################################################################
-### Display command line usage
+### Batch mode: parser reused by all translations made by the current process
+### (inherited from the main process when worker processes are forked).
 ###############################################################################
-def usage():
-    print('Command line: ' + sys.argv[0] + ' <plantuml file> cpp|hpp [postfix]')
-    print('Where:')
-    print('   <plantuml file>: the path of a plantuml statechart')
-    print('   "cpp" or "hpp": to choose between generating a C++ source file or a C++ header file')
-    print('   [postfix]: is an optional postfix to extend the name of the state machine class')
-    print('Example:')
-    print('   sys.argv[1] foo.plantuml cpp Bar')
-    print('Will create a FooBar.cpp file with a state machine name FooBar')
-    sys.exit(-1)
+batch_parser = None
 
 ###############################################################################
-### Entry point.
-### argv[1] Mandatory: path of the state machine in plantUML format.
-### argv[2] Mandatory: path of the C++ file to create.
-### argv[3] Optional: Postfix name for the state machine class.
-###############################################################################
-def main():
-    argc = len(sys.argv)
-    if argc < 3:
-        usage()
-    if sys.argv[2] not in ['cpp', 'hpp']:
-        print('Invalid ' + sys.argv[2] + '. Please set instead "cpp" (for generating a C++ source file) or "hpp" (for generating a C++ header file)')
-        usage()
+### Parsers already loaded by the current process, indexed by the SHA256 of
+### their grammar. The daemon mode keeps them warm between requests.
+###############################################################################
+loaded_parsers = dict()
 
+###############################################################################
+### Return a parser having loaded the grammar file of the current folder. The
+### grammar is only loaded once per process (as long as it is not modified).
+###############################################################################
+def warm_parser():
     p = Parser()
-    p.translate(sys.argv[1], sys.argv[2], '' if argc == 3 else sys.argv[3])
+    digest = p.read_grammar()[1]
+    if digest not in loaded_parsers:
+        p.load_parser()
+        loaded_parsers[digest] = p
+    return loaded_parsers[digest]
+
+###############################################################################
+### Batch mode: translate a plantUML file (see Parser.translate()). The console
+### output is captured to be displayed with the results of the file.
+### return the tuple (file, generated files, warnings, console output, success,
+### read files).
+###############################################################################
+def translate_in_batch(uml_file, cpp_or_hpp, postfix, options, cache_dir):
+    global batch_parser
+    if batch_parser == None:
+        batch_parser = Parser()
+    console = io.StringIO()
+    success = True
+    with contextlib.redirect_stdout(console):
+        try:
+            batch_parser.translate(uml_file, cpp_or_hpp, postfix, options, cache_dir)
+        except SystemExit:
+            success = False
+        except Exception as e:
+            print(f"{bcolors.FAIL}   FATAL: " + type(e).__name__ + ': ' + str(e) + f"{bcolors.ENDC}")
+            success = False
+    return (uml_file, list(batch_parser.outputs), list(batch_parser.warnings),
+            console.getvalue(), success, batch_parser.dependencies(uml_file))
+
+###############################################################################
+### Batch mode: return the list of plantUML files from the command line. Each
+### path can be a file, a folder (its *.plantuml files) or a glob pattern.
+### The *-interpreted.plantuml files generated by the translator are ignored.
+###############################################################################
+def plantuml_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = sorted(glob.glob(os.path.join(path, '*.plantuml')))
+        elif any(c in path for c in '*?['):
+            found = sorted(glob.glob(path))
+        else:
+            files.append(path)
+            continue
+        files += [f for f in found if not f.endswith('-interpreted.plantuml')]
+    return files
+
+###############################################################################
+### Batch mode: translate several plantUML files in a single process or in a
+### pool of jobs processes. The grammar is loaded once before forking.
+### Results and warnings are displayed file by file.
+### return the list of tuples returned by translate_in_batch().
+###############################################################################
+def translate_files(files, cpp_or_hpp, postfix, options, cache_dir, jobs):
+    global batch_parser
+    batch_parser = warm_parser()
+    args = (cpp_or_hpp, postfix, options, cache_dir)
+    if jobs <= 1:
+        results = (translate_in_batch(f, *args) for f in files)
+    else:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        results = pool.map(translate_in_batch, files, *[[a] * len(files) for a in args])
+    results = list(results)
+    failures = 0
+    for uml_file, outputs, warnings, console, success, inputs in results:
+        if success:
+            print(f"{bcolors.OKGREEN}" + uml_file + ': ' + str(len(outputs)) + ' generated files, ' +
+                  str(len(warnings)) + ' warnings' + f"{bcolors.ENDC}")
+        else:
+            print(f"{bcolors.FAIL}" + uml_file + ': failed' + f"{bcolors.ENDC}")
+            failures += 1
+        sys.stdout.write(console)
+    if jobs > 1:
+        pool.shutdown()
+    print(str(len(files)) + ' files translated, ' + str(failures) + ' failed')
+    return results
+
+###############################################################################
+### Write a depfile in the Makefile syntax (also understood by ninja): for each
+### translation, the generated files depend on the files read. An empty rule
+### is added for each read file to not break the build when one is removed.
+### Generated files are named as the translator created them (relative to the
+### current folder). Read files have absolute paths.
+### param[in] path: the path of the depfile.
+### param[in] results: the translations (see translate_in_batch()).
+###############################################################################
+def write_depfile(path, results):
+    escape = lambda f: f.replace(' ', '\\ ')
+    rules, phony = '', []
+    for uml_file, outputs, warnings, console, success, inputs in results:
+        if not success:
+            continue
+        rules += ' '.join(map(escape, outputs)) + ': ' + ' '.join(map(escape, inputs)) + '\n'
+        phony += [f for f in inputs if f not in phony]
+    for f in phony:
+        rules += '\n' + escape(f) + ':\n'
+    write_if_changed(path, rules)
+
+###############################################################################
+### Write a JSON manifest of the translations: for each plantUML file, the
+### files read, the generated files, the warnings and the success.
+### param[in] path: the path of the manifest.
+### param[in] results: the translations (see translate_in_batch()).
+###############################################################################
+def write_manifest(path, results):
+    translations = []
+    for uml_file, outputs, warnings, console, success, inputs in results:
+        translations.append({ 'plantuml': uml_file, 'success': success, 'inputs': inputs,
+                              'outputs': outputs, 'warnings': warnings })
+    write_if_changed(path, json.dumps({ 'translations': translations }, indent=2) + '\n')
+
+###############################################################################
+### Watch mode: translate the plantUML files each time they are modified. Files
+### are polled (no dependency on inotify) and only the modified state machines
+### of a modified file are generated again. Stopped by Ctrl+C.
+### param[in] paths: files, folders or glob patterns (see plantuml_files()).
+### param[in] cpp_or_hpp, postfix, options: see Parser.translate().
+### param[in] period: polling period in seconds.
+###############################################################################
+def watch(paths, cpp_or_hpp, postfix, options, period):
+    import time
+    p = warm_parser()
+    mtimes = dict()     # plantUML file => date of modification
+    signatures = dict() # plantUML file => signatures of its state machines
+    print('Watching ' + ' '.join(paths) + ' (Ctrl+C to stop)')
+    try:
+        while True:
+            for uml_file in plantuml_files(paths):
+                try:
+                    mtime = os.stat(uml_file).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                if mtimes.get(uml_file) == mtime:
+                    continue
+                mtimes[uml_file] = mtime
+                start = time.time()
+                try:
+                    p.translate(uml_file, cpp_or_hpp, postfix, options, None,
+                                signatures.setdefault(uml_file, dict()))
+                except SystemExit:
+                    # Fatal error already displayed: wait for the next save.
+                    signatures[uml_file] = dict()
+                    continue
+                except Exception as e:
+                    print(f"{bcolors.FAIL}   FATAL: " + type(e).__name__ + ': ' + str(e) + f"{bcolors.ENDC}")
+                    signatures[uml_file] = dict()
+                    continue
+                print(f"{bcolors.OKGREEN}" + uml_file + ': ' + str(len(p.outputs)) +
+                      ' generated files in ' + str(int((time.time() - start) * 1000)) +
+                      ' ms' + f"{bcolors.ENDC}")
+            time.sleep(period)
+    except KeyboardInterrupt:
+        pass
+
+###############################################################################
+### Daemon mode: answer to translation requests sent by statecharts_client.py
+### on a Unix socket. The translator stays in memory: modules are imported and
+### grammars are loaded once. Requests are served one by one.
+### Protocol: one JSON line per connection in each direction.
+###   request: { "cwd": folder, "argv": command line arguments } or
+###            { "stop": true } to stop the daemon.
+###   answer: { "status": exit code, "console": console output,
+###             "outputs": generated files, "warnings": [machine, message] }
+###   or { "status": null } when the translator code has been modified since
+###   the start of the daemon: the daemon stops and the client shall run the
+###   translator itself. An invalid request (or not received before
+###   DAEMON_TIMEOUT) is answered by the status 1 and an error message, like
+###   the command lines having DAEMON_REFUSED_OPTIONS.
+### param[in] path: the path of the Unix socket.
+###############################################################################
+def serve(path):
+    import socket
+    version = os.stat(os.path.abspath(__file__)).st_mtime
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    print('Daemon listening on ' + path)
+    running = True
+    try:
+        while running:
+            connection = server.accept()[0]
+            connection.settimeout(DAEMON_TIMEOUT)
+            try:
+                with connection, connection.makefile('rwb') as stream:
+                    try:
+                        request = json.loads(stream.readline())
+                        stop = request.get('stop', False)
+                        if stop or os.stat(os.path.abspath(__file__)).st_mtime != version:
+                            running = False
+                            answer = { 'status': 0 if stop else None }
+                        else:
+                            answer = serve_request(request['cwd'], request['argv'])
+                    except (ValueError, KeyError, AttributeError, OSError) as e:
+                        answer = { 'status': 1, 'outputs': [], 'warnings': [],
+                                   'console': 'Invalid request: ' + type(e).__name__ + ': ' +
+                                              str(e) + '\n' }
+                    stream.write(json.dumps(answer).encode('utf-8') + b'\n')
+            except OSError:
+                # The client has left: its answer is lost
+                pass
+    finally:
+        server.close()
+        os.remove(path)
+
+###############################################################################
+### Daemon mode: run the translator with the command line of a client from
+### its folder. The console output is captured and sent back.
+### param[in] cwd: the folder of the client.
+### param[in] argv: the command line arguments of the client.
+### return the answer to the client (see serve()).
+###############################################################################
+def serve_request(cwd, argv):
+    console = io.StringIO()
+    status, results = 0, []
+    with contextlib.redirect_stdout(console), contextlib.redirect_stderr(console):
+        try:
+            # Refused options are detected once parsed (argparse accepts their
+            # abbreviations): their default value is None.
+            cli = command_line()
+            cli.set_defaults(**{ option[2:]: None for option in DAEMON_REFUSED_OPTIONS })
+            args = cli.parse_args(argv)
+            refused = [o for o in DAEMON_REFUSED_OPTIONS if getattr(args, o[2:]) != None]
+            if len(refused) != 0:
+                print(f"{bcolors.FAIL}   FATAL: the daemon does not accept the options " +
+                      ', '.join(refused) + f"{bcolors.ENDC}")
+                sys.exit(1)
+            os.chdir(cwd)
+            results = main(argv)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            print(f"{bcolors.FAIL}   FATAL: " + type(e).__name__ + ': ' + str(e) + f"{bcolors.ENDC}")
+            status = 1
+    return { 'status': status, 'console': console.getvalue(),
+             'outputs': [f for r in (results or []) for f in r[1]],
+             'warnings': [w for r in (results or []) for w in r[2]] }
+
+###############################################################################
+### Entry point.
+### Positional arguments: <plantuml>... cpp|hpp [postfix]
+###   <plantuml>: path of the state machine in plantUML format. Several files,
+###   folders or glob patterns translate files in batch mode.
+###   cpp|hpp: generate a C++ source file or a C++ header file.
+###   [postfix]: Optional postfix name for the state machine class.
+### --standalone: build step generating the standalone parser module.
+### --no-analysis: fast path skipping the verification and graph analysis.
+### --max-cycles, --max-cycle-length: budget of the enumeration of cycles.
+### --pair-coverage: unit tests cover the pairs of consecutive transitions.
+### --check: run the model checker.
+### --minimize: merge the equivalent states.
+### --flatten: compile the composite states into a single state machine.
+### --regions: generation of the orthogonal regions.
+### --dispatch: lookup of the transitions by the event methods.
+### --profile: runtime profile of the generated code.
+### --cache-dir: folder caching translations.
+### -j: number of parallel jobs in batch mode.
+### --depfile, --manifest: list the files read and generated (build systems).
+### --watch, --period: translate again the files each time they are saved.
+### --daemon: serve translation requests of statecharts_client.py.
+### param[in] argv: the command line arguments (default: sys.argv).
+### return the list of translations (see translate_in_batch()).
+###############################################################################
+def main(argv=None):
+    cli = command_line()
+    args = cli.parse_args(argv)
+    if args.daemon != None:
+        serve(args.daemon)
+        return []
+    if args.standalone != None:
+        Parser().generate_standalone_parser(args.standalone)
+        if len(args.arguments) == 0:
+            return []
+    # Split arguments: <plantuml>... cpp|hpp [postfix]
+    postfix = ''
+    if len(args.arguments) >= 3 and args.arguments[-2] in ['cpp', 'hpp']:
+        postfix = args.arguments.pop()
+    if len(args.arguments) < 2 or args.arguments[-1] not in ['cpp', 'hpp']:
+        cli.print_usage()
+        print('Please set the plantuml files followed by "cpp" (for generating C++ source files) '
+              'or "hpp" (for generating C++ header files)')
+        sys.exit(-1)
+    language = args.arguments.pop()
+    options = Options.from_args(args)
+    if args.watch:
+        watch(args.arguments, language, postfix, options, args.period)
+        return []
+    files = plantuml_files(args.arguments)
+    # Single file
+    if len(files) == 1 and files == args.arguments:
+        p = warm_parser()
+        p.translate(files[0], language, postfix, options, args.cache_dir)
+        results = [(files[0], p.outputs, p.warnings, '', True, p.dependencies(files[0]))]
+    # Batch mode
+    else:
+        results = translate_files(files, language, postfix, options, args.cache_dir, args.jobs)
+    if args.depfile != None:
+        write_depfile(args.depfile, results)
+    if args.manifest != None:
+        write_manifest(args.manifest, results)
+    if not all(r[4] for r in results):
+        sys.exit(-1)
+    return results
+
+###############################################################################
+### Return the parser of the command line (see main()).
+###############################################################################
+def command_line():
+    cli = argparse.ArgumentParser(
+        usage='%(prog)s [options] <plantuml>... cpp|hpp [postfix]',
+        description='Translate PlantUML statecharts into C++ state machines and their unit tests.',
+        epilog='Example: ' + sys.argv[0] + ' foo.plantuml cpp Bar will create a FooBar.cpp '
+               'file with a state machine name FooBar')
+    cli.add_argument('arguments', nargs='*', metavar='<plantuml>... cpp|hpp [postfix]',
+                     help='the paths of plantuml statecharts (files, folders or glob patterns), '
+                          '"cpp" or "hpp" to generate C++ source files or C++ header files and '
+                          'an optional postfix to extend the name of state machine classes')
+    cli.add_argument('--standalone', nargs='?', metavar='FILE', const=STANDALONE_PARSER,
+                     help='generate the standalone parser module (default: ' +
+                          STANDALONE_PARSER + ') from the grammar file of the current '
+                          'folder. Translations made from this folder will use it and '
+                          'will not depend on the Lark grammar compiler')
+    cli.add_argument('--no-analysis', dest='analysis', action='store_false',
+                     help='fast path: do not verify the state machine and do not generate '
+                          'unit tests from graph analysis (cycles, test paths)')
+    cli.add_argument('--max-cycles', type=int, default=MAX_CYCLES, metavar='N',
+                     help='stop the enumeration of the cycles of a state machine (verification '
+                          'and unit tests) after N cycles, 0 for no limit (default: ' +
+                          str(MAX_CYCLES) + ')')
+    cli.add_argument('--max-cycle-length', type=int, default=0, metavar='N',
+                     help='ignore the cycles having more than N states, 0 for no limit '
+                          '(default: 0)')
+    cli.add_argument('--pair-coverage', action='store_true',
+                     help='generate unit tests covering all the pairs of consecutive '
+                          'transitions (by default, unit tests cover all the transitions)')
+    cli.add_argument('--check', action='store_true',
+                     help='run the model checker: explore the states and the values of the '
+                          'variables declared by \'[var] lines to find deadlocks, reachable '
+                          'CANNOT_HAPPEN states and infinite loops')
+    cli.add_argument('--minimize', action='store_true',
+                     help='merge the equivalent states (same actions and same transitions to '
+                          'equivalent states) before generating the code')
+    cli.add_argument('--flatten', action='store_true',
+                     help='compile the composite states into a single flat state machine: '
+                          'an event is dispatched by one table of transitions instead of '
+                          'being broadcast to nested state machines')
+    cli.add_argument('--regions', choices=['auto', 'product', 'parallel'], default='auto',
+                     help='generate the orthogonal regions of a composite state as a product '
+                          'state machine (one table lookup by event), as state machines '
+                          'receiving the events in sequence (no explosion of the number of '
+                          'states) or choose from the size of their product (default: auto, '
+                          'product up to ' + str(MAX_PRODUCT_STATES) + ' states)')
+    cli.add_argument('--dispatch', choices=['auto', 'dense', 'switch', 'map'], default='auto',
+                     help='lookup of the transitions by the event methods: a table indexed '
+                          'by the states, a switch on the current state, a std::multimap '
+                          'or choose from the density of the table of each event (default: '
+                          'auto, dense table from ' + str(int(DENSE_TABLE_DENSITY * 100)) +
+                          '%% of states having a single transition)')
+    cli.add_argument('--profile', choices=['default', 'embedded'], default='default',
+                     help='runtime profile of the generated code: embedded for code without '
+                          'dynamic memory nor std::map, with its tables in read-only memory and '
+                          'calling the fsm_fault() function of the user instead of exit() '
+                          '(compile with -DFSM_EMBEDDED)')
+    cli.add_argument('--cache-dir', metavar='DIR',
+                     help='folder caching translations: an unchanged translation (same '
+                          'plantuml file, grammar, translator and options) copies its '
+                          'previously generated files')
+    cli.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                     help='number of files translated in parallel in batch mode')
+    cli.add_argument('--depfile', metavar='FILE',
+                     help='write a Makefile/ninja depfile: the generated files (including '
+                          'the ones of nested state machines) depend on the plantuml file, '
+                          'the grammar, the standalone parser and the translator')
+    cli.add_argument('--manifest', metavar='FILE',
+                     help='write a JSON file listing for each plantuml file the files '
+                          'read, the generated files and the warnings')
+    cli.add_argument('--watch', action='store_true',
+                     help='do not exit: translate again the plantuml files each time they '
+                          'are saved. Only the modified state machines are generated again')
+    cli.add_argument('--period', type=float, default=0.05, metavar='SECONDS',
+                     help='polling period of the watch mode (default: 0.05)')
+    cli.add_argument('--daemon', nargs='?', metavar='SOCKET', const=default_socket(),
+                     help='stay in memory and serve the translations requested by '
+                          'statecharts_client.py on a Unix socket (default: ' +
+                          default_socket() + ')')
+    return cli
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+###############################################################################
+## PlantUML Statecharts (State Machine) Translator.
+## Copyright (c) 2022 Quentin Quadrat <lecrapouille@gmail.com>
+##
+## This file is part of PlantUML Statecharts (State Machine) Translator.
+##
+## This tool is free software: you can redistribute it and/or modify it
+## under the terms of the GNU General Public License as published by
+## the Free Software Foundation, either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful, but
+## WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+## General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program.  If not, see http://www.gnu.org/licenses/.
+###############################################################################
+## Thin client of the translator daemon (statecharts.py --daemon). It takes
+## the same command line than statecharts.py, sends it to the daemon and
+## displays its answer. When no daemon is running (or when the translator has
+## been modified since the daemon started) statecharts.py is run instead.
+## Extra options (placed first):
+##   --socket <path>: the Unix socket of the daemon.
+##   --stop: stop the daemon.
+###############################################################################
+
+import sys, os, socket, json
+
+###############################################################################
+### Return the default path of the Unix socket of the daemon (statecharts.py
+### imports it from this module).
+###############################################################################
+def default_socket():
+    folder = os.environ.get('XDG_RUNTIME_DIR', '/tmp')
+    return os.environ.get('STATECHARTS_SOCKET',
+                          os.path.join(folder, 'statecharts-' + str(os.getuid()) + '.sock'))
+
+###############################################################################
+### Send a request to the daemon.
+### return the answer of the daemon or None if no daemon is running.
+###############################################################################
+def request(path, content):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(path)
+            with s.makefile('rwb') as stream:
+                stream.write(json.dumps(content).encode('utf-8') + b'\n')
+                stream.flush()
+                return json.loads(stream.readline())
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+###############################################################################
+### Entry point.
+###############################################################################
+def main():
+    argv = sys.argv[1:]
+    path = default_socket()
+    if len(argv) >= 2 and argv[0] == '--socket':
+        path = argv[1]
+        argv = argv[2:]
+    if argv == ['--stop']:
+        request(path, { 'stop': True })
+        return
+    answer = request(path, { 'cwd': os.getcwd(), 'argv': argv })
+    if answer == None or answer['status'] == None:
+        translator = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'statecharts.py')
+        os.execv(sys.executable, [sys.executable, translator] + argv)
+    sys.stdout.write(answer['console'])
+    sys.exit(answer['status'])
+
+if __name__ == '__main__':
+    main()
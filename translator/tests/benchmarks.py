@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+# Benchmarks of the translator on synthetic state machines. Run from the tests
+# folder: ./benchmarks.py
+
+from lark import Lark
+import os, sys, time, tracemalloc, tempfile, shutil
+
+sys.path.insert(0, os.path.abspath('..'))
+import statecharts
+
+# Return a synthetic PlantUML statechart with the given number of transitions:
+# each state has 10 events with a guard and an action.
+def synthetic_chart(transitions):
+    states = max(transitions // 10, 1)
+    code = '@startuml\n[*] --> S0\n'
+    for i in range(transitions):
+        source = i // 10
+        code += 'S%d --> S%d : event%d [x > %d] / y = %d\n' % (source, (source + i) % states, i % 10, i, i)
+    return code + '@enduml\n'
+
+# Return the duration and the peak of allocated memory when calling f(*args).
+# Memory is traced in a second call since tracing slows down the code.
+def measure(f, *args):
+    start = time.time()
+    f(*args)
+    duration = time.time() - start
+    tracemalloc.start()
+    f(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return duration, peak
+
+# Parse with the grammar rules building the state machines (the way of the
+# translator) compared to the parse tree the former AST visitor needed before
+# doing its own traversal.
+def bench_model_construction(transitions):
+    path = os.path.abspath('benchmark.plantuml')
+    with open(path, 'w') as f:
+        f.write(synthetic_chart(transitions))
+    cwd = os.getcwd()
+    os.chdir('..')
+    try:
+        grammar = Lark(open('statecharts.ebnf').read(), parser='lalr')
+        code = open(path).read()
+        t1, m1 = measure(grammar.parse, code)
+        t2, m2 = measure(lambda: statecharts.Parser().parse_plantuml_file(path, ''))
+    finally:
+        os.chdir(cwd)
+        os.remove(path)
+    print('Model construction of %d transitions:' % transitions)
+    print('   Parse tree only:       %.3f s, peak %.1f MB' % (t1, m1 / 1e6))
+    print('   One pass construction: %.3f s, peak %.1f MB' % (t2, m2 / 1e6))
+
+# Return a synthetic PlantUML statechart made of composite states (nested state
+# machines). When modified is True, a guard of the fourth one is modified.
+def synthetic_composite_chart(machines, states, modified=False):
+    code = '@startuml\n[*] --> M0\n'
+    for m in range(machines):
+        code += 'M%d --> M%d : next%d\n' % (m, (m + 1) % machines, m)
+    for m in range(machines):
+        code += 'state M%d {\n[*] --> M%dS0\n' % (m, m)
+        for s in range(states):
+            guard = ' + 1' if modified and m == 3 and s == 7 else ''
+            code += 'M%dS%d --> M%dS%d : ev%d [x > %d%s] / y = %d\n' % (
+                m, s, m, (s + 1) % states, s % 5, s, guard, s)
+        code += '}\n'
+    return code + '@enduml\n'
+
+# Latency of the watch mode: translation of a saved file when a single nested
+# state machine has been modified, compared to a complete translation.
+def bench_incremental_translation(machines, states):
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp()
+    shutil.copy(os.path.join('..', 'statecharts.ebnf'), folder)
+    path = os.path.join(folder, 'Big.plantuml')
+    os.chdir(folder)
+    try:
+        p = statecharts.warm_parser()
+        signatures = dict()
+        with open(path, 'w') as f:
+            f.write(synthetic_composite_chart(machines, states))
+        p.translate(path, 'hpp', '', None, None, signatures)
+        with open(path, 'w') as f:
+            f.write(synthetic_composite_chart(machines, states, True))
+        start = time.time()
+        p.translate(path, 'hpp', '', None, None, signatures)
+        t1, n1 = time.time() - start, len(p.outputs)
+        start = time.time()
+        p.translate(path, 'hpp', '', None, None, dict())
+        t2, n2 = time.time() - start, len(p.outputs)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+    print('Translation of %d states after modifying one state machine:' % (machines * states))
+    print('   Incremental: %.3f s, %d generated files' % (t1, n1))
+    print('   Complete:    %.3f s, %d generated files' % (t2, n2))
+
+# Copies of State and Transition having a __dict__ (former model).
+class LegacyState(object):
+    def __init__(self, name):
+        self.__dict__.update((a, getattr(statecharts.State(name), a)) for a in statecharts.State.__slots__)
+
+class LegacyTransition(object):
+    def __init__(self):
+        self.__dict__.update((a, getattr(statecharts.Transition(), a)) for a in statecharts.Transition.__slots__)
+
+# Build a model of states with 5 transitions each (with guards): the integer
+# indexed CSR graph of the translator or the former networkx DiGraph with a
+# 'data' attribute on nodes and edges.
+def build_graph(states, legacy):
+    if legacy:
+        import networkx as nx
+        graph = nx.DiGraph()
+    else:
+        graph = statecharts.Graph()
+    for i in range(states * 5):
+        tr = LegacyTransition() if legacy else statecharts.Transition()
+        tr.origin, tr.destination = 'S%d' % (i // 5), 'S%d' % ((i * 7 + 1) % states)
+        tr.guard = 'x > %d' % i
+        if legacy:
+            for name in [tr.origin, tr.destination]:
+                if not graph.has_node(name):
+                    graph.add_node(name, data=LegacyState(name))
+            graph.add_edge(tr.origin, tr.destination, data=tr)
+        else:
+            graph.add_transition(tr)
+    if not legacy:
+        graph.compile()
+    return graph
+
+# Memory and iteration speed of the state machine model: integer-indexed CSR
+# graph compared to the former networkx DiGraph. Iteration is the hot loop of
+# the code generator: visiting all transitions and their origin states.
+def bench_graph_model(states):
+    def iterate_native(graph):
+        count = 0
+        for tr in graph.sorted_transitions():
+            count += (tr.guard != '') + (graph.state(tr.origin).entering != '')
+        return count
+    def iterate_legacy(graph):
+        count = 0
+        for origin, destination in graph.edges:
+            count += (graph[origin][destination]['data'].guard != '') + \
+                     (graph.nodes[origin]['data'].entering != '')
+        return count
+    t1, m1 = measure(build_graph, states, False)
+    t2, m2 = measure(build_graph, states, True)
+    t3, m3 = measure(iterate_native, build_graph(states, False))
+    t4, m4 = measure(iterate_legacy, build_graph(states, True))
+    print('Model of %d states and %d transitions:' % (states, states * 5))
+    print('   Building CSR graph:  %.3f s, peak %.1f MB' % (t1, m1 / 1e6))
+    print('   Building networkx:   %.3f s, peak %.1f MB' % (t2, m2 / 1e6))
+    print('   Iterating CSR graph: %.3f s' % t3)
+    print('   Iterating networkx:  %.3f s' % t4)
+
+# Enumeration of the cycles of a densely connected state machine (each state
+# has an event to each other state): the number of cycles is exponential and
+# the enumeration is bounded by the budget of the command line options.
+def bench_cycles(states):
+    sm = statecharts.StateMachine()
+    sm.initial_state = '[*]'
+    for i in range(-1, states):
+        for j in range(states):
+            if i != j:
+                tr = statecharts.Transition()
+                tr.origin, tr.destination = 'S%d' % i if i >= 0 else '[*]', 'S%d' % j
+                sm.add_transition(tr)
+    sm.build_index()
+    print('Cycles of a complete graph of %d states:' % states)
+    for max_cycles, max_length in [(statecharts.MAX_CYCLES, 0), (0, 3)]:
+        start = time.time()
+        count = len(sm.graph_cycles(max_cycles, max_length))
+        print('   --max-cycles %d --max-cycle-length %d: %.3f s, %d cycles' % (
+            max_cycles, max_length, time.time() - start, count))
+
+# Unit tests covering all the transitions (and their pairs) of a synthetic
+# state machine: the number of tests stays below the number of transitions.
+def bench_test_paths(transitions):
+    path = os.path.abspath('benchmark.plantuml')
+    with open(path, 'w') as f:
+        f.write(synthetic_chart(transitions))
+    cwd = os.getcwd()
+    os.chdir('..')
+    try:
+        p = statecharts.Parser()
+        p.parse_plantuml_file(path, '')
+    finally:
+        os.chdir(cwd)
+        os.remove(path)
+    print('Test paths of %d transitions:' % transitions)
+    for pairs in [False, True]:
+        start = time.time()
+        paths = p.master.graph_test_paths(pairs)
+        print('   %s coverage: %.3f s, %d tests, %d steps' % ('Pair      ' if pairs else 'Transition',
+              time.time() - start, len(paths), sum(len(path) for path in paths)))
+
+# Throughput of the model checker on a synthetic state machine whose counters
+# are incremented and reset by events (states x values configurations).
+def bench_model_checking(values):
+    sm = statecharts.StateMachine()
+    sm.initial_state = '[*]'
+    sm.extra_code.variables = [('int', 'x', 0, values - 1, 0), ('int', 'y', 0, values - 1, 0)]
+    for origin, destination, event, guard, action in [
+            ('[*]', 'A', '', '', ''), ('A', 'B', 'incx', 'x < %d' % (values - 1), 'x++'),
+            ('B', 'A', 'incy', 'y < %d' % (values - 1), 'y += 1'), ('A', 'A', 'decx', 'x > 0', 'x--'),
+            ('B', 'B', 'decy', 'y > 0', 'y = y - 1'), ('B', 'A', 'reset', '', 'x = 0; y = 0')]:
+        tr = statecharts.Transition()
+        tr.origin, tr.destination, tr.event.name = origin, destination, event
+        tr.guard, tr.action = guard, action
+        sm.add_transition(tr)
+    sm.build_index()
+    start = time.time()
+    count = statecharts.ModelChecker(sm).check()[0]
+    duration = time.time() - start
+    print('Model checking of %d configurations:' % count)
+    print('   %.3f s, %d configurations/s' % (duration, count / duration))
+
+# Minimization of a state machine made of two equivalent chains of states:
+# the partition is refined once per state of the chain.
+def bench_minimization(states):
+    sm = statecharts.StateMachine()
+    sm.initial_state, sm.final_state = '[*]', '*'
+    for chain in 'AB':
+        for i in range(states):
+            tr = statecharts.Transition()
+            tr.origin = '%s%d' % (chain, i) if i != 0 else '[*]'
+            tr.destination = '%s%d' % (chain, i + 1) if i != states - 1 else '*'
+            tr.event.name, tr.action = 'e', 'x = %d' % i
+            sm.add_transition(tr)
+            sm.lookup_events[tr.event].append(tr)
+    sm.build_index()
+    count = len(sm.graph.names)
+    start = time.time()
+    sm.minimize()
+    print('Minimization of %d states: %.3f s, %d states' % (count, time.time() - start, len(sm.graph.names)))
+
+# Code size of the nested state machines compared to the flat state machine
+# compiled from the composite states (see StateMachine.flatten() for the number
+# of calls dispatching an event).
+def bench_flattening(machines, states):
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp()
+    shutil.copy(os.path.join('..', 'statecharts.ebnf'), folder)
+    path = os.path.join(folder, 'Big.plantuml')
+    with open(path, 'w') as f:
+        f.write(synthetic_composite_chart(machines, states))
+    os.chdir(folder)
+    try:
+        p = statecharts.warm_parser()
+        print('Code size of %d composite states of %d states:' % (machines, states))
+        for flatten in [False, True]:
+            start = time.time()
+            p.translate(path, 'hpp', '', statecharts.Options(analysis=False, flatten=flatten))
+            duration = time.time() - start
+            headers = [f for f in p.outputs if f.endswith('.hpp')]
+            print('   %s %.3f s, %d classes, %d bytes' % ('Flat:  ' if flatten else 'Nested:', duration,
+                  len(headers), sum(os.path.getsize(f) for f in headers)))
+            for f in p.outputs:
+                os.remove(f)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+
+# Return a synthetic PlantUML statechart made of a composite state holding
+# orthogonal regions: rings of states reacting to a common event and to their
+# own event.
+def synthetic_orthogonal_chart(regions, states):
+    code = '@startuml\n[*] --> IDLE\nIDLE --> ACTIVE : start\nACTIVE --> IDLE : halt\nstate ACTIVE {\n'
+    for r in range(regions):
+        if r != 0:
+            code += '--\n'
+        code += '[*] --> R%dS0\n' % r
+        for s in range(states):
+            code += 'R%dS%d --> R%dS%d : tick\n' % (r, s, r, (s + 1) % states)
+            code += 'R%dS%d --> R%dS0 : reset%d\n' % (r, s, r, r)
+    return code + '}\n@enduml\n'
+
+# Orthogonal regions generated as a product state machine (one table lookup by
+# event) compared to state machines dispatched in sequence.
+def bench_orthogonal_regions(regions, states):
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp()
+    shutil.copy(os.path.join('..', 'statecharts.ebnf'), folder)
+    path = os.path.join(folder, 'Regions.plantuml')
+    with open(path, 'w') as f:
+        f.write(synthetic_orthogonal_chart(regions, states))
+    os.chdir(folder)
+    try:
+        p = statecharts.warm_parser()
+        print('Orthogonal regions: %d regions of %d states:' % (regions, states))
+        for mode in ['product', 'parallel']:
+            start = time.time()
+            p.translate(path, 'hpp', '', statecharts.Options(analysis=False, regions=mode))
+            duration = time.time() - start
+            nested = [sm for sm in p.machines.values() if sm.parent != None]
+            headers = [f for f in p.outputs if f.endswith('.hpp')]
+            print('   %-8s %.3f s, %d states, %d transitions, %d bytes' % (mode + ':', duration,
+                  sum(len(sm.graph.names) for sm in nested), sum(len(sm.graph.transitions) for sm in nested),
+                  sum(os.path.getsize(f) for f in headers)))
+            for f in p.outputs:
+                os.remove(f)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+
+# Return a synthetic PlantUML statechart: a ring of states all reacting to the
+# event next (dense table), a few states reacting to the event jump (sparse
+# table) and to the event pick with two guarded transitions (the first guard
+# refuses, the second allows).
+def synthetic_dispatch_chart(states):
+    code = '@startuml\n[*] --> S0\n'
+    for s in range(states):
+        code += 'S%d --> S%d : next\n' % (s, (s + 1) % states)
+        if s % 8 == 0:
+            code += 'S%d --> S%d : jump\n' % (s, (s + 2) % states)
+        if s % 4 == 0:
+            code += 'S%d --> S%d : pick [ false ]\n' % (s, (s + 3) % states)
+            code += 'S%d --> S%d : pick [ true ]\n' % (s, (s + 1) % states)
+    return code + '@enduml\n'
+
+# C++ program dispatching events to the state machine of the synthetic chart.
+DISPATCH_PROGRAM = """#define MOCKABLE
+#include "Dispatch.hpp"
+#include <chrono>
+
+int main()
+{
+    Dispatch fsm;
+    fsm.enter();
+    auto const start = std::chrono::steady_clock::now();
+    for (long i = 0; i < %d; ++i)
+    {
+        fsm.next();
+        fsm.jump();
+        fsm.pick();
+    }
+    auto const stop = std::chrono::steady_clock::now();
+    printf("%%ld\\n", long(std::chrono::duration_cast<std::chrono::nanoseconds>(stop - start).count()));
+    return int(fsm.state()) == 0;
+}
+"""
+
+# Duration of the dispatch of an event by the event methods looking up their
+# transition in a std::multimap, in a dense table and with a switch on the
+# current state (compiled with g++ -O2).
+def bench_dispatch(states, loops):
+    if shutil.which('g++') == None:
+        print('Event dispatch: skipped (g++ not found)')
+        return
+    import subprocess
+    cwd = os.getcwd()
+    include = os.path.abspath(os.path.join('..', '..', 'include'))
+    folder = tempfile.mkdtemp()
+    shutil.copy(os.path.join('..', 'statecharts.ebnf'), folder)
+    with open(os.path.join(folder, 'Dispatch.plantuml'), 'w') as f:
+        f.write(synthetic_dispatch_chart(states))
+    with open(os.path.join(folder, 'main.cpp'), 'w') as f:
+        f.write(DISPATCH_PROGRAM % loops)
+    os.chdir(folder)
+    try:
+        p = statecharts.warm_parser()
+        print('Event dispatch: %d states, %d events:' % (states, 3 * loops))
+        for dispatch in ['map', 'dense', 'switch']:
+            options = statecharts.Options(analysis=False, dispatch=dispatch)
+            p.translate('Dispatch.plantuml', 'hpp', '', options)
+            subprocess.run(['g++', '--std=c++14', '-O2', '-I.', '-I' + include, 'main.cpp',
+                            '-o', 'dispatch'], check=True)
+            duration = int(subprocess.run(['./dispatch'], check=True, capture_output=True,
+                                          text=True).stdout)
+            print('   %-7s %.1f ns/event, %d bytes' % (dispatch + ':', duration / (3 * loops),
+                  os.path.getsize('dispatch')))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+
+def main():
+    bench_model_construction(10000)
+    bench_graph_model(10000)
+    bench_incremental_translation(10, 30)
+    bench_cycles(60)
+    bench_test_paths(1000)
+    bench_model_checking(700)
+    bench_minimization(10000)
+    bench_flattening(10, 30)
+    bench_orthogonal_regions(3, 8)
+    bench_dispatch(64, 1000000)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Flash and RAM footprint of the example state machines generated with the
+# embedded profile (statecharts.py --profile embedded), made for the continuous
+# integration: the report is a Markdown table to compare between two commits.
+# For each example, a program reserving the memory of the state machine and
+# referencing its events is compiled for size and the sections of its object file are
+# measured: flash holds the code, the read-only data and the initial values of
+# data, RAM holds the data and the zero-initialized data. The script fails when
+# the program allocates memory, throws exceptions or exits.
+# Run from the tests folder: ./size_report.py [report file]
+# The environment variable CXX selects the compiler (for example
+# arm-none-eabi-g++: its size and nm tools are used).
+
+import os, sys, glob, tempfile, shutil, subprocess
+
+sys.path.insert(0, os.path.abspath('..'))
+import statecharts
+
+# Compilation flags of the embedded targets.
+CXXFLAGS = ['--std=c++14', '-Os', '-fno-exceptions', '-fno-rtti', '-fno-pic',
+            '-fno-asynchronous-unwind-tables', '-DFSM_EMBEDDED']
+
+# Symbols of the dynamic memory, of the exceptions and of exit().
+FORBIDDEN_SYMBOLS = ['malloc', 'calloc', 'realloc', 'free', '_Znwm', '_Znam', '_Znwj', '_Znaj',
+                     '_ZdlPv', '_ZdaPv', '__cxa_allocate_exception', '__cxa_throw', 'exit']
+
+# Program using the state machine: its methods are referenced so that they
+# and their tables are compiled. The memory of an instance is reserved since
+# the constructor may need arguments.
+PROGRAM = """#define MOCKABLE
+#include "%s.hpp"
+
+void fsm_fault(const char* /*reason*/)
+{
+    for (;;) {}
+}
+
+alignas(%s) unsigned char fsm[sizeof(%s)];
+%s"""
+
+# Return the tool of the compiler toolchain (size, nm) from the compiler name.
+def tool(cxx, name):
+    prefix = cxx[:-3] if cxx.endswith('g++') else ''
+    return prefix + name
+
+# Generate and compile the program of the given PlantUML file.
+# return the row of the report (name, flash, RAM, text, data, bss) or None
+# when the translation or the compilation failed. Exit on forbidden symbols.
+def measure(cxx, include, uml_file):
+    p = statecharts.warm_parser()
+    try:
+        p.translate(uml_file, 'hpp', 'Controller',
+                    statecharts.Options(analysis=False, profile='embedded'))
+    except (SystemExit, Exception):
+        return None
+    sm = p.master
+    methods = dict.fromkeys(['enter'] + [e.name for e in sm.lookup_events if e.name != ''] +
+                            [e.name for (machine, e) in sm.broadcasts])
+    references = ''.join('extern auto const method%d = &%s::%s;\n' % (i, sm.class_name, m)
+                         for i, m in enumerate(methods))
+    with open('main.cpp', 'w') as f:
+        f.write(PROGRAM % (sm.class_name, sm.class_name, sm.class_name, references))
+    if subprocess.run([cxx] + CXXFLAGS + ['-I.', '-I' + include, '-c', 'main.cpp', '-o', 'main.o'],
+                      capture_output=True).returncode != 0:
+        return None
+    undefined = subprocess.run([tool(cxx, 'nm'), '-u', 'main.o'], check=True,
+                               capture_output=True, text=True).stdout.split()
+    forbidden = [s for s in undefined if s in FORBIDDEN_SYMBOLS]
+    if len(forbidden) != 0:
+        print(uml_file + ': the embedded profile uses ' + ', '.join(forbidden))
+        sys.exit(-1)
+    sizes = subprocess.run([tool(cxx, 'size'), 'main.o'], check=True, capture_output=True,
+                           text=True).stdout.splitlines()[1].split()
+    text, data, bss = int(sizes[0]), int(sizes[1]), int(sizes[2])
+    return (sm.class_name, text + data, data + bss, text, data, bss)
+
+def main():
+    cxx = os.environ.get('CXX', 'g++')
+    include = os.path.abspath(os.path.join('..', '..', 'include'))
+    examples = sorted(glob.glob(os.path.abspath(os.path.join('..', '..', 'examples', '*.plantuml'))))
+    cwd = os.getcwd()
+    folder = tempfile.mkdtemp()
+    shutil.copy(os.path.join('..', 'statecharts.ebnf'), folder)
+    report = '| State machine | Flash | RAM | text | data | bss |\n|---|---:|---:|---:|---:|---:|\n'
+    os.chdir(folder)
+    try:
+        for uml_file in examples:
+            row = measure(cxx, include, uml_file)
+            if row == None:
+                name = os.path.splitext(os.path.basename(uml_file))[0]
+                report += '| %s | failed | | | | |\n' % name
+            else:
+                report += '| %s | %d | %d | %d | %d | %d |\n' % row
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as f:
+            f.write(report)
+    print(report, end='')
+
+if __name__ == '__main__':
+    main()
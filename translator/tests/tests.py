@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 
 from lark import Lark, Transformer
-import os, sys
+import os, sys, json, shutil, subprocess, tempfile, time, contextlib
+
+# Maximal duration (in seconds) of a translation made with the standalone
+# parser and --no-analysis (best of STARTUP_RUNS runs). Measured at ~0.1 s on a
+# developer laptop: the budget leaves room for slow CI machines but catches
+# heavy imports added at the translator start-up. The environment variable
+# STARTUP_BUDGET overrides it (for example on loaded machines).
+STARTUP_BUDGET = float(os.environ.get('STARTUP_BUDGET', '1.0'))
+STARTUP_RUNS = 3
 
 def check(exp):
     if not exp:
         raise Exception()
 
 def check_AST(root):
-    check(root.data == 'state_diagram')
+    check(root.data == 'start')
     check(len(root.children) == 21)
     c = 0
 
@@ -17,56 +25,56 @@ def check_AST(root):
     c += 1
 
     # '[header] ceci est un header 1
-    check(root.children[c].data == 'cpp_code')
+    check(root.children[c].data == 'cpp')
     check(len(root.children[c].children) == 2)
     check(root.children[c].children[0] == '[header]')
     check(root.children[c].children[1].strip() == 'ceci est un header 1')
     c += 1
 
     # '[header] ceci est un header 2
-    check(root.children[c].data == 'cpp_code')
+    check(root.children[c].data == 'cpp')
     check(len(root.children[c].children) == 2)
     check(root.children[c].children[0] == '[header]')
     check(root.children[c].children[1].strip() == 'ceci est un header 2')
     c += 1
 
     # '[footer] ceci est un footer 1
-    check(root.children[c].data == 'cpp_code')
+    check(root.children[c].data == 'cpp')
     check(len(root.children[c].children) == 2)
     check(root.children[c].children[0] == '[footer]')
     check(root.children[c].children[1].strip() == 'ceci est un footer 1')
     c += 1
 
     # '[footer] ceci est un footer 2
-    check(root.children[c].data == 'cpp_code')
+    check(root.children[c].data == 'cpp')
     check(len(root.children[c].children) == 2)
     check(root.children[c].children[0] == '[footer]')
     check(root.children[c].children[1].strip() == 'ceci est un footer 2')
     c += 1
 
     # '[init] a = 0;
-    check(root.children[c].data == 'cpp_code')
+    check(root.children[c].data == 'cpp')
     check(len(root.children[c].children) == 2)
     check(root.children[c].children[0] == '[init]')
     check(root.children[c].children[1].strip() == 'a = 0;')
     c += 1
 
     # '[init] b = "ff";
-    check(root.children[c].data == 'cpp_code')
+    check(root.children[c].data == 'cpp')
     check(len(root.children[c].children) == 2)
     check(root.children[c].children[0] == '[init]')
     check(root.children[c].children[1].strip() == 'b = "ff";')
     c += 1
 
     # '[code] int foo();
-    check(root.children[c].data == 'cpp_code')
+    check(root.children[c].data == 'cpp')
     check(len(root.children[c].children) == 2)
     check(root.children[c].children[0] == '[code]')
     check(root.children[c].children[1].strip() == 'int foo();')
     c += 1
 
     # '[code] virtual std::string foo(std::foo<Bar> const& arg[]) = 0;
-    check(root.children[c].data == 'cpp_code')
+    check(root.children[c].data == 'cpp')
     check(len(root.children[c].children) == 2)
     check(root.children[c].children[0] == '[code]')
     check(root.children[c].children[1].strip() == 'virtual std::string foo(std::foo<Bar> const& arg[]) = 0;')
@@ -206,19 +214,18 @@ def check_AST(root):
     #   OFF -> ON : on
     # }
     check(root.children[c].data == 'state_block')
-    check(len(root.children[c].children) == 2)
-    check(root.children[c].children[0] == 'State11')
-    check(root.children[c].children[1].data == 'state_diagram')
-    check(len(root.children[c].children[1].children) == 3)
+    check(len(root.children[c].children) == 4)
+    check(root.children[c].children[0].data == 'state_begin')
+    check(root.children[c].children[0].children[0] == 'State11')
 
-    c0 = root.children[c].children[1].children[0]
+    c0 = root.children[c].children[1]
     check(c0.data == 'transition')
     check(len(c0.children) == 3)
     check(c0.children[0] == '[*]')
     check(c0.children[1] == '->')
     check(c0.children[2] == 'ON')
 
-    c1 = root.children[c].children[1].children[1]
+    c1 = root.children[c].children[2]
     check(c1.data == 'transition')
     check(len(c1.children) == 4)
     check(c1.children[0] == 'ON')
@@ -229,7 +236,7 @@ def check_AST(root):
     check(len(c1.children[3].children) == 1)
     check(c1.children[3].children[0] == 'off')
 
-    c2 = root.children[c].children[1].children[2]
+    c2 = root.children[c].children[3]
     check(c2.data == 'transition')
     check(len(c2.children) == 4)
     check(c2.children[0] == 'OFF')
@@ -254,28 +261,539 @@ def check_AST(root):
     #   ScrollLockOff --> ScrollLockOn : EvCapsLockPressed
     #   ScrollLockOn --> ScrollLockOff : EvCapsLockPressed
     # }
-#    check(root.children[c].data == 'state_block')
-#    check(len(root.children[c].children) == 2)
-#    check(root.children[c].children[0] == 'Active')
-#    check(root.children[c].children[1].data == 'state_diagram')
-#    check(len(root.children[c].children[1].children) == 5)
-#    check(root.children[c].children[1].children[0].data == 'ortho_block')
-#    print(root.children[c].children[1].children[0].children)
-#    check(len(root.children[c].children[1].children[0].children) == 6)
-#    check(root.children[c].children[1].children[0].children[0].data == 'transition')
-#    c0 = root.children[c].children[1].children[0].children[0]
-#    check(c0.children[0] == '[*]')
-#    check(c0.children[1] == '->')
-#    check(c0.children[2] == 'NumLockOff')
+    check(root.children[c].data == 'state_block')
+    check(len(root.children[c].children) == 12)
+    check(root.children[c].children[0].children[0] == 'Active')
+    check(root.children[c].children[4].data == 'ortho_separator')
+    check(root.children[c].children[8].data == 'ortho_separator')
+    c0 = root.children[c].children[1]
+    check(c0.data == 'transition')
+    check(c0.children[0] == '[*]')
+    check(c0.children[1] == '->')
+    check(c0.children[2] == 'NumLockOff')
+    c0 = root.children[c].children[5]
+    check(c0.data == 'transition')
+    check(c0.children[0] == '[*]')
+    check(c0.children[1] == '->')
+    check(c0.children[2] == 'CapsLockOff')
+
+# Temporary folder holding the grammar and the PlantUML chart <name>.plantuml
+# made of the given code. It is the current folder inside the with block.
+@contextlib.contextmanager
+def chart_folder(name, code):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        shutil.copy('../statecharts.ebnf', folder)
+        with open(os.path.join(folder, name + '.plantuml'), 'w') as f:
+            f.write(code)
+        os.chdir(folder)
+        try:
+            yield folder
+        finally:
+            os.chdir(cwd)
+
+# Translate the PlantUML chart <name>.plantuml made of the given code into C++
+# header files with the given options (see statecharts.Options).
+# return the parser and the dictionary "file name => content" of the folder.
+def translate_chart(name, code, options=None):
+    import statecharts
+    with chart_folder(name, code):
+        p = statecharts.Parser()
+        p.translate(name + '.plantuml', 'hpp', '', options)
+        files = dict()
+        for path in os.listdir('.'):
+            with open(path) as f:
+                files[path] = f.read()
+    return p, files
+
+# Return the cumulative import time (in microseconds) of top-level modules from
+# the stderr of python -X importtime.
+def import_times(stderr):
+    times = {}
+    for line in stderr.splitlines():
+        fields = line.split('|')
+        if not line.startswith('import time:') or not fields[1].strip().isdigit():
+            continue
+        if fields[2].startswith('  '): # Indented: imported by another module
+            continue
+        times[fields[2].strip()] = int(fields[1])
+    return times
+
+# Report the import time regression numbers of the translator entry point.
+def report_import_times(title, times):
+    print(title + ': %.1f ms' % (sum(times.values()) / 1000.0))
+    for module, us in sorted(times.items(), key=lambda t: -t[1])[:5]:
+        print('   %-24s %8.1f ms' % (module, us / 1000.0))
+
+def check_standalone_startup():
+    translator = os.path.abspath('../statecharts.py')
+    plantuml = os.path.abspath('../../examples/Gumball.plantuml')
+    with tempfile.TemporaryDirectory() as folder:
+        shutil.copy('../statecharts.ebnf', folder)
+        subprocess.run([sys.executable, translator, '--standalone'], cwd=folder, check=True)
+        check(os.path.isfile(os.path.join(folder, 'statecharts_parser.py')))
+        # The standalone parser shall not need the Lark library.
+        res = subprocess.run([sys.executable, '-X', 'importtime', translator, plantuml, 'hpp'],
+                             cwd=folder, check=True, capture_output=True, text=True)
+        times = import_times(res.stderr)
+        check('lark' not in times)
+        check(os.path.isfile(os.path.join(folder, 'Gumball.hpp')))
+        report_import_times('Imports with analysis', times)
+        # The fast path shall not import networkx.
+        res = subprocess.run([sys.executable, '-X', 'importtime', translator,
+                              '--no-analysis', plantuml, 'hpp'],
+                             cwd=folder, check=True, capture_output=True, text=True)
+        times = import_times(res.stderr)
+        check('networkx' not in times and 'lark' not in times)
+        report_import_times('Imports with --no-analysis', times)
+        # Start-up of the fast path
+        durations = []
+        for i in range(STARTUP_RUNS):
+            start = time.time()
+            subprocess.run([sys.executable, translator, '--no-analysis', plantuml, 'hpp'],
+                           cwd=folder, check=True, capture_output=True)
+            durations.append(time.time() - start)
+        print('Translation with the standalone parser and --no-analysis: %.3f s (budget: %.3f s)'
+              % (min(durations), STARTUP_BUDGET))
+        check(min(durations) < STARTUP_BUDGET)
+
+# A bad request shall be answered by an error without stopping the daemon.
+def check_daemon_bad_requests():
+    import socket, json
+    sys.path.insert(0, os.path.abspath('..'))
+    from statecharts_client import request
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'daemon.sock')
+        daemon = subprocess.Popen([sys.executable, os.path.abspath('../statecharts.py'), '--daemon', path],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            for i in range(100):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.05)
+            for line in [b'\n', b'not json\n', b'[]\n', b'{ "argv": [] }\n']:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                    s.connect(path)
+                    with s.makefile('rwb') as stream:
+                        stream.write(line)
+                        stream.flush()
+                        answer = json.loads(stream.readline())
+                check(answer['status'] == 1 and answer['console'].startswith('Invalid request'))
+            # Options starting another daemon, never answering or writing the
+            # standalone parser are refused (also abbreviated)
+            for argv in [['--daemon', path], ['--watch', 'a.plantuml', 'hpp'], ['--wat', 'a.plantuml', 'hpp'],
+                         ['--period', '1', 'a.plantuml', 'hpp'], ['--standalone']]:
+                answer = request(path, { 'cwd': folder, 'argv': argv })
+                check(answer['status'] == 1 and 'does not accept the options' in answer['console'])
+            check(os.listdir(folder) == ['daemon.sock'])
+            check(request(path, { 'stop': True }) == { 'status': 0 })
+            check(daemon.wait(10) == 0)
+        finally:
+            if daemon.poll() == None:
+                daemon.kill()
+
+# Several transitions between the same states (events, "on event" lines and
+# guarded alternatives) shall be kept and shall have distinct C++ methods.
+PARALLEL_TRANSITIONS = """@startuml
+[*] --> IDLE
+IDLE --> RUNNING : begin [ ok() ] / go()
+IDLE --> RUNNING : resume / go()
+IDLE --> FAILED : begin [ !ok() ] / fail()
+RUNNING : on tick / count()
+RUNNING : on tock / count()
+RUNNING --> IDLE : halt
+@enduml
+"""
+
+def check_parallel_transitions():
+    sys.path.insert(0, os.path.abspath('..'))
+    p = translate_chart('Parallel', PARALLEL_TRANSITIONS)[0]
+    graph = p.master.graph
+    check(len(graph.transitions) == 7)
+    check(len(graph.transitions_between('IDLE', 'RUNNING')) == 2)
+    check(len(graph.transitions_between('RUNNING', 'RUNNING')) == 2)
+    check(len(graph.transitions_on('IDLE', 'begin')) == 2)
+    check([tr.destination for tr in graph.transitions_on('IDLE', 'begin')] == ['RUNNING', 'FAILED'])
+    p.current = p.master
+    names = [p.transition_function(tr) for tr in graph.transitions if tr.action != '']
+    check(len(names) == len(set(names)))
+    check('onTransitioning_RUNNING_RUNNING_tock' in names)
+    index = p.master.index
+    check(index.sources == ('[*]',) and index.sinks == ('FAILED',))
+    check(index.scc['IDLE'] == index.scc['RUNNING'] != index.scc['FAILED'])
+    check(list(index.noevents) == ['[*]'] and len(index.events['IDLE']['begin']) == 2)
+    check(index.guards['IDLE'] == ('ok()', '!ok()') and index.has_cycles())
+    # Unit tests cover all transitions (and pairs of transitions) with paths
+    # leaving their states once.
+    for pairs in [False, True]:
+        paths = p.master.graph_test_paths(pairs)
+        check(set(tr for path in paths for tr in path) == set(graph.transitions))
+        check(all(len(set(tr.origin for tr in path)) == len(path) for path in paths))
+    followed = set((a, b) for path in paths for a, b in zip(path, path[1:]))
+    check(all((a, b) in followed for a in graph.transitions_between('IDLE', 'RUNNING')
+              for b in index.out['RUNNING']))
+
+# The enumeration of cycles is bounded: a complete graph of 5 states has 84
+# elementary cycles (10 of 2 states).
+def check_cycles_budget():
+    import statecharts
+    sm = statecharts.StateMachine()
+    sm.initial_state = '[*]'
+    for i in range(-1, 5):
+        for j in range(5):
+            if i != j:
+                tr = statecharts.Transition()
+                tr.origin, tr.destination = 'S%d' % i if i >= 0 else '[*]', 'S%d' % j
+                sm.add_transition(tr)
+    sm.build_index()
+    component = sm.index.components[sm.index.scc['S0']]
+    check(len(list(sm.index.simple_cycles(component))) == 84)
+    check(len(list(sm.index.simple_cycles(component, 2))) == 10)
+    check(len(sm.graph_cycles()) == 84 and len(sm.graph_cycles(5)) == 5)
+    check(all(len(c) == 3 and c[0] == c[-1] for c in sm.graph_cycles(0, 2)))
+
+# All the loops of transitions without event are reported.
+def check_infinite_loops():
+    import statecharts
+    sm = statecharts.StateMachine()
+    for origin, destination, event in [('[*]', 'A', ''), ('A', 'B', ''), ('B', 'A', ''),
+                                       ('B', 'C', 'go'), ('C', 'C', ''), ('C', 'D', ''),
+                                       ('D', 'E', 'go'), ('E', 'D', '')]:
+        tr = statecharts.Transition()
+        tr.origin, tr.destination, tr.event.name = origin, destination, event
+        sm.add_transition(tr)
+    sm.build_index()
+    check(sorted(sm.index.infinite_loops) == [('A', 'B', 'A'), ('C', 'C')])
+    sm.verify_infinite_loops()
+    check(len(sm.warnings) == 2)
+
+# Unreachable states, events never reacted and states without path to the
+# final state are reported.
+def check_reachability():
+    import statecharts
+    sm = statecharts.StateMachine()
+    sm.initial_state, sm.final_state = '[*]', '*'
+    for origin, destination, event in [('[*]', 'A', ''), ('A', 'B', 'go'), ('B', '*', 'stop'),
+                                       ('A', 'C', 'trap'), ('C', 'C', 'loop'),
+                                       ('D', 'E', 'dead'), ('E', 'D', 'dead')]:
+        tr = statecharts.Transition()
+        tr.origin, tr.destination, tr.event.name = origin, destination, event
+        sm.add_transition(tr)
+        sm.lookup_events[tr.event].append(tr)
+    sm.build_index()
+    check(list(sm.index.reachable('[*]')) == ['[*]', 'A', 'B', 'C', '*'])
+    sm.verify_reachability()
+    check(len(sm.warnings) == 4)
+    check(all(s in sm.warnings[0] for s in ['D', 'not reachable']))
+    check(all(s in sm.warnings[1] for s in ['E', 'not reachable']))
+    check(all(s in sm.warnings[2] for s in ['dead', 'never reacted']))
+    check(all(s in sm.warnings[3] for s in ['C', 'no path to the final state']))
+
+def check_guards():
+    import statecharts
+    check(statecharts.solve_guards(['quarters == 1', 'quarters > 1']) == ([], False))
+    check(statecharts.solve_guards(['x < 2.5', 'x >= 2.5', 'x > 3']) == ([(1, 2)], True))
+    check(statecharts.solve_guards(['c == Color::Red', '!(c == Color::Red) && on', 'c != Color::Red && !on']) == ([], True))
+    check(statecharts.solve_guards(['a || b', 'a && !b']) == ([(0, 1)], False))
+    check(statecharts.solve_guards(['guard1()', 'guard2()']) == None)
+    check(statecharts.solve_guards(['x + 1 > 0', 'x < 0']) == None)
+    # Without a known integer type, a variable may be between two constants
+    check(statecharts.solve_guards(['speed < 1', 'speed > 0']) == ([(0, 1)], True))
+    check(statecharts.solve_guards(['speed <= 0', 'speed >= 1']) == ([], False))
+    check(statecharts.solve_guards(['speed <= 0', 'speed >= 1'], ['speed']) == ([], True))
+    sm = statecharts.StateMachine()
+    sm.extra_code.variables = [('int', 'quarters', 0, 3, 0), ('bool', 'on', 0, 1, 1)]
+    sm.extra_code.code = '    int m_speed = 0;\n    double m_ratio;\n    uint8_t count{0};\n'
+    check(sm.integer_variables() == ['quarters', 'm_speed', 'count'])
+
+def check_guard_cache():
+    import statecharts
+    with tempfile.TemporaryDirectory() as folder:
+        cache = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = folder
+        results = statecharts.guard_results
+        try:
+            path = os.path.join(folder, 'statecharts', 'guards.json')
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                json.dump({ 'translator': 'old', 'guards': { 'stale': None } }, f)
+            statecharts.guard_results = None
+            statecharts.solve_guards(['a', '!a'])
+            statecharts.save_guard_results()
+            with open(path) as f:
+                stored = json.load(f)
+            # The results of another translator are dropped
+            check(stored['translator'] == statecharts.translator_digest)
+            check(list(stored['guards'].values()) == [[[], True]])
+        finally:
+            statecharts.guard_results = results
+            if cache == None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = cache
+
+def check_model_checker():
+    import statecharts
+    p = statecharts.Parser()
+    for declaration in ['int quarters 0..3', 'bool on = true']:
+        p.parse_variable(declaration)
+    check(p.current.extra_code.variables == [('int', 'quarters', 0, 3, 0), ('bool', 'on', 0, 1, 1)])
+    sm = p.current
+    sm.name, sm.initial_state = 'Checked', '[*]'
+    for origin, destination, event, guard, action in [
+            ('[*]', 'A', '', '', 'quarters = 0'), ('A', 'B', 'get', 'quarters < 3', 'quarters++'),
+            ('B', 'A', '', 'quarters < 3', ''), ('A', 'C', 'go', 'quarters == 2', ''),
+            ('C', 'C', '', 'on', 'on = !on'), ('C', 'CANNOT_HAPPEN', 'fail', 'quarters == 2', ''),
+            ('A', 'D', 'loop', '', ''), ('D', 'E', '', '', ''), ('E', 'D', '', 'quarters != 0', ''),
+            ('A', 'A', 'add', '', 'quarters += 5'), ('A', 'A', 'div', '', 'quarters = 1 / (quarters - 1)')]:
+        tr = statecharts.Transition()
+        tr.origin, tr.destination, tr.event.name, tr.guard, tr.action = origin, destination, event, guard, action
+        sm.add_transition(tr)
+    sm.build_index()
+    sm.verify_model()
+    found = lambda *texts: any(all(t in w for t in texts) for w in sm.warnings)
+    check(len(sm.warnings) == 7)
+    check(found('stuck in the state B when quarters = 3'))
+    check(found('stuck in the state E when quarters = 0'))
+    check(found('C to CANNOT_HAPPEN on event fail can happen when quarters = 2'))
+    check(found('infinite loop: D E D when quarters = 1'))
+    check(found('quarters leaves its range 0..3', 'on event add'))
+    check(found('quarters leaves its range 0..3', 'on event div when quarters = 0'))
+    check(found('Division by zero', 'on event div when quarters = 1'))
+
+def check_minimization():
+    import statecharts
+    sm = statecharts.StateMachine()
+    sm.initial_state, sm.final_state = '[*]', '*'
+    for origin, destination, event, guard, action in [
+            ('[*]', 'A', '', '', ''), ('A', 'B', 'b', '', ''), ('A', 'C', 'c', '', ''),
+            ('B', 'A', 'back', '', 'x++'), ('C', 'A', 'back', '', 'x++'),
+            ('A', 'F', 'f', '', ''), ('F', 'G', 'go', '', ''), ('G', 'F', 'go', '', ''),
+            ('A', 'H', 'h', '', ''), ('A', 'I', 'i', '', ''), ('H', 'A', 'back', 'g1', ''),
+            ('I', 'A', 'back', 'g2', ''), ('A', 'J0', 'j', '', ''), ('J0', 'J1', 'e', '', ''),
+            ('J1', 'J2', 'e', '', ''), ('J2', '*', 'e', '', '')]:
+        tr = statecharts.Transition()
+        tr.origin, tr.destination, tr.event.name, tr.guard, tr.action = origin, destination, event, guard, action
+        sm.add_transition(tr)
+        sm.lookup_events[tr.event].append(tr)
+    for state in ['F', 'G']:
+        sm.graph.state(state).entering = 'led();\n'
+    sm.build_index()
+    check(sm.minimize() == [['B', 'C']])
+    check(not sm.graph.has_state('C') and len(sm.index.transitions) == 15)
+    check([tr.destination for tr in sm.graph.transitions_on('A', 'c')] == ['B'])
+    check(all(tr.origin != 'C' for arcs in sm.lookup_events.values() for tr in arcs))
+    check(sm.minimize() == [])
+
+# Composite states compiled into a single state machine: transitions of the
+# composite state leave its substates (unless a substate reacts to the event
+# without guard) and call the leaving code of the composite states they leave.
+COMPOSITE_STATES = """@startuml
+[*] --> IDLE
+IDLE --> ACTIVE : go
+state ACTIVE {
+  [*] --> LOW
+  LOW --> HIGH : up
+  HIGH --> LOW : down
+  HIGH --> [*] : done
+  HIGH : on quit / keep()
+}
+ACTIVE --> IDLE : quit / halt()
+ACTIVE --> IDLE : [ ready() ]
+ACTIVE : exit / off()
+@enduml
+"""
+
+def check_flattening():
+    import statecharts
+    p, files = translate_chart('Composite', COMPOSITE_STATES, statecharts.Options(flatten=True))
+    check(sorted(files) == ['Composite-interpreted.plantuml', 'Composite.hpp', 'Composite.plantuml',
+                            'CompositeTests.cpp', 'statecharts.ebnf'])
+    sm = p.master
+    check(list(p.machines) == ['Composite'] and sm.children == [] and sm.broadcasts == [])
+    check(sm.graph.names == ['[*]', 'IDLE', 'ACTIVE', 'LOW', 'HIGH', 'ACTIVE_FINAL'])
+    check([tr.destination for tr in sm.graph.transitions_on('ACTIVE', '')] == ['LOW'])
+    reactions = [(tr.origin, tr.destination, tr.action) for event, arcs in sm.lookup_events.items()
+            if event.name == 'quit' for tr in arcs]
+    check(reactions == [('HIGH', 'HIGH', 'keep()'), ('LOW', 'IDLE', 'off(); halt()'),
+                        ('ACTIVE_FINAL', 'IDLE', 'off(); halt()')])
+    check([(tr.destination, tr.guard, tr.action) for tr in sm.graph.transitions_on('ACTIVE_FINAL', '')] ==
+          [('IDLE', 'ready()', 'off()')])
+    check(sm.graph.state('ACTIVE').leaving == '' and sm.graph.state('HIGH').name == 'HIGH')
+
+# Orthogonal regions: a product state machine whose transitions combine the
+# regions reacting to an event, or state machines receiving events in sequence.
+ORTHOGONAL_REGIONS = """@startuml
+[*] --> OFF
+OFF --> ACTIVE : plug
+state ACTIVE {
+  [*] --> LOWER
+  LOWER --> UPPER : caps
+  UPPER --> LOWER : caps
+  UPPER : entry / led()
+--
+  [*] --> DIGITS
+  DIGITS --> ARROWS : num [ ready() ]
+  ARROWS --> DIGITS : num
+}
+ACTIVE --> OFF : unplug
+@enduml
+"""
+
+def check_orthogonal_regions():
+    import statecharts
+    parsers = dict()
+    for regions in ['auto', 'parallel']:
+        options = statecharts.Options(regions=regions)
+        parsers[regions] = translate_chart('Keyboard', ORTHOGONAL_REGIONS, options)[0]
+    p = parsers['parallel']
+    check(list(p.machines) == ['Keyboard', 'ACTIVERegion1', 'ACTIVERegion2'])
+    check([(name, e.name) for name, e in p.master.broadcasts] ==
+          [('ACTIVERegion1', 'caps'), ('ACTIVERegion2', 'num')])
+    check(all(sm.composite == 'ACTIVE' for sm in p.master.children))
+    p = parsers['auto']
+    check(list(p.machines) == ['Keyboard', 'ACTIVE'])
+    sm = p.machines['ACTIVE']
+    check(sm.graph.names == ['[*]', 'LOWER_DIGITS', 'UPPER_DIGITS', 'LOWER_ARROWS', 'UPPER_ARROWS'])
+    check([(tr.destination, tr.guard, tr.action) for tr in sm.graph.transitions_on('LOWER_DIGITS', 'caps')] ==
+          [('UPPER_DIGITS', '', 'led()')])
+    check([(tr.destination, tr.guard) for tr in sm.graph.transitions_on('UPPER_DIGITS', 'num')] ==
+          [('UPPER_ARROWS', 'ready()')])
+    check(len(sm.graph.transitions) == 9 and sm.graph.state('UPPER_DIGITS').entering == '')
+
+DISPATCH = """@startuml
+[*] --> A
+A --> B : next
+B --> C : next
+C --> D : next
+D --> A : next
+A --> C : jump [ far() ]
+A --> B : jump
+B --> A : back
+@enduml
+"""
+
+def check_dispatch():
+    import statecharts
+    code = dict()
+    for dispatch in ['auto', 'dense', 'map']:
+        options = statecharts.Options(dispatch=dispatch)
+        code[dispatch] = translate_chart('Dispatch', DISPATCH, options)[1]['Dispatch.hpp']
+    # next: 4 of 5 states (dense), back: 1 of 5 states, jump: guarded alternatives
+    check(code['auto'].count('static constexpr DenseTransitions s_transitions') == 1)
+    check(code['auto'].count('switch (state())') == 2)
+    check('transition(s_transitions, 2u);' in code['auto'])
+    check(code['auto'].count('{ }, // ') == 1)
+    # Guarded alternatives cannot be stored in a dense table
+    check(code['dense'].count('static constexpr DenseTransitions s_transitions') == 2)
+    check(code['dense'].count('switch (state())') == 1)
+    check(code['map'].count('static const Transitions s_transitions') == 3)
+    check('switch (state())' not in code['map'])
+
+NESTING = """@startuml
+'[header] struct Timer { void reset() {} };
+'[code] int x = 1;
+'[code] Timer m_timer;
+[*] --> A
+A --> B
+B --> C : [ x > 0 ]
+C --> B : [ x <= 0 ]
+C --> D : go / reset()
+D --> A : reset
+D : on tick / m_timer.reset()
+@enduml
+"""
+
+# Program raising the event reset from the action of the event go.
+NESTING_PROGRAM = """#define MOCKABLE
+#include "Nesting.hpp"
+
+int main()
+{
+    Nesting fsm;
+    fsm.enter();
+    fsm.go();
+    return (fsm.state() == NestingStates::C) ? 0 : 1;
+}
+"""
+
+def check_nesting_capacity():
+    import statecharts
+    include = os.path.abspath(os.path.join('..', '..', 'include'))
+    with chart_folder('Nesting', NESTING):
+        statecharts.Parser().translate('Nesting.plantuml', 'hpp', '')
+        code = open('Nesting.hpp').read()
+        # The reaction to go raises reset: it shall neither overflow the queue
+        # nor abort
+        if shutil.which('g++') != None:
+            with open('main.cpp', 'w') as f:
+                f.write(NESTING_PROGRAM)
+            subprocess.run(['g++', '--std=c++14', '-I.', '-I' + include, 'main.cpp', '-o', 'nesting'],
+                           check=True, capture_output=True)
+            check(subprocess.run(['./nesting'], capture_output=True).returncode == 0)
+    # The fired transition, the transition without event queued by the state
+    # entered and the event reset called by the action (not m_timer.reset())
+    check('public StateMachine<Nesting, NestingStates, 3u>' in code)
+
+def check_options():
+    import statecharts
+    args = statecharts.argparse.Namespace(**vars(statecharts.Options(dispatch='switch')), jobs=4)
+    check(vars(statecharts.Options.from_args(args)) == vars(statecharts.Options(dispatch='switch')))
+    try:
+        statecharts.Options(dispath='switch')
+        check(False)
+    except TypeError:
+        pass
+    with chart_folder('Dispatch', DISPATCH):
+        p = statecharts.Parser()
+        keys = set()
+        for options in [statecharts.Options(), statecharts.Options(dispatch='map'),
+                        statecharts.Options(max_cycles=10), statecharts.Options()]:
+            p.options = options
+            keys.add(p.translation_key('Dispatch.plantuml', 'hpp', ''))
+    # Each option is part of the key of the cache
+    check(len(keys) == 3)
+
+def check_embedded_profile():
+    import statecharts
+    files = translate_chart('Embedded', COMPOSITE_STATES, statecharts.Options(profile='embedded'))[1]
+    code, tests = files['Embedded.hpp'], files['EmbeddedTests.cpp']
+    failed = False
+    try:
+        translate_chart('Embedded', COMPOSITE_STATES, statecharts.Options(dispatch='map', profile='embedded'))
+    except SystemExit:
+        failed = True
+    # Tables of states in read-only memory, no std::multimap
+    check('static constexpr States s_states' in code and 'm_states[' not in code)
+    check('static const Transitions' not in code)
+    check('error "Generated for the embedded profile' in code)
+    check(tests.startswith('// This file') and '#define FSM_EMBEDDED' in tests)
+    check('void fsm_fault(const char* reason)' in tests)
+    check(failed)
 
 def main():
     f = open('../statecharts.ebnf')
-    parser = Lark(f.read())
+    parser = Lark(f.read(), parser='lalr')
     f = open('grammar.plantuml')
     ast = parser.parse(f.read())
     print("AST:", ast.pretty())
-    check(len(ast.children) == 1)
-    check_AST(ast.children[0])
+    check_AST(ast)
+    check_standalone_startup()
+    check_daemon_bad_requests()
+    check_parallel_transitions()
+    check_cycles_budget()
+    check_infinite_loops()
+    check_reachability()
+    check_guards()
+    check_guard_cache()
+    check_model_checker()
+    check_minimization()
+    check_flattening()
+    check_orthogonal_regions()
+    check_dispatch()
+    check_nesting_capacity()
+    check_options()
+    check_embedded_profile()
 
 if __name__ == '__main__':
     main()